@@ -0,0 +1,57 @@
+"""
+Configurazione di Gunicorn per l'API in produzione:
+
+    gunicorn -c gunicorn.conf.py src.api:app
+
+Il modello e i dati per le raccomandazioni vengono caricati una sola volta nel processo
+master, prima del fork: i worker li condividono in copy-on-write invece di caricarne
+ognuno una copia. Worker e thread si scelgono con `python -m src.load_benchmark`.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Processi worker e thread per worker
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count(), 4)))
+threads = int(os.environ.get('EVENTLY_THREADS', 4))
+worker_class = 'gthread'
+
+# L'app (e il modello) viene importata nel master e ereditata dai worker
+preload_app = True
+
+# Riciclo dei worker dopo un numero di richieste (con jitter per non riavviarli tutti insieme).
+# Il nuovo worker eredita il modello del master: in post_fork passa alla versione fissata da
+# un eventuale rollback, che quindi non si perde con il riciclo
+max_requests = int(os.environ.get('EVENTLY_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+
+# Alla terminazione (SIGTERM) le richieste in corso hanno graceful_timeout secondi per finire
+graceful_timeout = int(os.environ.get('EVENTLY_GRACEFUL_TIMEOUT', 30))
+timeout = 60
+keepalive = 5
+
+accesslog = os.environ.get('EVENTLY_ACCESS_LOG') or None
+errorlog = '-'
+
+
+def when_ready(server):
+    # Eseguito nel master dopo il caricamento dell'app e prima del fork dei worker
+    from src.api import load_model, load_recommender, load_topk_index, registry, topk_index_serves
+    load_model()
+    # Con l'indice top-K le raccomandazioni si leggono dal file mappato, condiviso tra i worker
+    if not topk_index_serves(load_topk_index(), registry.active):
+        load_recommender()
+    # Gli oggetti già creati non vengono più visitati dal garbage collector: i worker
+    # non toccano (e quindi non copiano) le pagine di memoria condivise
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from src.api import MODEL_WATCH_INTERVAL, registry
+    # Rollback o reload esplicito fatti dopo l'avvio del master (model-linear-regression/pinned_version.json)
+    registry.follow_pin()
+    # I thread non sopravvivono al fork: il controllo delle nuove versioni parte in ogni worker
+    if MODEL_WATCH_INTERVAL > 0:
+        registry.start_watcher(MODEL_WATCH_INTERVAL)
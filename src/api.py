@@ -1,37 +1,308 @@
 import os
-import pandas as pd
-from flask import Flask, request, jsonify
+import threading
+import time
+import numpy as np
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
-from src.models.predict_model import load_model_pickle, load_model_joblib
+from src.instrumentation import BATCH_BUCKETS, CONTENT_TYPE, MetricsRegistry, StageTimer
+from src.models.prediction_cache import PredictionCache
+from src.models.registry import MODEL_DIR, ModelRegistry, extract_linear_params
+from src.models.topk_index import INDEX_PATH, TopKIndex
 
-# === Variabile globale ===
-model = None
+# pandas, scikit-learn e il modulo delle raccomandazioni vengono importati solo dalle funzioni
+# che li usano: l'avvio del server e /health non ne pagano il costo (vedi src/startup_profile.py)
+
+# Feature attese dal modello, nell'ordine usato in addestramento
+REQUIRED_FEATURES = ['region_match', 'user_likes_for_category', 'event_popularity']
+
+DEFAULT_RECOMMENDATIONS = 10
+
+# Cache delle predizioni di /predict: numero massimo di voci (0 la disattiva) e scadenza in secondi
+CACHE_MAX_ENTRIES = int(os.environ.get('EVENTLY_CACHE_SIZE', 10000))
+CACHE_TTL = float(os.environ['EVENTLY_CACHE_TTL']) if os.environ.get('EVENTLY_CACHE_TTL') else None
+
+# Se attivo, ogni predizione veloce viene confrontata con quella via DataFrame
+VERIFY_FAST_PATH = os.environ.get('EVENTLY_VERIFY_FAST_PATH') == '1'
+
+# Directory dei modelli e intervallo in secondi per cercare nuove versioni (0 lo disattiva)
+MODEL_DIRECTORY = os.environ.get('EVENTLY_MODEL_DIR', str(MODEL_DIR))
+MODEL_WATCH_INTERVAL = float(os.environ.get('EVENTLY_MODEL_WATCH_INTERVAL', 0))
+
+# Indice dei top-K precalcolati (src/models/topk_index.py) e ogni quanti secondi controllare se è stato ricostruito
+TOPK_INDEX_PATH = os.environ.get('EVENTLY_TOPK_INDEX', str(INDEX_PATH))
+TOPK_CHECK_INTERVAL = 30.0
+
+# Origini ammesse da CORS (senza credenziali)
+CORS_ORIGINS = [
+    "https://evently-se-4-ai.vercel.app",
+    "http://localhost:3000"
+]
+
+# Riga usata per provare un modello appena caricato prima di attivarlo
+WARMUP_ROW = {'region_match': 1, 'user_likes_for_category': 1, 'event_popularity': 10}
+
+# Serializza il caricamento dei dati per le raccomandazioni (avvio in background e prima richiesta)
+_recommender_lock = threading.Lock()
+
+# === Variabili globali ===
+# Indice per le raccomandazioni (array per utente e per evento) e punteggi base degli eventi
+# come (modello, indice, punteggi) usati per calcolarli
+recommender = None
+recommender_base = None
+# Indice top-K mappato in memoria (None se assente) e istante dell'ultimo controllo del file
+topk_index = None
+_topk_checked = 0.0
+# Predizioni già calcolate, indicizzate per versione del modello e tupla di feature normalizzata
+prediction_cache = PredictionCache(CACHE_MAX_ENTRIES, CACHE_TTL)
+
+# Metriche esposte su /metrics
+metrics = MetricsRegistry()
+metrics.counter('evently_requests_total', "Richieste servite per route, metodo e codice di stato")
+metrics.counter('evently_request_errors_total', "Richieste terminate con codice di stato >= 400 per route")
+metrics.histogram('evently_request_duration_seconds', "Durata delle richieste per route")
+metrics.histogram('evently_stage_duration_seconds',
+                  "Durata delle fasi di una richiesta (parse, validate, predict, serialize, ...) per route")
+metrics.histogram('evently_dataframe_seconds',
+                  "Percorso generico via DataFrame: costruzione del DataFrame (build) e model.predict (predict)")
+metrics.histogram('evently_batch_size', "Righe per predizione batch (batch-predict) e per micro-batch ASGI",
+                  BATCH_BUCKETS)
 
 # Inizializza l'app Flask
 app = Flask(__name__)
 
 # CORS abilitato senza credenziali
-CORS(app, resources={r"/*": {"origins": [
-    "https://evently-se-4-ai.vercel.app",
-    "http://localhost:3000"
-]}})
+CORS(app, resources={r"/*": {"origins": CORS_ORIGINS}})
+
+# Prepara un modello appena letto da disco: estrae i coefficienti e lo prova con una predizione
+# sullo stesso percorso usato poi dalle richieste
+def prepare_model(model):
+    linear_params = extract_linear_params(model)
+    if linear_params is not None:
+        coef, intercept = linear_params
+        warmup = np.array([WARMUP_ROW[f] for f in REQUIRED_FEATURES], dtype=np.float64) @ coef + intercept
+    else:
+        import pandas as pd
+        warmup = model.predict(pd.DataFrame([WARMUP_ROW])[REQUIRED_FEATURES])
+    if not np.all(np.isfinite(warmup)):
+        raise ValueError(f"Predizione di prova non valida: {warmup}")
+    return linear_params
+
+def on_model_swap(loaded):
+    # Le voci del modello precedente non verrebbero più lette: libera la memoria
+    prediction_cache.clear()
+
+# Versioni del modello: `registry.active` è il modello attivo, con i coefficienti in `state`
+# (None se il modello non è lineare: in quel caso si usa il percorso via DataFrame)
+registry = ModelRegistry(MODEL_DIRECTORY, prepare=prepare_model, on_swap=on_model_swap)
+
+def _active_model_metric(value):
+    active = registry.active
+    return {(('version', active.version),): value(active)} if active is not None else {}
 
-# Carica il modello
-def load_model():
-    global model
+def _cache_events():
+    stats = prediction_cache.stats()
+    return {(('event', event),): stats[key] for event, key in
+            (('hit', 'hits'), ('miss', 'misses'), ('eviction', 'evictions'),
+             ('expiration', 'expirations'), ('invalidation', 'invalidations'))}
+
+metrics.collect('evently_model_info', "Modello attivo (1 per la versione in uso)", lambda: _active_model_metric(lambda a: 1))
+metrics.collect('evently_model_load_seconds', "Secondi impiegati a caricare e provare il modello attivo",
+                lambda: _active_model_metric(lambda a: a.load_seconds))
+metrics.collect('evently_model_loaded_timestamp_seconds', "Istante (Unix) di attivazione del modello attivo",
+                lambda: _active_model_metric(lambda a: a.loaded_at))
+metrics.collect('evently_prediction_cache_events_total', "Eventi della cache di /predict", _cache_events, kind='counter')
+metrics.collect('evently_prediction_cache_entries', "Voci nella cache di /predict",
+                lambda: {(): prediction_cache.stats()['entries']})
+
+def record_request(route, method, status, seconds):
+    """Registra durata ed esito di una richiesta (usata anche dal server ASGI)"""
+    metrics.observe('evently_request_duration_seconds', (('route', route),), seconds)
+    metrics.inc('evently_requests_total', (('route', route), ('method', method), ('status', str(status))))
+    if status >= 400:
+        metrics.inc('evently_request_errors_total', (('route', route),))
+
+# Carica il modello in modo sincrono (all'avvio del server)
+def load_model(version=None):
     try:
-        model = load_model_pickle()  # o load_model_joblib()
+        registry.load(version)
         print("Modello caricato con successo!")
     except Exception as e:
         print(f"Errore durante il caricamento del modello: {e}")
-        model = None
 
-# Carica il modello prima di ogni richiesta
+# Carica utenti ed eventi per /recommend (dati grezzi, gli stessi di make_dataset.py)
+def load_recommender():
+    global recommender
+    from src.data.features import EVENTS_PATH, USERS_PATH
+    from src.models.recommend import build_index
+    with _recommender_lock:
+        if recommender is not None:
+            return
+        try:
+            recommender = build_index(os.environ.get('EVENTLY_USERS_PATH', USERS_PATH),
+                                      os.environ.get('EVENTLY_EVENTS_PATH', EVENTS_PATH))
+            print(f"Indice raccomandazioni caricato: {len(recommender['user_positions'])} utenti, "
+                  f"{len(recommender['event_ids'])} eventi")
+        except Exception as e:
+            print(f"Errore durante il caricamento dei dati per le raccomandazioni: {e}")
+            recommender = None
+
+# Apre l'indice dei top-K precalcolati, se presente: le raccomandazioni non richiedono i dati grezzi
+def load_topk_index():
+    global topk_index, _topk_checked
+    _topk_checked = time.monotonic()
+    if not os.path.exists(TOPK_INDEX_PATH):
+        topk_index = None
+        return None
+    try:
+        topk_index = TopKIndex(TOPK_INDEX_PATH)
+        print(f"Indice top-{topk_index.k} aperto: {topk_index.n_users} utenti, modello {topk_index.model_version}")
+    except Exception as e:
+        print(f"Errore durante l'apertura dell'indice top-K: {e}")
+        topk_index = None
+    return topk_index
+
+# Indice top-K corrente: riaperto (al più ogni TOPK_CHECK_INTERVAL secondi) se il file è stato ricostruito
+def get_topk_index():
+    index = topk_index
+    if time.monotonic() - _topk_checked < TOPK_CHECK_INTERVAL:
+        return index
+    try:
+        changed = index is None or os.stat(TOPK_INDEX_PATH).st_mtime_ns != index.mtime_ns
+    except OSError:
+        changed = index is not None
+    return load_topk_index() if changed else index
+
+# L'indice vale solo per il modello con cui è stato costruito
+def topk_index_serves(index, active):
+    return index is not None and active is not None and index.model_version == active.version
+
+# Parte di punteggio che dipende solo dagli eventi, calcolata una volta per versione del modello
+def get_recommender_base(index, active):
+    global recommender_base
+    if active.state is None:
+        return None
+    cached = recommender_base
+    if cached is not None and cached[0] is active and cached[1] is index:
+        return cached[2]
+    from src.models.recommend import event_base_scores
+    base = event_base_scores(index, active.state)
+    recommender_base = (active, index, base)
+    return base
+
+# Predizione via DataFrame: percorso generico e di verifica
+def predict_dataframe(rows, active):
+    import pandas as pd
+    start = time.perf_counter()
+    df = pd.DataFrame(rows)[REQUIRED_FEATURES]
+    built = time.perf_counter()
+    predictions = active.model.predict(df)
+    metrics.observe('evently_dataframe_seconds', (('step', 'build'),), built - start)
+    metrics.observe('evently_dataframe_seconds', (('step', 'predict'),), time.perf_counter() - built)
+    return predictions
+
+# Buffer per la riga di input, uno per thread: la predizione singola non alloca array
+_row_buffers = threading.local()
+
+# Predizione singola: prodotto scalare sul buffer preallocato (stesso ddot di sklearn)
+def predict_one(data, active):
+    params = active.state
+    if params is None:
+        return float(predict_dataframe([data], active)[0])
+    coef, intercept = params
+    row = getattr(_row_buffers, 'row', None)
+    if row is None:
+        row = _row_buffers.row = np.empty(len(REQUIRED_FEATURES), dtype=np.float64)
+    for i, feature in enumerate(REQUIRED_FEATURES):
+        row[i] = data[feature]
+    prediction = float(np.dot(row, coef) + intercept)
+    if VERIFY_FAST_PATH:
+        _verify(prediction, predict_dataframe([data], active)[0])
+    return prediction
+
+# Predizioni batch: un solo array preallocato e un prodotto matrice-vettore
+def predict_rows(rows, active):
+    params = active.state
+    if params is None:
+        return predict_dataframe(rows, active)
+    coef, intercept = params
+    X = np.empty((len(rows), len(REQUIRED_FEATURES)), dtype=np.float64)
+    for i, item in enumerate(rows):
+        X[i] = [item[f] for f in REQUIRED_FEATURES]
+    predictions = X @ coef + intercept
+    if VERIFY_FAST_PATH:
+        _verify(predictions, predict_dataframe(rows, active))
+    return predictions
+
+# Predizioni su una matrice già costruita (righe x REQUIRED_FEATURES)
+def predict_matrix(X, active):
+    params = active.state
+    if params is None:
+        import pandas as pd
+        return active.model.predict(pd.DataFrame(X, columns=REQUIRED_FEATURES))
+    coef, intercept = params
+    return X @ coef + intercept
+
+def _column_to_array(values):
+    """Converte una colonna in float64; i valori non numerici (anche liste annidate) diventano NaN"""
+    try:
+        array = np.asarray(values, dtype=np.float64)
+        if array.ndim == 1:
+            return array
+    except (TypeError, ValueError):
+        pass
+    # Percorso lento solo in presenza di valori non validi
+    def to_float(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return np.nan
+    return np.fromiter((to_float(v) for v in values), dtype=np.float64, count=len(values))
+
+def columns_to_matrix(columns):
+    """Costruisce la matrice delle feature dal formato colonnare e trova le righe non valide.
+
+    Ritorna (X, indici delle righe non valide): una riga è non valida se contiene valori
+    non numerici, mancanti o negativi, o se region_match non è 0/1.
+    """
+    n_rows = len(columns[REQUIRED_FEATURES[0]])
+    X = np.empty((n_rows, len(REQUIRED_FEATURES)), dtype=np.float64)
+    for j, feature in enumerate(REQUIRED_FEATURES):
+        X[:, j] = _column_to_array(columns[feature])
+    with np.errstate(invalid='ignore'):
+        invalid = ~np.isfinite(X).all(axis=1) | (X < 0).any(axis=1)
+        region = X[:, REQUIRED_FEATURES.index('region_match')]
+        invalid |= (region != 0) & (region != 1)
+    return X, np.flatnonzero(invalid)
+
+# Predizione singola passando dalla cache
+def predict_cached(data, active):
+    key = (active.version,) + tuple(float(data[f]) for f in REQUIRED_FEATURES)
+    return prediction_cache.get_or_compute(key, lambda: predict_one(data, active))
+
+def _verify(fast, reference):
+    if not np.allclose(fast, reference, rtol=1e-12, atol=1e-12):
+        print(f"ATTENZIONE: predizione veloce {fast} diversa da quella via DataFrame {reference}")
+
+# Se manca un modello avvia il caricamento in background: le richieste non attendono il disco
 @app.before_request
 def before_request():
-    global model
-    if model is None:
-        load_model()
+    g.request_start = time.perf_counter()
+    registry.ensure_loading()
+    # Rollback e reload fatti in un altro worker (controllo dell'mtime del pin, al più ogni secondo)
+    registry.check_pin()
+
+@app.after_request
+def after_request(response):
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        record_request(route, request.method, response.status_code, time.perf_counter() - start)
+    return response
+
+def model_unavailable():
+    if registry.loading:
+        return jsonify({"error": "Modello in caricamento, riprovare tra poco"}), 503
+    return jsonify({"error": f"Modello non disponibile: {registry.last_error}"}), 503
 
 # Root route per evitare errori GET /
 @app.route('/', methods=['GET'])
@@ -41,11 +312,46 @@ def index():
 # Health check
 @app.route('/health', methods=['GET'])
 def health_check():
-    global model
-    if model is not None:
-        return jsonify({"status": "ok", "message": "API funzionante e modello caricato"})
+    active = registry.active
+    cache_stats = prediction_cache.stats()
+    if active is not None:
+        index = topk_index
+        return jsonify({"status": "ok", "message": "API funzionante e modello caricato",
+                        "model_version": active.version, "cache": cache_stats,
+                        "topk_index": index.info() if index is not None else None})
     else:
-        return jsonify({"status": "error", "message": "Modello non caricato"}), 500
+        message = "Modello in caricamento" if registry.loading else "Modello non caricato"
+        return jsonify({"status": "error", "message": message, "cache": cache_stats}), 500
+
+# Metriche nel formato di Prometheus
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+# Versione attiva, versioni disponibili e stato del caricamento
+@app.route('/model', methods=['GET'])
+def model_status():
+    status = registry.status()
+    status["available"] = [entry["version"] for entry in registry.available_versions()]
+    return jsonify(status)
+
+# Carica in background una versione (la più recente se non indicata) e la attiva a caricamento finito.
+# Una versione indicata resta fissata per tutti i worker; senza versione si torna a seguire la più recente
+@app.route('/model/reload', methods=['POST'])
+def model_reload():
+    version = (request.get_json(silent=True) or {}).get('version')
+    if not registry.load_async(version, pin=True):
+        return jsonify({"error": "Caricamento già in corso"}), 409
+    return jsonify({"status": "loading", "version": version or "latest"}), 202
+
+# Torna alla versione precedente, ancora in memoria, e la fissa: gli altri worker la adottano con check_pin
+@app.route('/model/rollback', methods=['POST'])
+def model_rollback():
+    try:
+        loaded = registry.rollback()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify({"status": "ok", "active": loaded.info()})
 
 # Singola predizione
 @app.route('/predict', methods=['POST', 'OPTIONS'])
@@ -53,27 +359,28 @@ def predict():
     if request.method == 'OPTIONS':
         return '', 204  # Preflight OK
 
-    global model
-    if model is None:
-        try:
-            load_model()
-        except Exception as e:
-            return jsonify({"error": f"Impossibile caricare il modello: {str(e)}"}), 500
+    active = registry.active
+    if active is None:
+        return model_unavailable()
 
+    timer = StageTimer(metrics, '/predict')
     data = request.get_json()
-    required_features = ['region_match', 'user_likes_for_category', 'event_popularity']
+    timer.mark('parse')
 
-    if not all(feature in data for feature in required_features):
-        missing = [f for f in required_features if f not in data]
+    if not all(feature in data for feature in REQUIRED_FEATURES):
+        missing = [f for f in REQUIRED_FEATURES if f not in data]
         return jsonify({"error": f"Mancano le seguenti feature: {missing}"}), 400
+    timer.mark('validate')
 
     try:
-        input_data = pd.DataFrame([data])[required_features]
-        prediction = model.predict(input_data)[0]
-        return jsonify({
-            "prediction": float(prediction),
+        prediction = predict_cached(data, active)
+        timer.mark('predict')
+        response = jsonify({
+            "prediction": prediction,
             "input_data": data
         })
+        timer.mark('serialize')
+        return response
     except Exception as e:
         return jsonify({"error": f"Errore durante la predizione: {str(e)}"}), 500
 
@@ -83,27 +390,38 @@ def batch_predict():
     if request.method == 'OPTIONS':
         return '', 204  # Preflight OK
 
-    global model
-    if model is None:
-        try:
-            load_model()
-        except Exception as e:
-            return jsonify({"error": f"Impossibile caricare il modello: {str(e)}"}), 500
+    active = registry.active
+    if active is None:
+        return model_unavailable()
 
+    timer = StageTimer(metrics, '/batch-predict')
     data = request.get_json()
+    echo = request.args.get('echo')
+    timer.mark('parse')
+
+    # Formato colonnare: {"region_match": [...], "user_likes_for_category": [...], "event_popularity": [...]}
+    if isinstance(data, dict):
+        return _batch_predict_columnar(data, echo in ('1', 'true'), active, timer)
 
     if not isinstance(data, list):
-        return jsonify({"error": "I dati devono essere una lista di oggetti"}), 400
+        return jsonify({"error": "I dati devono essere una lista di oggetti o un oggetto di colonne"}), 400
 
-    required_features = ['region_match', 'user_likes_for_category', 'event_popularity']
     for item in data:
-        if not all(feature in item for feature in required_features):
-            missing = [f for f in required_features if f not in item]
+        if not all(feature in item for feature in REQUIRED_FEATURES):
+            missing = [f for f in REQUIRED_FEATURES if f not in item]
             return jsonify({"error": f"Mancano le seguenti feature nell'elemento {item}: {missing}"}), 400
+    timer.mark('validate')
+    metrics.observe('evently_batch_size', (('source', 'batch-predict'),), len(data))
 
     try:
-        input_data = pd.DataFrame(data)[required_features]
-        predictions = model.predict(input_data).tolist()
+        predictions = predict_rows(data, active).tolist()
+        timer.mark('predict')
+
+        # Per compatibilità il formato a lista restituisce anche l'input, salvo ?echo=0
+        if echo in ('0', 'false'):
+            response = jsonify([{"prediction": pred} for pred in predictions])
+            timer.mark('serialize')
+            return response
 
         results = [
             {
@@ -113,12 +431,118 @@ def batch_predict():
             for i, pred in enumerate(predictions)
         ]
 
-        return jsonify(results)
+        response = jsonify(results)
+        timer.mark('serialize')
+        return response
     except Exception as e:
         return jsonify({"error": f"Errore durante la predizione batch: {str(e)}"}), 500
 
+def _batch_predict_columnar(data, echo, active, timer):
+    missing = [f for f in REQUIRED_FEATURES if f not in data]
+    if missing:
+        return jsonify({"error": f"Mancano le seguenti feature: {missing}"}), 400
+    if not all(isinstance(data[f], list) for f in REQUIRED_FEATURES):
+        return jsonify({"error": "Ogni feature deve essere una lista di valori"}), 400
+    lengths = {f: len(data[f]) for f in REQUIRED_FEATURES}
+    if len(set(lengths.values())) != 1:
+        return jsonify({"error": f"Le colonne hanno lunghezze diverse: {lengths}"}), 400
+
+    X, invalid_rows = columns_to_matrix(data)
+    if len(invalid_rows):
+        return jsonify({
+            "error": "Valori non validi nelle righe indicate",
+            "invalid_rows": invalid_rows.tolist(),
+        }), 400
+    timer.mark('validate')
+    metrics.observe('evently_batch_size', (('source', 'batch-predict'),), len(X))
+
+    try:
+        result = {"predictions": predict_matrix(X, active).tolist()}
+        timer.mark('predict')
+        if echo:
+            result["input_data"] = {f: data[f] for f in REQUIRED_FEATURES}
+        response = jsonify(result)
+        timer.mark('serialize')
+        return response
+    except Exception as e:
+        return jsonify({"error": f"Errore durante la predizione batch: {str(e)}"}), 500
+
+# Top-K eventi per un utente
+@app.route('/recommend/<user_id>', methods=['GET'])
+def recommend(user_id):
+    active = registry.active
+    if active is None:
+        return model_unavailable()
+    try:
+        k = int(request.args.get('k', DEFAULT_RECOMMENDATIONS))
+    except ValueError:
+        return jsonify({"error": "Il parametro k deve essere un intero"}), 400
+    if k < 1:
+        return jsonify({"error": "Il parametro k deve essere positivo"}), 400
+
+    # Top-K precalcolati: una ricerca binaria e una lettura dalle pagine mappate
+    precomputed = get_topk_index()
+    if topk_index_serves(precomputed, active) and k <= precomputed.k:
+        return recommend_from_index(precomputed, user_id, k)
+
+    if recommender is None:
+        load_recommender()
+    index = recommender
+    if index is None:
+        return jsonify({"error": "Dati per le raccomandazioni non disponibili"}), 503
+
+    position = index['user_positions'].get(user_id)
+    if position is None:
+        return jsonify({"error": f"Utente non trovato: {user_id}"}), 404
+
+    from src.models.recommend import score_events, top_k
+    timer = StageTimer(metrics, '/recommend/<user_id>')
+    try:
+        scores = score_events(index, position, active.model, active.state, get_recommender_base(index, active))
+        timer.mark('score')
+        best = top_k(scores, k)
+        timer.mark('top_k')
+        response = jsonify({
+            "user_id": user_id,
+            "recommendations": [
+                {"event_id": event_id, "score": score}
+                for event_id, score in zip(index['event_ids'][best].tolist(), scores[best].tolist())
+            ]
+        })
+        timer.mark('serialize')
+        return response
+    except Exception as e:
+        return jsonify({"error": f"Errore durante la raccomandazione: {str(e)}"}), 500
+
+def recommend_from_index(index, user_id, k):
+    timer = StageTimer(metrics, '/recommend/<user_id>')
+    # Solo la forma canonica dell'id ("1005", non "01005" o "+1005"): come le chiavi di user_positions
+    try:
+        found = index.lookup(int(user_id), k) if str(int(user_id)) == user_id else None
+    except ValueError:
+        found = None
+    if found is None:
+        return jsonify({"error": f"Utente non trovato: {user_id}"}), 404
+    event_ids, scores = found
+    timer.mark('lookup')
+    response = jsonify({
+        "user_id": user_id,
+        "recommendations": [
+            {"event_id": event_id, "score": score}
+            for event_id, score in zip(event_ids.tolist(), scores.tolist())
+        ]
+    })
+    timer.mark('serialize')
+    return response
+
 # Avvio in produzione
 if __name__ == '__main__':
     load_model()
+    # Con un indice top-K valido per il modello attivo i dati grezzi non servono; altrimenti
+    # si caricano in background: /health risponde subito
+    if not topk_index_serves(load_topk_index(), registry.active):
+        threading.Thread(target=load_recommender, daemon=True).start()
+    if MODEL_WATCH_INTERVAL > 0:
+        registry.start_watcher(MODEL_WATCH_INTERVAL)
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port)
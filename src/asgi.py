@@ -0,0 +1,323 @@
+"""
+Modalità di servizio ASGI con micro-batching delle predizioni.
+
+Le richieste concorrenti a /predict che non trovano la predizione nella cache condivisa con
+l'app Flask vengono accodate e calcolate insieme con una sola predizione vettoriale, in un
+thread dell'executor (vedi src/models/micro_batcher.py); tutte le altre route sono servite
+dall'app Flask di src/api.py in un pool di thread, con lo stesso modello e la stessa
+configurazione.
+
+    uvicorn src.asgi:app --host 0.0.0.0 --port 5000
+    python -m src.asgi --benchmark --clients 1000
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from src.api import (CORS_ORIGINS, MODEL_WATCH_INTERVAL, REQUIRED_FEATURES, app as flask_app,
+                     load_model, load_recommender, metrics, prediction_cache, predict_matrix, record_request,
+                     registry)
+from src.instrumentation import StageTimer
+from src.models.micro_batcher import MicroBatcher
+
+# Dimensione massima di un batch e attesa massima (microsecondi) prima di calcolarlo
+BATCH_MAX_SIZE = int(os.environ.get('EVENTLY_BATCH_MAX_SIZE', 256))
+BATCH_MAX_WAIT_US = int(os.environ.get('EVENTLY_BATCH_MAX_WAIT_US', 2000))
+
+# Thread per le richieste inoltrate all'app Flask
+WSGI_THREADS = int(os.environ.get('EVENTLY_WSGI_THREADS', 8))
+
+
+def predict_batch(X):
+    """Predizioni per una matrice di righe con il modello attivo al momento del calcolo"""
+    active = registry.active
+    if active is None:
+        raise RuntimeError("Modello non disponibile")
+    metrics.observe('evently_batch_size', (('source', 'micro-batch'),), len(X))
+    return predict_matrix(X, active)
+
+
+batcher = MicroBatcher(predict_batch, BATCH_MAX_SIZE, BATCH_MAX_WAIT_US)
+_wsgi_executor = ThreadPoolExecutor(WSGI_THREADS, thread_name_prefix='wsgi')
+
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def _send_json(send, status, payload, headers=()):
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                    *headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+    return status
+
+
+def _cors_headers(scope):
+    # Stesse origini ammesse da flask_cors nell'app Flask
+    for name, value in scope['headers']:
+        if name == b'origin' and value.decode('latin-1') in CORS_ORIGINS:
+            return [(b'access-control-allow-origin', value), (b'vary', b'Origin')]
+    return []
+
+
+async def predict(scope, receive, send):
+    """POST /predict: stesse risposte dell'app Flask, ma calcolata nel batch corrente"""
+    start = time.perf_counter()
+    status = await _predict(scope, receive, send)
+    record_request('/predict', 'POST', status, time.perf_counter() - start)
+
+
+async def _predict(scope, receive, send):
+    headers = _cors_headers(scope)
+    registry.check_pin()
+    active = registry.active
+    if active is None:
+        registry.ensure_loading()
+        return await _send_json(send, 503, {"error": "Modello non disponibile, riprovare tra poco"}, headers)
+
+    timer = StageTimer(metrics, '/predict')
+    try:
+        data = json.loads(await _read_body(receive))
+    except ValueError:
+        return await _send_json(send, 400, {"error": "Corpo della richiesta non è un JSON valido"}, headers)
+    if not isinstance(data, dict):
+        return await _send_json(send, 400, {"error": "I dati devono essere un oggetto JSON"}, headers)
+    timer.mark('parse')
+
+    missing = [f for f in REQUIRED_FEATURES if f not in data]
+    if missing:
+        return await _send_json(send, 400, {"error": f"Mancano le seguenti feature: {missing}"}, headers)
+    timer.mark('validate')
+
+    try:
+        row = [float(data[f]) for f in REQUIRED_FEATURES]
+        # Stessa chiave di predict_cached nell'app Flask
+        key = (active.version,) + tuple(row)
+        found, prediction, generation = prediction_cache.lookup(key)
+        if not found:
+            # Comprende l'attesa nel micro-batch
+            prediction = await batcher.submit(row)
+            prediction_cache.store(key, prediction, generation)
+    except Exception as e:
+        return await _send_json(send, 500, {"error": f"Errore durante la predizione: {str(e)}"}, headers)
+    timer.mark('predict')
+    status = await _send_json(send, 200, {"prediction": prediction, "input_data": data}, headers)
+    timer.mark('serialize')
+    return status
+
+
+def _wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f'HTTP_{name}'
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _call_wsgi(environ):
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+
+    chunks = flask_app(environ, start_response)
+    try:
+        body = b''.join(chunks)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    return response['status'], response['headers'], body
+
+
+async def forward_to_flask(scope, receive, send):
+    """Serve la richiesta con l'app Flask in un thread, senza bloccare l'event loop"""
+    environ = _wsgi_environ(scope, await _read_body(receive))
+    status, headers, body = await asyncio.get_running_loop().run_in_executor(_wsgi_executor, _call_wsgi, environ)
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await asyncio.get_running_loop().run_in_executor(None, load_model)
+            # I dati per le raccomandazioni si caricano in background: /health risponde subito
+            threading.Thread(target=load_recommender, daemon=True).start()
+            if MODEL_WATCH_INTERVAL > 0:
+                registry.start_watcher(MODEL_WATCH_INTERVAL)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            pending = batcher.flush()
+            if pending is not None:
+                await asyncio.wait([pending])
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    if scope['path'] == '/predict' and scope['method'] == 'POST':
+        return await predict(scope, receive, send)
+    return await forward_to_flask(scope, receive, send)
+
+
+async def _request(path, body):
+    """Chiama l'app ASGI senza passare dalla rete e ritorna (status, corpo)"""
+    scope = {'type': 'http', 'method': 'POST', 'path': path, 'query_string': b'',
+             'headers': [(b'content-type', b'application/json')]}
+    sent = False
+    response = {}
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {'type': 'http.disconnect'}
+        sent = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        else:
+            response['body'] = message['body']
+
+    await app(scope, receive, send)
+    return response['status'], response['body']
+
+
+async def _run_clients(clients, requests_per_client):
+    rng = np.random.default_rng(0)
+    latencies = []
+
+    async def client():
+        for _ in range(requests_per_client):
+            body = json.dumps({
+                'region_match': int(rng.integers(0, 2)),
+                'user_likes_for_category': int(rng.integers(0, 10)),
+                'event_popularity': int(rng.integers(0, 500)),
+            }).encode()
+            start = time.perf_counter()
+            status, _ = await _request('/predict', body)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                raise RuntimeError(f"/predict ha risposto {status}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return time.perf_counter() - start, np.array(latencies)
+
+
+def _predict_batch_generic(X):
+    import pandas as pd
+    return registry.active.model.predict(pd.DataFrame(X, columns=REQUIRED_FEATURES))
+
+
+def benchmark(clients=1000, requests_per_client=20, max_batch_sizes=(1, BATCH_MAX_SIZE), max_wait_us=BATCH_MAX_WAIT_US):
+    """Throughput e latenze di /predict con client concorrenti, senza batching (1) e con batching.
+
+    Ogni configurazione è misurata sia con il percorso veloce dei modelli lineari sia con
+    model.predict su DataFrame (il percorso dei modelli non lineari). Le richieste passano
+    dall'app ASGI in-process: si misura il costo del servizio, non della rete. La cache delle
+    predizioni è disattivata, altrimenti si misurerebbero soprattutto i suoi hit.
+    """
+    if registry.active is None:
+        load_model()
+    results = []
+    cache_entries, prediction_cache.max_entries = prediction_cache.max_entries, 0
+    try:
+        for path, predict_fn in (('veloce', predict_batch), ('model.predict', _predict_batch_generic)):
+            for max_batch_size in max_batch_sizes:
+                results.append(_benchmark_config(path, predict_fn, clients, requests_per_client,
+                                                 max_batch_size, max_wait_us))
+    finally:
+        prediction_cache.max_entries = cache_entries
+        batcher.predict_batch = predict_batch
+    return results
+
+
+def _benchmark_config(path, predict_fn, clients, requests_per_client, max_batch_size, max_wait_us):
+    batcher.predict_batch = predict_fn
+    batcher.max_batch_size = max_batch_size
+    batcher.max_wait_us = max_wait_us
+    batcher.batches = batcher.rows = 0
+    elapsed, latencies = asyncio.run(_run_clients(clients, requests_per_client))
+    result = {
+        'path': path,
+        'max_batch_size': max_batch_size,
+        'requests_per_s': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+        'mean_batch_size': batcher.stats()['mean_batch_size'],
+    }
+    print(f"{path:<14} batch max {max_batch_size:>5}: {result['requests_per_s']:>10,.0f} richieste/s, "
+          f"p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms, "
+          f"batch medio {result['mean_batch_size']:.1f}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server ASGI con micro-batching di /predict")
+    parser.add_argument('--benchmark', action='store_true', help="Misura throughput e latenze invece di avviare il server")
+    parser.add_argument('--clients', type=int, default=1000, help="Client concorrenti nel benchmark")
+    parser.add_argument('--requests', type=int, default=20, help="Richieste per client nel benchmark")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.clients, args.requests)
+        return
+
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
+
+
+if __name__ == "__main__":
+    main()
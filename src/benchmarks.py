@@ -0,0 +1,314 @@
+"""
+Benchmark riproducibili dell'API e della pipeline dati.
+
+    python -m src.benchmarks                         # tutte le suite, confronto con la baseline
+    python -m src.benchmarks --suite api --quick
+    python -m src.benchmarks --save-baseline         # salva i risultati come nuova baseline
+
+Suite:
+- api: app Flask in-process (test client), /predict a varie concorrenze e /batch-predict
+  a varie dimensioni di batch, in formato a righe e colonnare;
+- server: le stesse richieste verso un server Gunicorn locale (src/load_benchmark.py);
+- data: preprocess_data e predict_and_save su dati sintetici di varie dimensioni.
+
+Ogni caso riporta latenze p50/p95/p99, richieste/s e righe/s; i casi della suite data
+girano in un processo nuovo e riportano anche il picco di memoria (RSS). I risultati sono
+salvati in JSON e confrontati con la baseline: il comando termina con codice 1 se un caso
+peggiora oltre la tolleranza. Dati e richieste sono generati con seed fissi.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+import numpy as np
+
+RESULTS_PATH = Path('reports') / 'benchmark_results.json'
+BASELINE_PATH = Path('reports') / 'benchmark_baseline.json'
+
+# Peggioramento relativo oltre il quale un caso è considerato una regressione
+DEFAULT_TOLERANCE = 0.25
+
+FEATURES = ['region_match', 'user_likes_for_category', 'event_popularity']
+
+# (concorrenza, richieste per client) per /predict e dimensioni dei batch per /batch-predict
+PREDICT_CONCURRENCY = [(1, 2000), (8, 500), (32, 200)]
+BATCH_SIZES = [10, 1000, 10000]
+# Dimensioni (utenti, eventi) dei dati sintetici per la suite data
+DATA_SIZES = [(200, 500), (1000, 1000), (2000, 2500)]
+QUICK_DATA_SIZES = [(200, 500), (1000, 1000)]
+
+SEED = 42
+
+
+def _summary(latencies, seconds, rows_per_request=1):
+    latencies = np.asarray(latencies)
+    return {
+        'requests': len(latencies),
+        'requests_per_s': len(latencies) / seconds,
+        'rows_per_s': len(latencies) * rows_per_request / seconds,
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p95_ms': float(np.percentile(latencies, 95) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+    }
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _random_rows(n, seed=SEED):
+    rng = np.random.default_rng(seed)
+    return [
+        {'region_match': int(r), 'user_likes_for_category': int(l), 'event_popularity': int(p)}
+        for r, l, p in zip(rng.integers(0, 2, n), rng.integers(0, 10, n), rng.integers(0, 500, n))
+    ]
+
+
+def _batch_body(rows, fmt):
+    if fmt == 'columns':
+        return {f: [row[f] for row in rows] for f in FEATURES}
+    return rows
+
+
+# === Suite api: app Flask in-process ===
+
+def _run_concurrent(clients, requests_per_client, call):
+    """Esegue call(client, i) da `clients` thread e ritorna latenze e durata totale"""
+    latencies = [[] for _ in range(clients)]
+
+    def worker(c):
+        for i in range(requests_per_client):
+            start = time.perf_counter()
+            call(c, i)
+            latencies[c].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker, args=(c,)) for c in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return [lat for part in latencies for lat in part], time.perf_counter() - start
+
+
+def bench_api(quick=False):
+    from src import api
+    api.load_model()
+    # Senza cache si misura il costo della predizione, non quello di una lettura in cache
+    api.prediction_cache.max_entries = 0
+    results = []
+
+    rows = _random_rows(2000)
+    for clients, n_requests in PREDICT_CONCURRENCY:
+        n_requests = n_requests // 4 if quick else n_requests
+        test_clients = [api.app.test_client() for _ in range(clients)]
+
+        def call(c, i):
+            response = test_clients[c].post('/predict', json=rows[(c * n_requests + i) % len(rows)])
+            assert response.status_code == 200, response.get_data(as_text=True)
+
+        _run_concurrent(clients, min(n_requests, 20), call)  # riscaldamento
+        latencies, seconds = _run_concurrent(clients, n_requests, call)
+        results.append({'name': f'api/predict/c{clients}', **_summary(latencies, seconds)})
+
+    for batch_size in BATCH_SIZES:
+        for fmt in ('rows', 'columns'):
+            body = _batch_body(_random_rows(batch_size), fmt)
+            client = api.app.test_client()
+            n_requests = max(5, min(200, 200_000 // batch_size) // (4 if quick else 1))
+
+            def call(c, i):
+                response = client.post('/batch-predict?echo=0', json=body)
+                assert response.status_code == 200, response.get_data(as_text=True)
+
+            _run_concurrent(1, 2, call)
+            latencies, seconds = _run_concurrent(1, n_requests, call)
+            results.append({'name': f'api/batch-predict/{fmt}/b{batch_size}',
+                            **_summary(latencies, seconds, batch_size)})
+    return results
+
+
+# === Suite server: server Gunicorn locale ===
+
+def bench_server(quick=False):
+    from src.load_benchmark import free_port, run_load, start_gunicorn, wait_healthy
+    seconds = 2.0 if quick else 5.0
+    port = free_port()
+    server = start_gunicorn(port, workers=os.cpu_count() or 1, threads=4)
+    results = []
+    try:
+        wait_healthy(port, server)
+        for clients, _ in PREDICT_CONCURRENCY:
+            body = json.dumps(_random_rows(1)[0]).encode()
+            result = run_load(port, clients, seconds, body=body)
+            results.append({'name': f'server/predict/c{clients}', 'rows_per_s': result['requests_per_s'], **result})
+        for batch_size in BATCH_SIZES:
+            body = json.dumps(_batch_body(_random_rows(batch_size), 'columns')).encode()
+            result = run_load(port, 4, seconds, path='/batch-predict', body=body)
+            results.append({'name': f'server/batch-predict/columns/b{batch_size}',
+                            'rows_per_s': result['requests_per_s'] * batch_size, **result})
+    finally:
+        server.terminate()
+        server.wait()
+    return results
+
+
+# === Suite data: pipeline su dati sintetici ===
+
+def _data_case(task):
+    """Eseguito in un processo nuovo: il picco di RSS riguarda solo questo caso"""
+    name, n_users, n_events, directory = task
+    from src.data.features import build_feature_arrays, compute_features, load_raw_data
+    from src.data.storage import write_table
+    from src.data.synthetic import EVENTS_FILE, USERS_FILE
+    users_path, events_path = Path(directory) / USERS_FILE, Path(directory) / EVENTS_FILE
+    dataset_path = Path(directory) / 'dataset.parquet'
+
+    start = time.perf_counter()
+    if name == 'preprocess_data':
+        # Stessi passi di make_dataset.preprocess_data, sui file sintetici
+        # Snapshot dei preferiti nella directory temporanea: si misura la conversione, non la cache
+        users_df, events_df, favorites = load_raw_data(users_path, events_path, Path(directory) / 'cache')
+        df = compute_features(build_feature_arrays(users_df, events_df, favorites))
+        rows = len(df)
+        seconds = time.perf_counter() - start
+        write_table(df, dataset_path)
+    else:
+        from src.models.predict_model import predict_and_save
+        df, _ = predict_and_save(dataset_path, Path(directory) / 'predictions.parquet')
+        rows = len(df)
+        seconds = time.perf_counter() - start
+    return {'name': f'data/{name}/{n_users}x{n_events}', 'rows': rows, 'seconds': seconds,
+            'rows_per_s': rows / seconds, 'peak_rss_mb': _peak_rss_mb()}
+
+
+def bench_data(quick=False):
+    from src.data.synthetic import generate
+    results = []
+    spawn = get_context('spawn')
+    for n_users, n_events in (QUICK_DATA_SIZES if quick else DATA_SIZES):
+        with tempfile.TemporaryDirectory() as directory:
+            generate(directory, n_users, n_events, seed=SEED)
+            for name in ('preprocess_data', 'predict_and_save'):
+                with ProcessPoolExecutor(1, mp_context=spawn) as executor:
+                    results.append(executor.submit(_data_case, (name, n_users, n_events, directory)).result())
+    return results
+
+
+SUITES = {'api': bench_api, 'server': bench_server, 'data': bench_data}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def run(suites, quick=False):
+    results = []
+    for suite in suites:
+        print(f"Suite {suite}...")
+        for result in SUITES[suite](quick):
+            print_result(result)
+            results.append(result)
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'quick': quick,
+        },
+        'results': results,
+    }
+
+
+def print_result(result):
+    parts = [f"{result['name']:<40}"]
+    if 'p50_ms' in result:
+        parts.append(f"p50 {result['p50_ms']:8.3f} ms  p95 {result['p95_ms']:8.3f} ms  p99 {result['p99_ms']:8.3f} ms")
+    parts.append(f"{result['rows_per_s']:>14,.0f} righe/s")
+    if 'peak_rss_mb' in result:
+        parts.append(f"RSS {result['peak_rss_mb']:7.1f} MB")
+    print('  '.join(parts))
+
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Confronta i casi presenti in entrambi i risultati e ritorna l'elenco delle regressioni.
+
+    Regressione: righe/s sotto baseline * (1 - tolerance), oppure p99 o picco di RSS
+    sopra baseline * (1 + tolerance).
+    """
+    previous = {r['name']: r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        base = previous.get(result['name'])
+        if base is None:
+            continue
+        checks = [('rows_per_s', -1), ('p99_ms', 1), ('peak_rss_mb', 1)]
+        for key, direction in checks:
+            if key not in result or key not in base or not base[key]:
+                continue
+            change = (result[key] - base[key]) / base[key]
+            if change * direction > tolerance:
+                regressions.append(f"{result['name']}: {key} {base[key]:.4g} -> {result[key]:.4g} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dell'API e della pipeline dati")
+    parser.add_argument('--suite', choices=list(SUITES) + ['all'], action='append',
+                        help="Suite da eseguire (ripetibile, default: all)")
+    parser.add_argument('--quick', action='store_true', help="Meno richieste e dati più piccoli")
+    parser.add_argument('--output', default=str(RESULTS_PATH), help="File JSON dei risultati")
+    parser.add_argument('--baseline', default=str(BASELINE_PATH), help="File JSON della baseline")
+    parser.add_argument('--save-baseline', action='store_true', help="Salva i risultati anche come baseline")
+    parser.add_argument('--require-baseline', action='store_true',
+                        help="Termina con errore se la baseline manca (per la CI)")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Peggioramento relativo tollerato rispetto alla baseline")
+    args = parser.parse_args()
+
+    suites = args.suite or ['all']
+    if 'all' in suites:
+        suites = list(SUITES)
+    current = run(suites, args.quick)
+
+    output = Path(args.output)
+    output.parent.mkdir(exist_ok=True, parents=True)
+    output.write_text(json.dumps(current, indent=2))
+    print(f"\nRisultati salvati in: {output}")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(current, indent=2))
+        print(f"Baseline salvata in: {baseline_path}")
+        return
+    if not baseline_path.exists():
+        print(f"Nessuna baseline da confrontare in {baseline_path} (usa --save-baseline per crearla)")
+        if args.require_baseline:
+            sys.exit(1)
+        return
+
+    regressions = compare(current, json.loads(baseline_path.read_text()), args.tolerance)
+    if regressions:
+        print(f"\nRegressioni rispetto a {baseline_path} (tolleranza {args.tolerance:.0%}):")
+        for line in regressions:
+            print(f"- {line}")
+        sys.exit(1)
+    print(f"\nNessuna regressione rispetto a {baseline_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,61 +1,341 @@
-import great_expectations as ge
-from great_expectations.core.batch import BatchRequest
-from great_expectations.checkpoint import SimpleCheckpoint
-from great_expectations.exceptions import DataContextError
-
 """
-**IMPORTANT**
-This file is meant to be run as an end-2-end test command.
-It is an example and might require changes to suit your data and use case.
+Validazione dei dati grezzi (utenti ed eventi) e del dataset user_event_similarity.
+
+    python -m src.data.data_validation                    # prime --sample righe di ogni file
+    python -m src.data.data_validation --full             # tutti i file, riga per riga
+    python -m src.data.data_validation --full --only raw
 
-Please refer to the `example-project` branch of the Cookiecutter-MLOps project for a complete working example –
-https://dagshub.com/DagsHub/Cookiecutter-MLOps/src/example-project
+I file sono letti a blocchi e ogni controllo è un'operazione vettoriale sul blocco:
+la memoria dipende da --chunk-size, tranne gli id (utenti, eventi) e gli hash delle coppie
+utente-evento (8 byte per riga) tenuti per i controlli sui duplicati.
+
+Ogni violazione ha una gravità: gli errori fanno terminare il comando con codice 1
+(e fermano la pipeline), gli avvisi vengono solo riportati. Il report con violazioni,
+esempi di righe e righe/s è salvato in REPORT_PATH.
 """
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from src.data.features import EVENTS_PATH, OUTPUT_COLUMNS, USERS_PATH
+from src.data.ingest import parse_favorites
+from src.data.storage import FORMATS, find_table, is_partitioned, iter_table
+
+DATASET_BASE_PATH = 'data/processed/user_event_similarity'
+REPORT_PATH = Path('reports') / 'data_validation.json'
+
+DEFAULT_CHUNK_SIZE = 200_000
+DEFAULT_SAMPLE_ROWS = 100_000
+# Esempi (numero di riga e valore) riportati per ogni violazione
+MAX_EXAMPLES = 5
+
+ERROR = 'error'
+WARNING = 'warning'
+
+EVENT_COLUMNS = ['id', 'regione', 'category', 'favoriteCount']
+USER_COLUMNS = ['id', 'regione', 'favoriteIds']
+INTEGER_COLUMNS = ['user_id', 'event_id', 'region_match', 'user_likes_for_category', 'event_popularity']
+
+# Score massimo: 0.5 (regione) + 0.3 (like) + 0.2 (popolarità, < 0.2)
+MAX_SCORE = 1.0
+# Differenza tollerata tra score e la sua formula (il dataset salva score in float32)
+SCORE_TOLERANCE = 1e-5
+
+
+class ValidationReport:
+    """Violazioni di un file: conteggio ed esempi per ogni (controllo, colonna)"""
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = str(path)
+        self.rows = 0
+        self.seconds = 0.0
+        self.violations = {}
+
+    def add(self, check, column, rows, values=None, severity=ERROR):
+        """Registra le righe (numeri di riga nel file, a partire da 1) che violano un controllo"""
+        rows = np.asarray(rows)
+        if len(rows) == 0:
+            return
+        violation = self.violations.setdefault((check, column), {
+            'check': check, 'column': column, 'severity': severity, 'count': 0, 'examples': []
+        })
+        violation['count'] += len(rows)
+        free = MAX_EXAMPLES - len(violation['examples'])
+        if free > 0:
+            values = [None] * free if values is None else list(np.asarray(values, dtype=object)[:free])
+            for row, value in zip(rows[:free].tolist(), values):
+                violation['examples'].append({'row': row, 'value': None if value is None else str(value)})
+
+    def add_count(self, check, column, count, severity=ERROR):
+        """Registra una violazione di cui si conosce solo il numero di righe"""
+        if count:
+            violation = self.violations.setdefault((check, column), {
+                'check': check, 'column': column, 'severity': severity, 'count': 0, 'examples': []
+            })
+            violation['count'] += int(count)
 
-context = ge.data_context.DataContext()
-
-batch_request = {
-    "datasource_name": "{{fill in datasource name}}",
-    "data_connector_name": "default_inferred_data_connector_name",
-    "data_asset_name": "{{fill in names of files that have tests}}",  # Define the data files that should be tested
-    "limit": 1000,
-}
-
-# Feel free to change the name of your suite here. Renaming this will not remove the other one.
-expectation_suite_name = "{{fill in your test suite name}}"
-try:
-    suite = context.get_expectation_suite(expectation_suite_name=expectation_suite_name)
-    print(
-        f'Loaded ExpectationSuite "{suite.expectation_suite_name}" containing {len(suite.expectations)} expectations'
-    )
-except DataContextError:
-    suite = context.create_expectation_suite(
-        expectation_suite_name=expectation_suite_name
-    )
-    print(f'Created ExpectationSuite "{suite.expectation_suite_name}".')
-
-validator = context.get_validator(
-    batch_request=BatchRequest(**batch_request),
-    expectation_suite_name=expectation_suite_name,
-)
-
-checkpoint_config = {
-    "class_name": "SimpleCheckpoint",
-    "validations": [
-        {
-            "batch_request": batch_request,
-            "expectation_suite_name": expectation_suite_name,
+    @property
+    def errors(self):
+        return sum(v['count'] for v in self.violations.values() if v['severity'] == ERROR)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'path': self.path,
+            'rows': self.rows,
+            'seconds': self.seconds,
+            'rows_per_s': self.rows / self.seconds if self.seconds else None,
+            'valid': self.errors == 0,
+            'violations': list(self.violations.values()),
         }
-    ],
-}
-checkpoint = SimpleCheckpoint(
-    f"{validator.active_batch_definition.data_asset_name}_{expectation_suite_name}",
-    context,
-    **checkpoint_config,
-)
-checkpoint_result = checkpoint.run()
-
-context.build_data_docs()
-
-validation_result_identifier = checkpoint_result.list_validation_result_identifiers()[0]
-context.open_data_docs(resource_identifier=validation_result_identifier)
+
+
+def iter_chunks(path, chunk_size, limit=None, columns=None):
+    """Blocchi del file con il numero di riga (da 1) della prima riga; al più limit righe"""
+    first_row = 1
+    for chunk in iter_table(path, chunk_size, columns=columns):
+        if limit is not None:
+            chunk = chunk.iloc[:max(limit - first_row + 1, 0)]
+            if chunk.empty:
+                return
+        yield first_row, chunk.reset_index(drop=True)
+        first_row += len(chunk)
+
+
+def check_columns(report, chunk, expected):
+    missing = [c for c in expected if c not in chunk.columns]
+    for column in missing:
+        report.add_count('colonna mancante', column, 1)
+    return not missing
+
+
+def check_integer(report, column, values, row_numbers, severity=ERROR):
+    """Valori non nulli e interi; ritorna i valori come float64 (NaN dove non validi)"""
+    numeric = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64)
+    null = values.isna().to_numpy()
+    report.add('nullo', column, row_numbers[null], severity=severity)
+    invalid = ~null & (np.isnan(numeric) | (numeric != np.floor(numeric)))
+    report.add('non intero', column, row_numbers[invalid], values.to_numpy()[invalid], severity)
+    numeric[invalid] = np.nan
+    return numeric
+
+
+def check_range(report, column, values, row_numbers, low=None, high=None, severity=ERROR):
+    with np.errstate(invalid='ignore'):
+        outside = np.zeros(len(values), dtype=bool)
+        if low is not None:
+            outside |= values < low
+        if high is not None:
+            outside |= values > high
+    report.add(f"fuori intervallo [{low}, {high}]", column, row_numbers[outside], values[outside], severity)
+
+
+def check_unique_ids(report, column, ids, row_numbers, severity=ERROR):
+    """Id duplicati (ids: array intero di tutto il file, già senza valori non validi)"""
+    order = np.argsort(ids, kind='stable')
+    repeated = np.zeros(len(ids), dtype=bool)
+    repeated[order[1:]] = ids[order[1:]] == ids[order[:-1]]
+    report.add('duplicato', column, row_numbers[repeated], ids[repeated], severity)
+
+
+def validate_events(path, chunk_size=DEFAULT_CHUNK_SIZE, limit=None):
+    """Valida il CSV degli eventi; ritorna il report e gli id evento validi"""
+    report = ValidationReport('events', path)
+    start = time.perf_counter()
+    ids, id_rows = [], []
+    for first_row, chunk in iter_chunks(path, chunk_size, limit):
+        if not check_columns(report, chunk, EVENT_COLUMNS):
+            break
+        row_numbers = np.arange(first_row, first_row + len(chunk))
+        event_ids = check_integer(report, 'id', chunk['id'], row_numbers)
+        known = ~np.isnan(event_ids)
+        ids.append(event_ids[known].astype(np.int64))
+        id_rows.append(row_numbers[known])
+        popularity = check_integer(report, 'favoriteCount', chunk['favoriteCount'], row_numbers)
+        check_range(report, 'favoriteCount', popularity, row_numbers, low=0)
+        # Regione e categoria mancanti sono gestite (non coincidono con nessun utente)
+        report.add('nullo', 'regione', row_numbers[chunk['regione'].isna().to_numpy()], severity=WARNING)
+        report.add('nullo', 'category', row_numbers[chunk['category'].isna().to_numpy()], severity=WARNING)
+        report.rows += len(chunk)
+
+    ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+    # A parità di id le feature usano l'ultima occorrenza: è un avviso, non un errore
+    check_unique_ids(report, 'id', ids, np.concatenate(id_rows) if id_rows else ids, WARNING)
+    report.seconds = time.perf_counter() - start
+    return report, np.unique(ids)
+
+
+def validate_users(path, event_ids=None, chunk_size=DEFAULT_CHUNK_SIZE, limit=None):
+    """Valida il CSV degli utenti; con event_ids (ordinati) segnala i preferiti che non esistono"""
+    report = ValidationReport('users', path)
+    start = time.perf_counter()
+    ids, id_rows = [], []
+    for first_row, chunk in iter_chunks(path, chunk_size, limit):
+        if not check_columns(report, chunk, USER_COLUMNS):
+            break
+        row_numbers = np.arange(first_row, first_row + len(chunk))
+        user_ids = check_integer(report, 'id', chunk['id'], row_numbers)
+        known = ~np.isnan(user_ids)
+        ids.append(user_ids[known].astype(np.int64))
+        id_rows.append(row_numbers[known])
+        report.add('nullo', 'regione', row_numbers[chunk['regione'].isna().to_numpy()], severity=WARNING)
+
+        parsed = parse_favorites(chunk['favoriteIds'])
+        report.add('lista non valida', 'favoriteIds', row_numbers[parsed.malformed],
+                   chunk['favoriteIds'].to_numpy()[parsed.malformed])
+        favorites = parsed.event_ids
+        owners = row_numbers[parsed.owners()]
+        if event_ids is not None and len(favorites):
+            positions = np.minimum(np.searchsorted(event_ids, favorites), max(len(event_ids) - 1, 0))
+            dangling = event_ids[positions] != favorites if len(event_ids) else np.ones(len(favorites), dtype=bool)
+            report.add('evento inesistente', 'favoriteIds', owners[dangling], favorites[dangling], WARNING)
+        # Lo stesso evento ripetuto nei preferiti di un utente conta più like
+        keys = pd.MultiIndex.from_arrays([owners, favorites]) if len(favorites) else None
+        if keys is not None:
+            repeated = keys.duplicated()
+            report.add('preferito ripetuto', 'favoriteIds', owners[repeated], favorites[repeated], WARNING)
+        report.rows += len(chunk)
+
+    ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+    check_unique_ids(report, 'id', ids, np.concatenate(id_rows) if id_rows else ids)
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def _dataset_files(path):
+    # Dataset partizionato da make_dataset: iter_table lo ricompone nell'ordine del manifest
+    path = Path(path)
+    if is_partitioned(path):
+        return [path]
+    # Altrimenti una directory con un file per blocco
+    if path.is_dir():
+        return sorted(p for p in path.iterdir() if p.suffix in FORMATS.values())
+    return [path]
+
+
+def validate_processed(path, chunk_size=DEFAULT_CHUNK_SIZE, limit=None):
+    """Valida il dataset user_event_similarity: tipi, nulli, intervalli, score e coppie duplicate"""
+    report = ValidationReport('user_event_similarity', path)
+    start = time.perf_counter()
+    pair_hashes = []
+    first_row = 1
+    for file in _dataset_files(path):
+        remaining = None if limit is None else limit - report.rows
+        if remaining is not None and remaining <= 0:
+            break
+        for offset, chunk in iter_chunks(file, chunk_size, remaining):
+            if not check_columns(report, chunk, OUTPUT_COLUMNS):
+                break
+            row_numbers = np.arange(first_row + offset - 1, first_row + offset - 1 + len(chunk))
+            _check_processed_chunk(report, chunk, row_numbers)
+            hashes = pd.util.hash_pandas_object(chunk[['user_id', 'event_id']], index=False).to_numpy()
+            order = np.argsort(hashes, kind='stable')
+            hashes = hashes[order]
+            repeated = np.zeros(len(chunk), dtype=bool)
+            repeated[order[1:]] = hashes[1:] == hashes[:-1]
+            if repeated.any():
+                pairs = chunk.loc[repeated, ['user_id', 'event_id']].astype(str)
+                report.add('coppia duplicata', 'user_id, event_id', row_numbers[repeated],
+                           (pairs['user_id'] + ', ' + pairs['event_id']).to_numpy())
+            pair_hashes.append(hashes[np.concatenate([[True], hashes[1:] != hashes[:-1]])] if len(hashes) else hashes)
+            report.rows += len(chunk)
+        first_row = report.rows + 1
+
+    # Coppie ripetute in blocchi diversi: si conoscono solo gli hash, quindi solo il conteggio
+    if len(pair_hashes) > 1:
+        # Ogni blocco è già ordinato: l'ordinamento stabile (timsort) unisce le sequenze
+        all_hashes = np.sort(np.concatenate(pair_hashes), kind='stable')
+        report.add_count('coppia duplicata', 'user_id, event_id', np.count_nonzero(all_hashes[1:] == all_hashes[:-1]))
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def _check_processed_chunk(report, chunk, row_numbers):
+    for column in INTEGER_COLUMNS:
+        if not pd.api.types.is_integer_dtype(chunk[column]):
+            report.add('tipo', column, row_numbers[:1], [chunk[column].dtype])
+            check_integer(report, column, chunk[column], row_numbers)
+        elif chunk[column].isna().any():
+            report.add('nullo', column, row_numbers[chunk[column].isna().to_numpy()])
+
+    region_match = chunk['region_match'].to_numpy(dtype=np.float64, na_value=np.nan)
+    likes = chunk['user_likes_for_category'].to_numpy(dtype=np.float64, na_value=np.nan)
+    popularity = chunk['event_popularity'].to_numpy(dtype=np.float64, na_value=np.nan)
+    with np.errstate(invalid='ignore'):
+        not_binary = ~np.isnan(region_match) & (region_match != 0) & (region_match != 1)
+    report.add('non binario', 'region_match', row_numbers[not_binary], region_match[not_binary])
+    check_range(report, 'user_likes_for_category', likes, row_numbers, low=0)
+    check_range(report, 'event_popularity', popularity, row_numbers, low=0)
+
+    if not pd.api.types.is_float_dtype(chunk['score']):
+        report.add('tipo', 'score', row_numbers[:1], [chunk['score'].dtype])
+    score = pd.to_numeric(chunk['score'], errors='coerce').to_numpy(dtype=np.float64)
+    not_finite = ~np.isfinite(score)
+    report.add('nullo o non finito', 'score', row_numbers[not_finite], chunk['score'].to_numpy()[not_finite])
+    check_range(report, 'score', score, row_numbers, low=0.0, high=MAX_SCORE)
+
+    # Lo score deve coincidere con la formula delle feature (make_dataset.compute_tile)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        expected = 0.5 * region_match + 0.3 * (likes > 0) + 0.2 * (popularity / (1 + popularity))
+        mismatch = np.isfinite(score) & np.isfinite(expected) & (np.abs(score - expected) > SCORE_TOLERANCE)
+    report.add('score diverso dalla formula', 'score', row_numbers[mismatch], score[mismatch])
+
+
+def print_report(report):
+    rate = f"{report.rows / report.seconds:,.0f} righe/s" if report.seconds else ''
+    status = 'OK' if report.errors == 0 else 'ERRORI'
+    print(f"{report.name} ({report.path}): {report.rows} righe in {report.seconds:.2f}s, {rate} - {status}")
+    for v in report.violations.values():
+        examples = ', '.join(f"riga {e['row']}" + (f" ({e['value']})" if e['value'] is not None else '')
+                             for e in v['examples'])
+        print(f"  [{v['severity']}] {v['column']}: {v['check']} x{v['count']}" + (f" - {examples}" if examples else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Valida utenti ed eventi grezzi e il dataset user_event_similarity")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--sample', type=int, default=DEFAULT_SAMPLE_ROWS,
+                      help="Valida solo le prime N righe di ogni file (default: %(default)s)")
+    mode.add_argument('--full', action='store_true', help="Valida tutte le righe")
+    parser.add_argument('--only', choices=['raw', 'processed'], default=None, help="Valida solo questi dati")
+    parser.add_argument('--users', default=USERS_PATH, help="CSV degli utenti")
+    parser.add_argument('--events', default=EVENTS_PATH, help="CSV degli eventi")
+    parser.add_argument('--dataset', default=None,
+                        help="Dataset elaborato (default: data/processed/user_event_similarity.*)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Righe lette per blocco")
+    parser.add_argument('--report', default=str(REPORT_PATH), help="File JSON del report")
+    args = parser.parse_args()
+    limit = None if args.full else args.sample
+
+    reports = []
+    if args.only in (None, 'raw'):
+        events_report, event_ids = validate_events(args.events, args.chunk_size, limit)
+        # Con un campione parziale degli eventi un preferito può riferirsi a un evento non letto
+        complete = limit is None or events_report.rows < limit
+        reports += [events_report, validate_users(args.users, event_ids if complete else None,
+                                                  args.chunk_size, limit)]
+    if args.only in (None, 'processed'):
+        dataset = args.dataset or find_table(DATASET_BASE_PATH)
+        reports.append(validate_processed(dataset, args.chunk_size, limit))
+
+    for report in reports:
+        print_report(report)
+
+    report_path = Path(args.report)
+    report_path.parent.mkdir(exist_ok=True, parents=True)
+    report_path.write_text(json.dumps({
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'mode': 'full' if args.full else f'sample {args.sample}',
+        'datasets': [r.to_dict() for r in reports],
+    }, indent=2))
+    print(f"Report salvato in: {report_path}")
+    if any(r.errors for r in reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
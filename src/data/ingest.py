@@ -0,0 +1,171 @@
+"""
+Lettura veloce degli utenti grezzi: la colonna favoriteIds ("[12, 7, 40]") viene
+convertita in formato CSR, un array piatto di id evento più gli offset di ogni utente,
+con le funzioni vettoriali di pyarrow invece di ast.literal_eval riga per riga.
+
+Il risultato è salvato in CACHE_DIR (data/interim/favorites, accanto a data/raw) in una
+directory per file sorgente, con l'hash sha256 del contenuto nel nome: le esecuzioni successive
+sullo stesso file mappano in memoria gli array salvati e non leggono nemmeno la colonna
+favoriteIds dal CSV.
+
+Le righe con una lista non valida sono riportate con il numero di riga del CSV
+(intestazione = riga 1, nessun campo su più righe).
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = Path('data') / 'interim' / 'favorites'
+
+# Lista di interi tra parentesi quadre, come la scrive str(list)
+FAVORITES_PATTERN = r'^\s*\[\s*(?:-?\d+\s*(?:,\s*-?\d+\s*)*)?\]\s*$'
+# Numero di riga nel CSV della prima riga di dati
+FIRST_DATA_LINE = 2
+# Righe non valide elencate nei messaggi di errore
+MAX_REPORTED_LINES = 20
+
+HASH_BLOCK_SIZE = 1 << 20
+SNAPSHOT_FILES = ('offsets', 'event_ids', 'malformed')
+
+
+class FavoriteLists:
+    """Preferiti di tutti gli utenti in formato CSR: quelli dell'utente i sono event_ids[offsets[i]:offsets[i + 1]]"""
+
+    def __init__(self, offsets, event_ids, malformed=None):
+        self.offsets = offsets
+        self.event_ids = event_ids
+        # Posizioni (da 0) delle righe con una lista non valida, lette come liste vuote
+        self.malformed = np.empty(0, dtype=np.int64) if malformed is None else malformed
+
+    @classmethod
+    def from_lists(cls, lists):
+        """Da una sequenza di liste di id (es. la colonna favoriteIds già convertita)"""
+        counts = np.fromiter((len(items) for items in lists), dtype=np.int64, count=len(lists))
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        event_ids = np.fromiter((item for items in lists for item in items), dtype=np.int64, count=offsets[-1])
+        return cls(offsets, event_ids)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.event_ids[self.offsets[i]:self.offsets[i + 1]]
+
+    def counts(self):
+        return np.diff(self.offsets)
+
+    def owners(self):
+        """Posizione dell'utente di ogni elemento di event_ids"""
+        return np.repeat(np.arange(len(self)), self.counts())
+
+    def malformed_lines(self):
+        return self.malformed + FIRST_DATA_LINE
+
+
+def _split_favorites(text, valid):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    inner = pc.utf8_trim(text, ' []')
+    # Le liste vuote e le righe non valide diventano null: split le trasforma in liste di lunghezza 0
+    inner = pc.if_else(pc.and_(valid, pc.not_equal(inner, '')), inner, pa.scalar(None, pa.string()))
+    parts = pc.split_pattern(inner, ',')
+    return parts.offsets.to_numpy().astype(np.int64), pc.utf8_trim_whitespace(parts.flatten())
+
+
+def parse_favorites(values):
+    """Converte una colonna di stringhe "[1, 2, 3]" in FavoriteLists (righe non valide e nulle: liste vuote)"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    text = pa.array(np.asarray(values, dtype=object), type=pa.string(), from_pandas=True)
+    valid = pc.fill_null(pc.match_substring_regex(text, FAVORITES_PATTERN), False).to_numpy(zero_copy_only=False)
+    offsets, tokens = _split_favorites(text, valid)
+    try:
+        event_ids = pc.cast(tokens, pa.int64())
+    except pa.ArrowInvalid:
+        # Id fuori dal range di int64 (almeno 19 cifre): le righe che li contengono non sono valide
+        long = np.flatnonzero(pc.greater_equal(pc.utf8_length(tokens), 19).to_numpy(zero_copy_only=False))
+        info = np.iinfo(np.int64)
+        overflow = [i for i in long if not info.min <= int(tokens[int(i)].as_py()) <= info.max]
+        owners = np.repeat(np.arange(len(text)), np.diff(offsets))
+        valid[owners[overflow]] = False
+        offsets, tokens = _split_favorites(text, valid)
+        event_ids = pc.cast(tokens, pa.int64())
+    return FavoriteLists(offsets, event_ids.to_numpy(), np.flatnonzero(~valid))
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _snapshot_dir(cache_dir, users_path, digest):
+    # Nome del file, hash del suo percorso (file omonimi in directory diverse) e hash del contenuto
+    source = hashlib.sha256(str(Path(users_path).resolve()).encode()).hexdigest()[:8]
+    return Path(cache_dir) / f"{Path(users_path).stem}-{source}-{digest[:16]}"
+
+
+def load_snapshot(directory):
+    """Snapshot mappato in memoria, None se assente o incompleto"""
+    try:
+        arrays = {name: np.load(Path(directory) / f'{name}.npy', mmap_mode='r') for name in SNAPSHOT_FILES}
+    except (OSError, ValueError):
+        return None
+    return FavoriteLists(arrays['offsets'], arrays['event_ids'], np.asarray(arrays['malformed']))
+
+
+def save_snapshot(favorites, directory):
+    """Scrive lo snapshot in una directory temporanea e la rinomina: chi legge vede solo snapshot completi"""
+    directory = Path(directory)
+    tmp = None
+    try:
+        directory.parent.mkdir(parents=True, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=directory.parent, prefix='.tmp-')
+        for name in SNAPSHOT_FILES:
+            np.save(Path(tmp) / f'{name}.npy', np.asarray(getattr(favorites, name)))
+        os.replace(tmp, directory)
+    except OSError as e:
+        # La cache è facoltativa: directory non scrivibile, disco pieno o snapshot già salvato da un altro processo
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+        if not directory.is_dir():
+            print(f"Snapshot dei preferiti non salvato in {directory}: {e}")
+        return
+    # Gli snapshot di versioni precedenti dello stesso file non servono più
+    prefix = directory.name.rsplit('-', 1)[0] + '-'
+    for old in directory.parent.glob(prefix + '*'):
+        if old != directory and old.is_dir():
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def read_users(users_path, cache_dir=CACHE_DIR):
+    """Legge il CSV degli utenti (senza favoriteIds) e ritorna (users_df, FavoriteLists).
+
+    Con cache_dir=None lo snapshot non viene né letto né salvato.
+    """
+    snapshot_dir = _snapshot_dir(cache_dir, users_path, file_hash(users_path)) if cache_dir else None
+    favorites = load_snapshot(snapshot_dir) if snapshot_dir else None
+    if favorites is not None:
+        users_df = pd.read_csv(users_path, usecols=lambda column: column != 'favoriteIds')
+        if len(users_df) == len(favorites):
+            return users_df, favorites
+
+    users_df = pd.read_csv(users_path)
+    favorites = parse_favorites(users_df.pop('favoriteIds'))
+    if snapshot_dir:
+        save_snapshot(favorites, snapshot_dir)
+    return users_df, favorites
+
+
+def check_malformed(favorites, users_path):
+    """Errore con i numeri di riga se qualche lista di preferiti non è valida"""
+    if len(favorites.malformed):
+        lines = favorites.malformed_lines()[:MAX_REPORTED_LINES].tolist()
+        more = f" (e altre {len(favorites.malformed) - len(lines)})" if len(favorites.malformed) > len(lines) else ''
+        raise ValueError(f"favoriteIds non valido in {users_path} alle righe {lines}{more}")
@@ -1,72 +1,310 @@
+import argparse
+import json
 import mlflow
 import os
+import shutil
+import tempfile
+from multiprocessing import Pool
+import numpy as np
 import pandas as pd
-import ast
 from dotenv import load_dotenv
+from src.data.features import (EVENTS_PATH, OUTPUT_COLUMNS, USERS_PATH, build_feature_arrays, compute_features,
+                               compute_tile, load_raw_data)
+from src.data.storage import (DEFAULT_FORMAT, FORMATS, MANIFEST_NAME, TableWriter, detect_format, iter_partition_blocks,
+                              load_manifest, partition_name, read_table, remove_table, with_format, write_table)
 load_dotenv()
 
 mlflow.set_tracking_uri("https://dagshub.com/giuliodepascale/eventlyML.mlflow")
 os.environ["MLFLOW_TRACKING_USERNAME"] = os.getenv('USERNAME')
 os.environ["MLFLOW_TRACKING_PASSWORD"] = os.getenv('PASSWORD')
 
-def preprocess_data():
-    users_df = pd.read_csv('data/raw/final_synthetic_users_with_region.csv')
-    events_df = pd.read_csv('data/raw/final_synthetic_events.csv')
-    events_df = events_df.set_index('id')
-    try:
-        users_df['favoriteIds'] = users_df['favoriteIds'].apply(ast.literal_eval)
-    except Exception as e:
-        raise ValueError(f"Errore nella conversione delle stringhe in liste: {e}")
-
-    # Pre-calcola la categoria di ogni evento
-    event_category = events_df['category'].to_dict()
-
-    # Prepara lista per le righe del nuovo dataset
-    rows = []
-
-    for _, user in users_df.iterrows():
-        user_id = user['id']
-        user_region = user['regione']
-        user_favorites = user['favoriteIds']
-        # Conta i like dell'utente per categoria
-        liked_categories = {}
-        for fav_id in user_favorites:
-            if fav_id in event_category:
-                cat = event_category[fav_id]
-                liked_categories[cat] = liked_categories.get(cat, 0) + 1
-
-        for event_id, event in events_df.iterrows():
-            event_region = event['regione']
-            event_cat = event['category']
-            event_fav_count = event['favoriteCount']
-
-            # Feature 1: match regione (1 se coincide, 0 altrimenti)
-            region_match = int(user_region == event_region)
-            # Feature 2: numero di like dell'utente per la categoria dell'evento
-            user_likes_for_cat = liked_categories.get(event_cat, 0)
-            # Feature 3: popolarità evento
-            popularity = event_fav_count
-
-            # Score: puoi personalizzare la formula, qui una semplice somma pesata
-            score = 0.5 * region_match + 0.3 * (user_likes_for_cat > 0) + 0.2 * (popularity / (1 + popularity))
-
-            rows.append({
-                'user_id': user_id,
-                'event_id': event_id,
-                'region_match': region_match,
-                'user_likes_for_category': user_likes_for_cat,
-                'event_popularity': popularity,
-                'score': score
-            })
-
-    df = pd.DataFrame(rows)
+OUTPUT_BASE = 'data/processed/user_event_similarity'
+OUTPUT_PATH = with_format(OUTPUT_BASE, DEFAULT_FORMAT)
+PARTITIONS_DIR = OUTPUT_BASE
+
+# Numero di utenti per blocco nella scrittura in streaming
+DEFAULT_BLOCK_SIZE = 500
+# Numero di eventi per blocco nel dataset partizionato (modalità incrementale)
+DEFAULT_EVENT_BLOCK_SIZE = 500
+
+
+def iter_user_blocks(arrays, block_size=DEFAULT_BLOCK_SIZE):
+    """Genera il dataset utente-evento un blocco di utenti alla volta"""
+    if block_size < 1:
+        raise ValueError(f"La dimensione del blocco deve essere positiva: {block_size}")
+    n_users = len(arrays['user_ids'])
+    for start in range(0, n_users, block_size):
+        yield compute_features(arrays, start, min(start + block_size, n_users))
+
+
+def write_blocks(blocks, output_path):
+    """Scrive i blocchi in coda al file di output (formato dedotto dall'estensione)"""
+    with TableWriter(output_path) as writer:
+        for block in blocks:
+            writer.write(block)
+        if not writer.rows:
+            # Nessun blocco: scrive comunque l'intestazione come la versione in un colpo solo
+            writer.write(pd.DataFrame(columns=OUTPUT_COLUMNS))
+        return writer.rows
+
+
+# Array delle feature visti dal processo worker (memory-mapped, in sola lettura)
+_worker_arrays = None
+
+
+def _map_arrays(arrays, directory):
+    """Salva gli array numerici su disco per condividerli in sola lettura tramite memory-map"""
+    mapped = {}
+    private = {}
+    for name, array in arrays.items():
+        if array.dtype.hasobject:
+            # Gli id non numerici non si possono mappare: vengono passati una sola volta al worker
+            private[name] = array
+            continue
+        path = os.path.join(directory, f"{name}.npy")
+        np.save(path, array)
+        mapped[name] = path
+    return mapped, private
+
+
+def _init_worker(mapped, private):
+    global _worker_arrays
+    _worker_arrays = dict(private)
+    for name, path in mapped.items():
+        _worker_arrays[name] = np.load(path, mmap_mode='r')
+
+
+def _write_shard(task):
+    start, stop, path = task
+    block = compute_features(_worker_arrays, start, stop)
+    if detect_format(path) == 'csv':
+        block.to_csv(path, index=False, header=False, encoding='utf-8')
+    else:
+        write_table(block, path)
+    return path
+
+
+def write_parallel(arrays, output_path, block_size=DEFAULT_BLOCK_SIZE, workers=2):
+    """Scrive il dataset distribuendo i blocchi di utenti su un pool di processi"""
+    if block_size < 1:
+        raise ValueError(f"La dimensione del blocco deve essere positiva: {block_size}")
+    n_users = len(arrays['user_ids'])
+    n_events = len(arrays['event_ids'])
+    fmt = detect_format(output_path)
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    with tempfile.TemporaryDirectory(dir=output_dir) as tmp_dir:
+        mapped, private = _map_arrays(arrays, tmp_dir)
+        tasks = [
+            (start, min(start + block_size, n_users), with_format(os.path.join(tmp_dir, f"shard-{i:06d}"), fmt))
+            for i, start in enumerate(range(0, n_users, block_size))
+        ]
+        with Pool(workers, initializer=_init_worker, initargs=(mapped, private)) as pool:
+            # imap restituisce i blocchi nell'ordine degli utenti: stesso file della modalità seriale
+            shards = pool.imap(_write_shard, tasks)
+            if fmt == 'csv':
+                with open(output_path, 'wb') as out:
+                    out.write(pd.DataFrame(columns=OUTPUT_COLUMNS).to_csv(index=False).encode('utf-8'))
+                    for path in shards:
+                        with open(path, 'rb') as shard:
+                            shutil.copyfileobj(shard, out)
+                        os.remove(path)
+            else:
+                with TableWriter(output_path) as writer:
+                    for path in shards:
+                        writer.write(read_table(path))
+                        os.remove(path)
+    return n_users * n_events
+
+
+def _fingerprint_users(users_df, events_df, arrays):
+    """Hash di ciò da cui dipendono le righe di un utente: regione e like per categoria"""
+    _, categories = pd.factorize(events_df['category'], use_na_sentinel=False)
+    category_hash = pd.util.hash_pandas_object(pd.Series(categories), index=False).to_numpy()
+    # Somma dei like pesata con l'hash della categoria: non dipende dall'ordine delle categorie
+    likes_signature = arrays['user_category_likes'].astype(np.uint64) @ category_hash
+    fields = pd.DataFrame({'regione': users_df['regione'].to_numpy(), 'likes': likes_signature})
+    return pd.util.hash_pandas_object(fields, index=False).to_numpy()
+
+
+def _fingerprint_events(events_df):
+    """Hash delle colonne evento che entrano nelle feature"""
+    fields = events_df[['regione', 'category', 'favoriteCount']].reset_index(drop=True)
+    return pd.util.hash_pandas_object(fields, index=False).to_numpy()
+
+
+def _update_blocks(blocks, keys, hashes, block_size, next_id):
+    """Allinea i blocchi del manifest alle chiavi correnti.
+
+    Le chiavi esistenti restano nel proprio blocco, quelle nuove vengono accodate.
+    Ritorna i blocchi aggiornati, gli id dei blocchi da riscrivere e il prossimo id libero.
+    """
+    current = dict(zip(keys, hashes))
+    updated = []
+    dirty = set()
+    known = set()
+    for block in blocks:
+        known.update(block['keys'])
+        kept = [key for key in block['keys'] if key in current]
+        if not kept:
+            continue
+        kept_hashes = [current[key] for key in kept]
+        if len(kept) != len(block['keys']) or kept_hashes != block['hashes']:
+            dirty.add(block['id'])
+        updated.append({'id': block['id'], 'keys': kept, 'hashes': kept_hashes})
+
+    for key in keys:
+        if key in known:
+            continue
+        if not updated or len(updated[-1]['keys']) >= block_size:
+            updated.append({'id': next_id, 'keys': [], 'hashes': []})
+            next_id += 1
+        updated[-1]['keys'].append(key)
+        updated[-1]['hashes'].append(current[key])
+        dirty.add(updated[-1]['id'])
+    return updated, dirty, next_id
+
+
+def _save_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+def update_partitions(users_df, events_df, directory=PARTITIONS_DIR, user_block_size=DEFAULT_BLOCK_SIZE,
+                      event_block_size=DEFAULT_EVENT_BLOCK_SIZE, fmt=DEFAULT_FORMAT, favorites=None):
+    """Aggiorna sul posto il dataset partizionato in blocchi utenti x eventi.
+
+    Confronta i dati grezzi con il manifest dell'ultima esecuzione e riscrive solo
+    le partizioni che contengono utenti o eventi modificati, aggiunti o rimossi.
+    """
+    if users_df['id'].duplicated().any() or events_df.index.duplicated().any():
+        raise ValueError("La modalità incrementale richiede id utente ed evento univoci")
+
+    arrays = build_feature_arrays(users_df, events_df, favorites)
+    user_keys = arrays['user_ids'].tolist()
+    event_keys = arrays['event_ids'].tolist()
+    user_hashes = _fingerprint_users(users_df, events_df, arrays).tolist()
+    event_hashes = _fingerprint_events(events_df).tolist()
+
+    os.makedirs(directory, exist_ok=True)
+    manifest = load_manifest(directory)
+    settings = {'format': fmt, 'user_block_size': user_block_size, 'event_block_size': event_block_size}
+    if manifest is None or any(manifest.get(key) != value for key, value in settings.items()):
+        manifest = dict(settings, next_block_id=0, user_blocks=[], event_blocks=[])
+
+    next_id = manifest['next_block_id']
+    user_blocks, dirty_users, next_id = _update_blocks(
+        manifest['user_blocks'], user_keys, user_hashes, user_block_size, next_id)
+    event_blocks, dirty_events, next_id = _update_blocks(
+        manifest['event_blocks'], event_keys, event_hashes, event_block_size, next_id)
+
+    # Posizioni negli array correnti delle chiavi di ogni blocco
+    user_index = pd.Index(user_keys)
+    event_index = pd.Index(event_keys)
+    user_positions = {b['id']: user_index.get_indexer(b['keys']) for b in user_blocks}
+    event_positions = {b['id']: event_index.get_indexer(b['keys']) for b in event_blocks}
+
+    written = 0
+    tiles = set()
+    for user_block in user_blocks:
+        for event_block in event_blocks:
+            name = partition_name(user_block, event_block, fmt)
+            tiles.add(name)
+            path = os.path.join(directory, name)
+            if user_block['id'] in dirty_users or event_block['id'] in dirty_events or not os.path.exists(path):
+                tile = compute_tile(arrays, user_positions[user_block['id']], event_positions[event_block['id']])
+                tmp_path = with_format(os.path.join(directory, '_tmp'), fmt)
+                write_table(tile, tmp_path)
+                os.replace(tmp_path, path)
+                written += 1
+
+    # Rimuove le partizioni di blocchi che non esistono più
+    for name in os.listdir(directory):
+        if name.startswith('part-') and name not in tiles:
+            os.remove(os.path.join(directory, name))
+
+    _save_manifest(directory, dict(settings, next_block_id=next_id, user_blocks=user_blocks,
+                                   event_blocks=event_blocks))
+    # Il dataset in un solo file di un'esecuzione completa precedente non è più valido
+    remove_table(directory, keep=directory)
+    return {'partitions': len(tiles), 'rewritten': written}
+
+
+def read_partitions(directory=PARTITIONS_DIR, columns=None):
+    """Ricompone il dataset partizionato: utenti nell'ordine del manifest, per ciascuno tutti gli eventi"""
+    frames = list(iter_partition_blocks(directory, columns))
+    if not frames:
+        return pd.DataFrame(columns=columns or OUTPUT_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def preprocess_data(users_path=USERS_PATH, events_path=EVENTS_PATH):
+    users_df, events_df, favorites = load_raw_data(users_path, events_path)
+    arrays = build_feature_arrays(users_df, events_df, favorites)
+    df = compute_features(arrays)
     return df
 
+
+def preprocess_data_streaming(output_path=OUTPUT_PATH, block_size=DEFAULT_BLOCK_SIZE, workers=1,
+                              users_path=USERS_PATH, events_path=EVENTS_PATH):
+    """Crea il dataset utente-evento scrivendolo a blocchi: la memoria dipende da block_size"""
+    users_df, events_df, favorites = load_raw_data(users_path, events_path)
+    arrays = build_feature_arrays(users_df, events_df, favorites)
+    if workers > 1:
+        n_rows = write_parallel(arrays, output_path, block_size, workers)
+    else:
+        n_rows = write_blocks(iter_user_blocks(arrays, block_size), output_path)
+    # Copie in altri formati o partizionate di esecuzioni precedenti non sono più valide
+    remove_table(os.path.splitext(output_path)[0], keep=output_path)
+    return n_rows
+
+
+def preprocess_data_incremental(directory=PARTITIONS_DIR, block_size=DEFAULT_BLOCK_SIZE,
+                                event_block_size=DEFAULT_EVENT_BLOCK_SIZE, fmt=DEFAULT_FORMAT,
+                                users_path=USERS_PATH, events_path=EVENTS_PATH):
+    """Ricalcola solo le partizioni toccate dalle modifiche ai dati grezzi"""
+    users_df, events_df, favorites = load_raw_data(users_path, events_path)
+    return update_partitions(users_df, events_df, directory, block_size, event_block_size, fmt, favorites)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Crea il dataset utente-evento")
+    parser.add_argument('--format', choices=list(FORMATS), default=DEFAULT_FORMAT,
+                        help="Formato di output (csv solo per esportazione)")
+    parser.add_argument('--output', default=None,
+                        help=f"Percorso di output (default {OUTPUT_BASE} con l'estensione del formato)")
+    parser.add_argument('--block-size', type=int, default=DEFAULT_BLOCK_SIZE,
+                        help="Numero di utenti elaborati e scritti per blocco")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Numero di processi tra cui distribuire i blocchi di utenti")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Aggiorna sul posto solo le partizioni toccate dalle modifiche ai dati grezzi")
+    parser.add_argument('--partitions-dir', default=PARTITIONS_DIR,
+                        help="Directory del dataset partizionato per la modalità incrementale")
+    parser.add_argument('--event-block-size', type=int, default=DEFAULT_EVENT_BLOCK_SIZE,
+                        help="Numero di eventi per partizione in modalità incrementale")
+    parser.add_argument('--users', default=USERS_PATH,
+                        help="CSV degli utenti grezzi (es. generato da src.data.synthetic)")
+    parser.add_argument('--events', default=EVENTS_PATH, help="CSV degli eventi grezzi")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_args()
     mlflow.set_experiment("user-features-experiment")
     with mlflow.start_run():
-        df = preprocess_data()
-        output_path = 'data/processed/user_event_similarity.csv'
-        df.to_csv(output_path, index=False, encoding='utf-8')
-        mlflow.log_artifact(output_path)
-        print("Dataset utente-evento creato e tracciato su DagsHub tramite MLflow.")
\ No newline at end of file
+        mlflow.log_param("block_size", args.block_size)
+        if args.incremental:
+            stats = preprocess_data_incremental(args.partitions_dir, args.block_size, args.event_block_size,
+                                                args.format, args.users, args.events)
+            mlflow.log_metric("rewritten_partitions", stats['rewritten'])
+            print(f"Partizioni riscritte: {stats['rewritten']} su {stats['partitions']} in {args.partitions_dir}")
+        else:
+            output_path = args.output or with_format(OUTPUT_BASE, args.format)
+            n_rows = preprocess_data_streaming(output_path, args.block_size, args.workers, args.users, args.events)
+            mlflow.log_param("workers", args.workers)
+            mlflow.log_param("format", detect_format(output_path))
+            mlflow.log_artifact(output_path)
+            print(f"Dataset utente-evento creato ({n_rows} righe) e tracciato su DagsHub tramite MLflow.")
@@ -0,0 +1,269 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+# Formati supportati, con l'estensione usata per i file
+FORMATS = {
+    'parquet': '.parquet',
+    'feather': '.feather',
+    'csv': '.csv',
+}
+DEFAULT_FORMAT = 'parquet'
+
+# Dataset partizionato (make_dataset --incremental): directory con un file per blocco
+# utenti x eventi e il manifest che descrive i blocchi
+MANIFEST_NAME = '_manifest.json'
+
+# Tipi compatti per le colonne note del dataset utente-evento e delle predizioni
+COMPACT_DTYPES = {
+    'region_match': 'int8',
+    'user_likes_for_category': 'int16',
+    'event_popularity': 'int32',
+    'score': 'float32',
+    'predicted_score': 'float32',
+}
+
+
+def detect_format(path):
+    """Ricava il formato dall'estensione del file"""
+    suffix = os.path.splitext(str(path))[1].lower()
+    for fmt, ext in FORMATS.items():
+        if suffix == ext:
+            return fmt
+    raise ValueError(f"Formato non riconosciuto per {path}: estensioni supportate {list(FORMATS.values())}")
+
+
+def with_format(base_path, fmt=DEFAULT_FORMAT):
+    """Percorso con l'estensione del formato richiesto (base_path senza estensione)"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato non supportato: {fmt}")
+    return str(base_path) + FORMATS[fmt]
+
+
+def find_table(base_path):
+    """Dataset partizionato base_path/ o primo file esistente tra i formati supportati, in ordine di preferenza.
+
+    File e directory partizionata sono esclusivi (chi scrive l'uno rimuove l'altro con
+    remove_table): se esistono entrambi il dataset è ambiguo.
+    """
+    path = next((with_format(base_path, fmt) for fmt in FORMATS if os.path.exists(with_format(base_path, fmt))), None)
+    if is_partitioned(base_path):
+        if path is not None:
+            raise ValueError(f"Dataset ambiguo: esistono sia {path} sia la directory partizionata {base_path}")
+        return str(base_path)
+    if path is None:
+        raise FileNotFoundError(f"Nessun dataset trovato per {base_path} ({', '.join(FORMATS.values())} "
+                                f"o directory partizionata)")
+    return path
+
+
+def is_partitioned(path):
+    return os.path.isfile(os.path.join(str(path), MANIFEST_NAME))
+
+
+def remove_table(base_path, keep=None):
+    """Rimuove le altre copie del dataset base_path (file in ogni formato e directory partizionata) tranne keep"""
+    keep = os.path.abspath(keep) if keep is not None else None
+    for path in [with_format(base_path, fmt) for fmt in FORMATS]:
+        if os.path.abspath(path) != keep and os.path.isfile(path):
+            os.remove(path)
+    if os.path.abspath(str(base_path)) != keep and is_partitioned(base_path):
+        shutil.rmtree(str(base_path))
+
+
+def load_manifest(directory):
+    """Manifest del dataset partizionato, None se assente"""
+    path = os.path.join(str(directory), MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def partition_name(user_block, event_block, fmt):
+    return with_format(f"part-u{user_block['id']:05d}-e{event_block['id']:05d}", fmt)
+
+
+def iter_partition_blocks(directory, columns=None):
+    """Blocchi di utenti del dataset partizionato, nell'ordine del manifest: per ogni utente tutti gli eventi"""
+    manifest = load_manifest(directory)
+    if manifest is None:
+        raise FileNotFoundError(f"Manifest non trovato in {directory}")
+    n_events = sum(len(b['keys']) for b in manifest['event_blocks'])
+    for user_block in manifest['user_blocks']:
+        n_users = len(user_block['keys'])
+        tiles = []
+        order = []
+        offset = 0
+        for event_block in manifest['event_blocks']:
+            path = os.path.join(str(directory), partition_name(user_block, event_block, manifest['format']))
+            tiles.append(read_table(path, columns=columns))
+            width = len(event_block['keys'])
+            order.append((np.arange(n_users)[:, None] * n_events + offset + np.arange(width)[None, :]).ravel())
+            offset += width
+        if not tiles:
+            continue
+        block = pd.concat(tiles, ignore_index=True)
+        yield block.iloc[np.argsort(np.concatenate(order), kind='stable')].reset_index(drop=True)
+
+
+def compact_dtypes(df):
+    """Converte le colonne note nei tipi compatti, verificando che i valori ci stiano"""
+    converted = {}
+    for column, dtype in COMPACT_DTYPES.items():
+        if column not in df.columns or df[column].dtype == dtype:
+            continue
+        values = df[column]
+        if np.issubdtype(np.dtype(dtype), np.integer) and len(values):
+            low, high = values.min(), values.max()
+            if low < np.iinfo(dtype).min or high > np.iinfo(dtype).max:
+                raise ValueError(f"Valori di {column} fuori dal range di {dtype}: [{low}, {high}]")
+        converted[column] = values.astype(dtype)
+    return df.assign(**converted) if converted else df
+
+
+def read_table(path, columns=None):
+    """Legge un dataset in qualsiasi formato supportato, eventualmente solo alcune colonne"""
+    if is_partitioned(path):
+        blocks = list(iter_partition_blocks(path, columns))
+        return pd.concat(blocks, ignore_index=True) if blocks else pd.DataFrame(columns=columns)
+    fmt = detect_format(path)
+    if fmt == 'csv':
+        return pd.read_csv(path, usecols=columns)
+    if fmt == 'parquet':
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_feather(path, columns=columns)
+
+
+def iter_table(path, chunk_size, columns=None):
+    """Legge un dataset a blocchi di al più chunk_size righe, senza caricarlo tutto in memoria"""
+    if is_partitioned(path):
+        # In memoria un blocco di utenti alla volta (tutte le sue partizioni)
+        for block in iter_partition_blocks(path, columns):
+            for offset in range(0, len(block), chunk_size):
+                yield block.iloc[offset:offset + chunk_size].reset_index(drop=True)
+        return
+    fmt = detect_format(path)
+    if fmt == 'csv':
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunk_size)
+        return
+
+    import pyarrow as pa
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    with pa.memory_map(str(path)) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if columns is not None:
+                batch = batch.select(columns)
+            for offset in range(0, batch.num_rows, chunk_size):
+                yield batch.slice(offset, chunk_size).to_pandas()
+
+
+def write_table(df, path, compact=True):
+    """Scrive un DataFrame nel formato indicato dall'estensione del percorso"""
+    with TableWriter(path, compact=compact) as writer:
+        writer.write(df)
+
+
+class TableWriter:
+    """Scrive un dataset a blocchi: ogni write() aggiunge righe in coda al file.
+
+    Per parquet ogni blocco diventa un row group, per feather un record batch;
+    il CSV viene scritto come dalla versione originale (tipi invariati).
+    """
+
+    def __init__(self, path, fmt=None, compact=True):
+        self.path = str(path)
+        self.fmt = fmt or detect_format(path)
+        self.compact = compact and self.fmt != 'csv'
+        self.rows = 0
+        self._schema = None
+        self._writer = None
+
+    def write(self, df):
+        if self.fmt == 'csv':
+            df.to_csv(self.path, index=False, encoding='utf-8', mode='a' if self.rows else 'w', header=not self.rows)
+            self.rows += len(df)
+            return
+
+        import pyarrow as pa
+        if self.compact:
+            df = compact_dtypes(df)
+        table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        if self._writer is None:
+            self._schema = table.schema
+            self._writer = self._open(table.schema)
+        self._writer.write_table(table)
+        self.rows += len(df)
+
+    def _open(self, schema):
+        if self.fmt == 'parquet':
+            import pyarrow.parquet as pq
+            return pq.ParquetWriter(self.path, schema)
+        import pyarrow as pa
+        options = pa.ipc.IpcWriteOptions(compression='lz4')
+        return pa.ipc.new_file(self.path, schema, options=options)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def benchmark_formats(df, columns=None, directory=None):
+    """Misura tempi di scrittura/lettura e dimensione su disco per ogni formato"""
+    results = []
+    with tempfile.TemporaryDirectory(dir=directory) as tmp_dir:
+        for fmt in FORMATS:
+            path = with_format(os.path.join(tmp_dir, 'benchmark'), fmt)
+
+            start = time.perf_counter()
+            write_table(df, path)
+            write_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            read_table(path)
+            read_time = time.perf_counter() - start
+
+            result = {
+                'format': fmt,
+                'rows': len(df),
+                'write_s': write_time,
+                'read_s': read_time,
+                'size_mb': os.path.getsize(path) / 1e6,
+            }
+            if columns:
+                start = time.perf_counter()
+                read_table(path, columns=columns)
+                result['read_columns_s'] = time.perf_counter() - start
+            results.append(result)
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Confronta i formati di storage sul dataset utente-evento")
+    parser.add_argument('input', help="Dataset da usare per il benchmark (csv, parquet o feather)")
+    parser.add_argument('--columns', nargs='*',
+                        default=['region_match', 'user_likes_for_category', 'event_popularity', 'score'],
+                        help="Colonne da leggere nel test di proiezione")
+    args = parser.parse_args()
+
+    report = benchmark_formats(read_table(args.input), columns=args.columns)
+    print(report.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
@@ -0,0 +1,172 @@
+"""
+Generatore di utenti ed eventi sintetici con lo stesso schema dei CSV in data/raw,
+per provare make_dataset, addestramento e scoring a scale maggiori dei dati reali.
+
+    python -m src.data.synthetic --users 1000000 --events 50000 --output-dir data/synthetic
+    python -m src.data.make_dataset --users data/synthetic/final_synthetic_users_with_region.csv \\
+        --events data/synthetic/final_synthetic_events.csv
+
+Le distribuzioni sono asimmetriche come nei dati reali: poche regioni e categorie
+concentrano la maggior parte di utenti ed eventi (Zipf), la popolarità degli eventi ha una
+coda lunga (Pareto), il numero di preferiti per utente è geometrico e i preferiti cadono
+più spesso sugli eventi popolari e della regione dell'utente.
+
+Gli utenti vengono generati e scritti a blocchi di USER_CHUNK: la memoria non dipende dal
+numero di utenti. Ogni blocco ha un proprio generatore derivato dal seed, quindi a parità
+di parametri i file sono identici.
+"""
+import argparse
+import os
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+USERS_FILE = 'final_synthetic_users_with_region.csv'
+EVENTS_FILE = 'final_synthetic_events.csv'
+
+# Utenti generati e scritti per blocco
+USER_CHUNK = 10_000
+
+REGION_NAMES = [
+    'Lombardia', 'Lazio', 'Campania', 'Sicilia', 'Veneto', 'Emilia-Romagna', 'Piemonte', 'Puglia',
+    'Toscana', 'Calabria', 'Sardegna', 'Liguria', 'Marche', 'Abruzzo', 'Friuli-Venezia Giulia',
+    'Trentino-Alto Adige', 'Umbria', 'Basilicata', 'Molise', "Valle d'Aosta",
+]
+CATEGORY_NAMES = [
+    'Musica', 'Sport', 'Arte', 'Teatro', 'Cinema', 'Enogastronomia', 'Tecnologia', 'Moda',
+    'Letteratura', 'Natura', 'Famiglia', 'Formazione',
+]
+
+
+def _names(known, prefix, n):
+    """I primi n nomi reali, poi nomi generati"""
+    return list(known[:n]) + [f"{prefix} {i}" for i in range(len(known) + 1, n + 1)]
+
+
+def zipf_weights(n, exponent):
+    """Probabilità proporzionali a 1 / rango^exponent (exponent 0: uniforme)"""
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def _cdf(weights):
+    cdf = np.cumsum(weights, dtype=np.float64)
+    return cdf / cdf[-1]
+
+
+def _sample(cdf, u):
+    # Indici estratti con probabilità date dalla cdf (u uniforme in [0, 1))
+    return np.minimum(np.searchsorted(cdf, u, side='right'), len(cdf) - 1)
+
+
+def generate_events(n_events, n_regions, n_categories, seed=42, region_skew=1.0, category_skew=0.8,
+                    popularity_shape=1.2, popularity_scale=10.0, max_popularity=100_000):
+    """Eventi sintetici come array: id, codice regione, codice categoria e favoriteCount"""
+    rng = np.random.default_rng([seed, 0])
+    popularity = np.floor(rng.pareto(popularity_shape, n_events) * popularity_scale)
+    return {
+        'ids': np.arange(1, n_events + 1),
+        'region': rng.choice(n_regions, n_events, p=zipf_weights(n_regions, region_skew)),
+        'category': rng.choice(n_categories, n_events, p=zipf_weights(n_categories, category_skew)),
+        'popularity': np.minimum(popularity, max_popularity).astype(np.int64),
+    }
+
+
+def _favorites(rng, user_region, events, global_cdf, region_events, region_cdfs,
+               mean_favorites, max_favorites, local_share):
+    """Preferiti (indici di evento, senza duplicati) e numero di preferiti per ogni utente del blocco"""
+    n_users = len(user_region)
+    n_events = len(events['ids'])
+    counts = np.minimum(rng.negative_binomial(1, 1 / (1 + mean_favorites), n_users), max_favorites)
+    owners = np.repeat(np.arange(n_users), counts)
+    u = rng.random(len(owners))
+    picks = _sample(global_cdf, u)
+
+    # Una parte dei preferiti è scelta tra gli eventi della regione dell'utente
+    local = rng.random(len(owners)) < local_share
+    owner_region = user_region[owners]
+    for region, cdf in region_cdfs.items():
+        selected = local & (owner_region == region)
+        picks[selected] = region_events[region][_sample(cdf, u[selected])]
+
+    # Ogni evento compare al più una volta tra i preferiti di un utente
+    keys = np.unique(owners.astype(np.int64) * n_events + picks)
+    owners, picks = keys // n_events, keys % n_events
+    return picks, np.bincount(owners, minlength=n_users)
+
+
+def generate(output_dir, n_users, n_events, n_regions=len(REGION_NAMES), n_categories=8, seed=42,
+             mean_favorites=5.0, max_favorites=200, local_share=0.7, missing_region_rate=0.0):
+    """Scrive i CSV di utenti ed eventi in output_dir e ritorna i due percorsi"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    users_path = output_dir / USERS_FILE
+    events_path = output_dir / EVENTS_FILE
+
+    regions = np.array(_names(REGION_NAMES, 'Regione', n_regions), dtype=object)
+    categories = np.array(_names(CATEGORY_NAMES, 'Categoria', n_categories), dtype=object)
+
+    events = generate_events(n_events, n_regions, n_categories, seed)
+    pd.DataFrame({
+        'id': events['ids'],
+        'regione': regions[events['region']],
+        'category': categories[events['category']],
+        'favoriteCount': events['popularity'],
+    }).to_csv(events_path, index=False)
+
+    # Probabilità di finire tra i preferiti proporzionale alla popolarità dell'evento
+    weights = events['popularity'] + 1.0
+    global_cdf = _cdf(weights)
+    region_events = {r: np.flatnonzero(events['region'] == r) for r in range(n_regions)}
+    region_cdfs = {r: _cdf(weights[idx]) for r, idx in region_events.items() if len(idx)}
+    region_p = zipf_weights(n_regions, 1.0)
+
+    for chunk, start in enumerate(range(0, n_users, USER_CHUNK)):
+        rng = np.random.default_rng([seed, 1, chunk])
+        n = min(USER_CHUNK, n_users - start)
+        user_region = rng.choice(n_regions, n, p=region_p)
+        picks, counts = _favorites(rng, user_region, events, global_cdf, region_events, region_cdfs,
+                                   mean_favorites, max_favorites, local_share)
+        ids = events['ids'][picks].astype(str)
+        bounds = np.concatenate([[0], np.cumsum(counts)])
+        favorites = ['[' + ', '.join(ids[bounds[i]:bounds[i + 1]]) + ']' for i in range(n)]
+        region_names = regions[user_region]
+        if missing_region_rate > 0:
+            region_names[rng.random(n) < missing_region_rate] = None
+        pd.DataFrame({
+            'id': np.arange(start + 1, start + n + 1),
+            'regione': region_names,
+            'favoriteIds': favorites,
+        }).to_csv(users_path, index=False, mode='w' if chunk == 0 else 'a', header=chunk == 0)
+
+    if n_users == 0:
+        pd.DataFrame(columns=['id', 'regione', 'favoriteIds']).to_csv(users_path, index=False)
+    return users_path, events_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera utenti ed eventi sintetici nel formato di data/raw")
+    parser.add_argument('--users', type=int, default=100_000, help="Numero di utenti")
+    parser.add_argument('--events', type=int, default=10_000, help="Numero di eventi")
+    parser.add_argument('--regions', type=int, default=len(REGION_NAMES), help="Numero di regioni")
+    parser.add_argument('--categories', type=int, default=8, help="Numero di categorie")
+    parser.add_argument('--mean-favorites', type=float, default=5.0, help="Numero medio di preferiti per utente")
+    parser.add_argument('--local-share', type=float, default=0.7,
+                        help="Quota dei preferiti scelti tra gli eventi della regione dell'utente")
+    parser.add_argument('--missing-region-rate', type=float, default=0.0,
+                        help="Quota di utenti senza regione")
+    parser.add_argument('--seed', type=int, default=42, help="Seed del generatore")
+    parser.add_argument('--output-dir', default=os.path.join('data', 'synthetic'), help="Directory di output")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    users_path, events_path = generate(args.output_dir, args.users, args.events, args.regions, args.categories,
+                                       args.seed, args.mean_favorites, local_share=args.local_share,
+                                       missing_region_rate=args.missing_region_rate)
+    print(f"Generati {args.users} utenti e {args.events} eventi in {time.perf_counter() - start:.1f}s:")
+    print(f"- {users_path}\n- {events_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Metriche dell'API nel formato testuale di Prometheus, senza dipendenze esterne.
+
+Contatori e istogrammi vengono aggiornati sotto un unico lock (poche operazioni aritmetiche
+per osservazione); i valori sono per processo: con più worker Gunicorn ogni worker espone
+i propri.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+# Limiti superiori (secondi) dei bucket delle latenze: da 50 µs a 10 s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Limiti superiori dei bucket delle dimensioni dei batch (righe)
+BATCH_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """Conteggi per bucket, somma e numero di osservazioni"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # bisect_left: un valore uguale al limite cade nel bucket (le="limite")
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _format_labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Contatori, istogrammi e valori calcolati alla lettura (collect), con etichette.
+
+    Le etichette sono tuple di coppie (nome, valore), es. (('route', '/predict'),).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = {}
+
+    def counter(self, name, help_text):
+        self._meta[name] = ('counter', help_text)
+        self._counters[name] = {}
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self._meta[name] = ('histogram', help_text)
+        self._histograms[name] = ({}, tuple(buckets))
+
+    def collect(self, name, help_text, fn, kind='gauge'):
+        """Metrica letta da fn() al momento dell'esportazione: ritorna {etichette: valore}"""
+        self._meta[name] = (kind, help_text)
+        self._collectors[name] = fn
+
+    def inc(self, name, labels=(), value=1):
+        series = self._counters[name]
+        with self._lock:
+            series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name, labels, value):
+        series, buckets = self._histograms[name]
+        with self._lock:
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram(buckets)
+            histogram.observe(value)
+
+    def render(self):
+        """Testo per /metrics (formato di esposizione di Prometheus 0.0.4)"""
+        lines = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {
+                name: {labels: (list(h.counts), h.sum, h.count) for labels, h in series.items()}
+                for name, (series, _) in self._histograms.items()
+            }
+        for name, (kind, help_text) in self._meta.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if name in counters:
+                for labels, value in sorted(counters[name].items()):
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+            elif name in histograms:
+                buckets = self._histograms[name][1]
+                for labels, (counts, total, count) in sorted(histograms[name].items()):
+                    cumulative = 0
+                    for bound, bucket_count in zip(buckets + (float('inf'),), counts):
+                        cumulative += bucket_count
+                        le = _format_labels(labels, (('le', _format_value(float(bound))),))
+                        lines.append(f'{name}_bucket{le} {cumulative}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(total)}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {count}')
+            else:
+                for labels, value in sorted(self._collectors[name]().items()):
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class StageTimer:
+    """Misura le fasi consecutive di una richiesta: mark(fase) registra il tempo dall'ultima fase"""
+
+    __slots__ = ('metrics', 'route', 'last')
+
+    def __init__(self, metrics, route):
+        self.metrics = metrics
+        self.route = route
+        self.last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.metrics.observe('evently_stage_duration_seconds', (('route', self.route), ('stage', stage)),
+                             now - self.last)
+        self.last = now
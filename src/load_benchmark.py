@@ -0,0 +1,155 @@
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import Pool
+import numpy as np
+
+# Corpo di una richiesta a /predict usata nel test di carico
+PREDICT_BODY = json.dumps({'region_match': 1, 'user_likes_for_category': 3, 'event_popularity': 15}).encode()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_healthy(port, server, timeout=60.0):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if server.poll() is not None:
+            raise RuntimeError(f"Il server è terminato con codice {server.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise TimeoutError(f"/health non ha risposto 200 entro {timeout}s")
+
+
+def start_gunicorn(port, workers, threads):
+    """Avvia l'API con Gunicorn e la configurazione di produzione su una porta locale"""
+    env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY=str(workers), EVENTLY_THREADS=str(threads))
+    return subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'src.api:app'],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _client_process(task):
+    """Esegue `connections` client con connessione persistente per `seconds` secondi e ritorna le latenze"""
+    port, connections, seconds, path, body = task
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        nonlocal errors
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                conn.request('POST', path, body, {'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    raise RuntimeError(response.status)
+                local.append(time.perf_counter() - start)
+            except Exception:
+                with lock:
+                    errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(connections)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors
+
+
+def run_load(port, connections=64, seconds=10.0, client_processes=None, path='/predict', body=PREDICT_BODY):
+    """Genera carico (POST di body su path) su un server già avviato e ritorna throughput e percentili di latenza"""
+    client_processes = min(client_processes or os.cpu_count() or 1, connections)
+    per_process = [connections // client_processes + (i < connections % client_processes)
+                   for i in range(client_processes)]
+    with Pool(client_processes) as pool:
+        results = pool.map(_client_process, [(port, n, seconds, path, body) for n in per_process])
+    latencies = np.array([lat for part, _ in results for lat in part])
+    errors = sum(err for _, err in results)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_s': len(latencies) / seconds,
+        'p50_ms': float(np.percentile(latencies, 50) * 1000) if len(latencies) else float('nan'),
+        'p95_ms': float(np.percentile(latencies, 95) * 1000) if len(latencies) else float('nan'),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000) if len(latencies) else float('nan'),
+    }
+
+
+def benchmark_workers(configs, connections=64, seconds=10.0, client_processes=None):
+    """Avvia Gunicorn con ogni combinazione (worker, thread) e misura /predict sotto carico"""
+    results = []
+    for workers, threads in configs:
+        port = free_port()
+        server = start_gunicorn(port, workers, threads)
+        try:
+            wait_healthy(port, server)
+            result = run_load(port, connections, seconds, client_processes)
+        finally:
+            server.terminate()
+            server.wait()
+        result.update({'workers': workers, 'threads': threads})
+        results.append(result)
+        print(f"{workers:>3} worker x {threads:>2} thread: {result['requests_per_s']:>9,.0f} richieste/s, "
+              f"p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms, errori {result['errors']}")
+
+    best = max(results, key=lambda r: r['requests_per_s'])
+    print(f"\nMigliore: WEB_CONCURRENCY={best['workers']} EVENTLY_THREADS={best['threads']} "
+          f"({best['requests_per_s']:,.0f} richieste/s)")
+    return results
+
+
+def _parse_config(value):
+    workers, threads = value.split('x')
+    return int(workers), int(threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test di carico di /predict per scegliere worker e thread di Gunicorn")
+    parser.add_argument('configs', nargs='*', type=_parse_config,
+                        help="Combinazioni WORKERxTHREAD da provare (default: 1x1 1x4 2x4 4x4 ...)")
+    parser.add_argument('--connections', type=int, default=64, help="Client concorrenti")
+    parser.add_argument('--seconds', type=float, default=10.0, help="Durata di ogni misura")
+    parser.add_argument('--client-processes', type=int, default=None,
+                        help="Processi che generano il carico (default: numero di CPU)")
+    parser.add_argument('--url-port', type=int, default=None,
+                        help="Misura un server già avviato su questa porta invece di avviare Gunicorn")
+    args = parser.parse_args()
+
+    if args.url_port is not None:
+        result = run_load(args.url_port, args.connections, args.seconds, args.client_processes)
+        print(f"{result['requests_per_s']:,.0f} richieste/s, p50 {result['p50_ms']:.2f} ms, "
+              f"p99 {result['p99_ms']:.2f} ms, errori {result['errors']}")
+        return
+
+    cpus = os.cpu_count() or 1
+    configs = args.configs or sorted({(1, 1), (1, 4), (max(cpus // 2, 1), 4), (cpus, 4), (cpus, 1)})
+    benchmark_workers(configs, args.connections, args.seconds, args.client_processes)
+
+
+if __name__ == "__main__":
+    main()
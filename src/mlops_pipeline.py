@@ -1,29 +1,294 @@
+"""
+Esecuzione locale della pipeline definita in dvc.yaml.
+
+    python -m src.mlops_pipeline                  # tutti gli stage
+    python -m src.mlops_pipeline train            # train e gli stage da cui dipende
+    python -m src.mlops_pipeline --force --jobs 2
+
+Uno stage dipende da un altro se uno dei suoi deps coincide con (o sta dentro, o contiene)
+uno degli outs/metrics dell'altro. Prima di eseguire uno stage si calcola un'impronta del
+comando e del contenuto dei suoi deps: se è uguale a quella dell'ultima esecuzione riuscita
+e gli outs esistono, lo stage viene saltato. L'hash di ogni file è riusato finché
+dimensione e data di modifica non cambiano.
+
+Gli stage indipendenti girano in parallelo (--jobs); l'output di ogni comando viene
+stampato riga per riga mentre viene prodotto, con il nome dello stage come prefisso.
+Durata e picco di memoria (RSS) di ogni stage sono salvati in REPORT_PATH.
+"""
+import argparse
+import hashlib
+import json
+import os
 import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+import yaml
+
+DVC_FILE = Path('dvc.yaml')
+STATE_PATH = Path('.pipeline_state.json')
+REPORT_PATH = Path('reports') / 'pipeline_run.json'
+
+# Byte letti per volta nel calcolo dell'hash dei file
+HASH_BLOCK_SIZE = 1 << 20
+
+_print_lock = threading.Lock()
+
+
+def _paths(entries):
+    # In dvc.yaml outs/deps/metrics sono stringhe o dizionari {percorso: opzioni}
+    paths = []
+    for entry in entries or []:
+        paths.extend(entry if isinstance(entry, dict) else [entry])
+    return [os.path.normpath(p) for p in paths]
+
+
+def load_stages(dvc_file=DVC_FILE):
+    """Stage di dvc.yaml: {nome: {'cmd', 'deps', 'outs', 'upstream'}}"""
+    with open(dvc_file) as f:
+        config = yaml.safe_load(f)
+    stages = {}
+    for name, stage in config.get('stages', {}).items():
+        if 'foreach' in stage:
+            raise ValueError(f"Stage {name}: foreach non è supportato")
+        cmd = stage['cmd']
+        stages[name] = {
+            'cmd': ' && '.join(cmd) if isinstance(cmd, list) else cmd,
+            'wdir': stage.get('wdir', '.'),
+            'deps': _paths(stage.get('deps')),
+            'outs': _paths(stage.get('outs')) + _paths(stage.get('metrics')) + _paths(stage.get('plots')),
+        }
+
+    def overlaps(a, b):
+        return a == b or a.startswith(b + os.sep) or b.startswith(a + os.sep)
+
+    for name, stage in stages.items():
+        stage['upstream'] = sorted(
+            other for other, producer in stages.items()
+            if other != name and any(overlaps(d, o) for d in stage['deps'] for o in producer['outs'])
+        )
+    _check_acyclic(stages)
+    return stages
+
+
+def _check_acyclic(stages):
+    visiting, done = set(), set()
+
+    def visit(name, path):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Ciclo tra gli stage: {' -> '.join(path + [name])}")
+        visiting.add(name)
+        for upstream in stages[name]['upstream']:
+            visit(upstream, path + [name])
+        visiting.discard(name)
+        done.add(name)
+
+    for name in stages:
+        visit(name, [])
+
+
+def with_upstream(stages, targets):
+    """Gli stage richiesti e, ricorsivamente, quelli da cui dipendono"""
+    selected = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in stages:
+            raise KeyError(f"Stage sconosciuto: {name}")
+        if name not in selected:
+            selected.add(name)
+            pending.extend(stages[name]['upstream'])
+    return selected
+
+
+class FileHasher:
+    """Hash sha256 dei file, riusato finché dimensione e data di modifica restano le stesse"""
+
+    def __init__(self, cache=None):
+        self.cache = dict(cache or {})
+        self._lock = threading.Lock()
+
+    def file_hash(self, path):
+        stat = os.stat(path)
+        key = [stat.st_size, stat.st_mtime_ns]
+        with self._lock:
+            cached = self.cache.get(path)
+        if cached and cached[:2] == key:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        with self._lock:
+            self.cache[path] = key + [digest.hexdigest()]
+        return digest.hexdigest()
+
+    def path_hashes(self, path):
+        """Coppie (file, hash) di un file o di tutti i file sotto una directory; None se non esiste"""
+        if os.path.isfile(path):
+            return [(path, self.file_hash(path))]
+        if not os.path.isdir(path):
+            return None
+        files = []
+        for root, dirs, names in os.walk(path):
+            dirs[:] = [d for d in dirs if d != '__pycache__']
+            files.extend(os.path.join(root, name) for name in names)
+        return [(f, self.file_hash(f)) for f in sorted(files)]
+
+
+def fingerprint(stage, hasher):
+    """Impronta di comando e contenuto dei deps di uno stage"""
+    digest = hashlib.sha256(stage['cmd'].encode())
+    for dep in stage['deps']:
+        digest.update(f'\0{dep}\0'.encode())
+        hashes = hasher.path_hashes(os.path.join(stage['wdir'], dep))
+        if hashes is None:
+            digest.update(b'<mancante>')
+            continue
+        for path, file_hash in hashes:
+            digest.update(f'{path}:{file_hash}\n'.encode())
+    return digest.hexdigest()
+
+
+def load_state(path=STATE_PATH):
+    if not Path(path).exists():
+        return {'stages': {}, 'files': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state, path=STATE_PATH):
+    tmp = Path(f'{path}.tmp')
+    tmp.write_text(json.dumps(state, indent=2))
+    os.replace(tmp, path)
+
+
+def _log(name, line):
+    with _print_lock:
+        sys.stdout.write(f'[{name}] {line}')
+        if not line.endswith('\n'):
+            sys.stdout.write('\n')
+        sys.stdout.flush()
+
+
+def run_stage(name, stage):
+    """Esegue il comando dello stage stampando l'output man mano; ritorna codice, secondi e picco di RSS"""
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    start = time.perf_counter()
+    process = subprocess.Popen(stage['cmd'], shell=True, cwd=stage['wdir'], env=env, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, text=True, bufsize=1)
+    for line in process.stdout:
+        _log(name, line)
+    process.stdout.close()
+
+    peak_rss_mb = None
+    if hasattr(os, 'wait4'):
+        # wait4 ritorna anche le risorse usate dal processo figlio (ru_maxrss in KB su Linux)
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        peak_rss_mb = usage.ru_maxrss / 1024
+    else:
+        process.wait()
+    return process.returncode, time.perf_counter() - start, peak_rss_mb
+
+
+def run_pipeline(stages, targets=None, jobs=None, force=False, dry_run=False, state_path=STATE_PATH):
+    """Esegue gli stage selezionati in ordine topologico, in parallelo dove possibile, e ritorna il report"""
+    selected = with_upstream(stages, targets or list(stages))
+    state = load_state(state_path)
+    hasher = FileHasher(state.get('files'))
+    results = {}
+    start = time.perf_counter()
+
+    def execute(name):
+        stage = stages[name]
+        # L'impronta si calcola quando gli stage a monte sono finiti: include i loro nuovi outs
+        stage_fingerprint = fingerprint(stage, hasher)
+        outs_present = all(os.path.exists(os.path.join(stage['wdir'], o)) for o in stage['outs'])
+        previous = state['stages'].get(name, {}).get('fingerprint')
+        if not force and previous == stage_fingerprint and outs_present:
+            _log(name, "invariato, saltato")
+            return {'status': 'cached', 'fingerprint': stage_fingerprint}
+        if dry_run:
+            _log(name, f"da eseguire: {stage['cmd']}")
+            return {'status': 'would-run', 'fingerprint': stage_fingerprint}
+        _log(name, f"$ {stage['cmd']}")
+        returncode, seconds, peak_rss_mb = run_stage(name, stage)
+        status = 'ran' if returncode == 0 else 'failed'
+        _log(name, f"{'completato' if returncode == 0 else f'fallito (codice {returncode})'} in {seconds:.1f}s"
+                   + (f", picco RSS {peak_rss_mb:.0f} MB" if peak_rss_mb is not None else ''))
+        return {'status': status, 'returncode': returncode, 'seconds': seconds, 'peak_rss_mb': peak_rss_mb,
+                'fingerprint': stage_fingerprint}
+
+    pending = set(selected)
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+        while pending or running:
+            for name in sorted(pending):
+                upstream = [u for u in stages[name]['upstream'] if u in selected]
+                if any(results.get(u, {}).get('status') in ('failed', 'skipped') for u in upstream):
+                    results[name] = {'status': 'skipped', 'reason': 'stage a monte fallito'}
+                    pending.discard(name)
+                elif all(u in results for u in upstream):
+                    running[executor.submit(execute, name)] = name
+                    pending.discard(name)
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+                if results[name]['status'] == 'ran':
+                    state['stages'][name] = {'fingerprint': results[name]['fingerprint'],
+                                             'completed_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+                    state['files'] = hasher.cache
+                    save_state(state, state_path)
+
+    if not dry_run:
+        state['files'] = hasher.cache
+        save_state(state, state_path)
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'seconds': time.perf_counter() - start,
+        'jobs': jobs or os.cpu_count() or 1,
+        'stages': {name: results[name] for name in sorted(results)},
+    }
 
-def run_command(command):
-    """Esegue un comando di shell e stampa l'output."""
-    result = subprocess.run(command, shell=True, capture_output=True, text=True)
-    print(result.stdout)
-    if result.stderr:
-        print(result.stderr)
 
 def main():
-    # Definisci i percorsi dei file come variabili
-    make_dataset_script = "c:/Users/depas/Documents/eventlyML/src/data/make_dataset.py"
-    train_model_script = "c:/Users/depas/Documents/eventlyML/src/models/train_model.py"
-    predict_model_script = "c:/Users/depas/Documents/eventlyML/src/models/predict_model.py"
+    parser = argparse.ArgumentParser(description="Esegue la pipeline di dvc.yaml saltando gli stage invariati")
+    parser.add_argument('targets', nargs='*', help="Stage da eseguire, con quelli da cui dipendono (default: tutti)")
+    parser.add_argument('--dvc-file', default=str(DVC_FILE), help="File con la definizione degli stage")
+    parser.add_argument('--jobs', '-j', type=int, default=None, help="Stage eseguiti in parallelo (default: numero di CPU)")
+    parser.add_argument('--force', '-f', action='store_true', help="Esegue gli stage anche se invariati")
+    parser.add_argument('--dry-run', action='store_true', help="Mostra gli stage da eseguire senza eseguirli")
+    parser.add_argument('--report', default=str(REPORT_PATH), help="File JSON del report dell'esecuzione")
+    args = parser.parse_args()
+
+    stages = load_stages(args.dvc_file)
+    report = run_pipeline(stages, args.targets, args.jobs, args.force, args.dry_run)
 
-    # Step 1: Preprocess the data
-    print("Preprocessing data...")
-    run_command(f"python {make_dataset_script}")
+    print("\nRiepilogo:")
+    for name, result in report['stages'].items():
+        details = ''
+        if 'seconds' in result:
+            details = f" {result['seconds']:.1f}s"
+            if result['peak_rss_mb'] is not None:
+                details += f", picco RSS {result['peak_rss_mb']:.0f} MB"
+        print(f"- {name}: {result['status']}{details}")
 
-    # Step 2: Train the model
-    print("Training model...")
-    run_command(f"python {train_model_script}")
+    if not args.dry_run:
+        report_path = Path(args.report)
+        report_path.parent.mkdir(exist_ok=True, parents=True)
+        report_path.write_text(json.dumps(report, indent=2))
+        print(f"Report salvato in: {report_path}")
+    if any(r['status'] in ('failed', 'skipped') for r in report['stages'].values()):
+        sys.exit(1)
 
-    # Step 3: Validate the model
-    print("Validating model...")
-    run_command(f"python {predict_model_script}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
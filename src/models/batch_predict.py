@@ -0,0 +1,98 @@
+import argparse
+import glob
+import os
+import time
+from multiprocessing import Pool
+from pathlib import Path
+import pandas as pd
+from src.data.storage import FORMATS, detect_format, with_format
+from src.models.predict_model import DEFAULT_CHUNK_SIZE, StreamingMetrics, load_model_pickle, score_file
+
+# Modello caricato una sola volta per processo worker
+_model = None
+
+
+def find_inputs(pattern):
+    """Elenca i file da predire: una directory (tutti i formati supportati) o un pattern glob"""
+    if os.path.isdir(pattern):
+        paths = [p for ext in FORMATS.values() for p in glob.glob(os.path.join(pattern, f"*{ext}"))]
+    else:
+        paths = glob.glob(pattern)
+    paths = sorted(p for p in paths if os.path.isfile(p))
+    if not paths:
+        raise FileNotFoundError(f"Nessun file di input trovato per {pattern}")
+    return paths
+
+
+def output_path_for(input_path, output_dir, fmt=None):
+    """File di output per un input: stesso nome con suffisso _predictions"""
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    return with_format(os.path.join(output_dir, f"{stem}_predictions"), fmt or detect_format(input_path))
+
+
+def _init_worker():
+    global _model
+    _model = load_model_pickle()  # oppure load_model_joblib()
+
+
+def _score(task):
+    input_path, output_path, chunk_size = task
+    start = time.perf_counter()
+    predicted, metrics = score_file(_model, input_path, output_path, chunk_size)
+    return input_path, output_path, predicted.n, time.perf_counter() - start, metrics
+
+
+def predict_many(pattern, output_dir='data/processed/predictions', workers=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, fmt=None, report_path=Path('reports') / 'batch_metrics.csv'):
+    """Predice più file in parallelo e salva un report con metriche per file e complessive"""
+    inputs = find_inputs(pattern)
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(path, output_path_for(path, output_dir, fmt), chunk_size) for path in inputs]
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+
+    results = {}
+    total = StreamingMetrics()
+    start = time.perf_counter()
+    with Pool(workers, initializer=_init_worker) as pool:
+        for input_path, output_path, rows, seconds, metrics in pool.imap_unordered(_score, tasks):
+            print(f"{input_path}: {rows} righe in {seconds:.2f}s ({rows / seconds:,.0f} righe/s) -> {output_path}")
+            row = {'file': input_path, 'rows': rows, 'seconds': seconds, 'rows_per_s': rows / seconds}
+            if metrics.target.n:
+                row.update(metrics.result())
+            results[input_path] = row
+            total.merge(metrics)
+    elapsed = time.perf_counter() - start
+
+    n_rows = sum(row['rows'] for row in results.values())
+    summary = {'file': 'TOTAL', 'rows': n_rows, 'seconds': elapsed, 'rows_per_s': n_rows / elapsed}
+    if total.target.n:
+        summary.update(total.result())
+    print(f"Totale: {n_rows} righe da {len(inputs)} file in {elapsed:.2f}s "
+          f"({summary['rows_per_s']:,.0f} righe/s, {workers} worker)")
+
+    report = pd.DataFrame([results[path] for path in inputs] + [summary])
+    if report_path is not None:
+        report_path = Path(report_path)
+        report_path.parent.mkdir(exist_ok=True, parents=True)
+        report.to_csv(report_path, index=False)
+        print(f"Report salvato in: {report_path}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Predizioni in parallelo su più file di input")
+    parser.add_argument('inputs', help="Directory o pattern glob dei file da predire")
+    parser.add_argument('--output-dir', default='data/processed/predictions', help="Directory dei file di output")
+    parser.add_argument('--workers', type=int, default=None, help="Numero di processi (default: numero di CPU)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Righe per blocco")
+    parser.add_argument('--format', choices=list(FORMATS), default=None,
+                        help="Formato di output (default: lo stesso dell'input)")
+    parser.add_argument('--report', default=str(Path('reports') / 'batch_metrics.csv'),
+                        help="CSV con metriche e throughput per file")
+    args = parser.parse_args()
+
+    predict_many(args.inputs, args.output_dir, args.workers, args.chunk_size, args.format, args.report)
+
+
+if __name__ == "__main__":
+    main()
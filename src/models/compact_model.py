@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+# Solo numpy: caricare questo formato non importa scikit-learn né pandas
+
+COMPACT_NAME = 'linear_regression_model.json'
+FORMAT_NAME = 'evently-linear'
+FORMAT_VERSION = 1
+
+
+def export_compact(model, path, metrics=None):
+    """Salva coefficienti, intercetta, nomi delle feature e metriche di un modello lineare in JSON.
+
+    I float sono scritti con repr, quindi vengono riletti identici.
+    """
+    features = [str(name) for name in model.feature_names_in_]
+    payload = {
+        'format': FORMAT_NAME,
+        'format_version': FORMAT_VERSION,
+        'model_type': type(model).__name__,
+        'features': features,
+        'coef': [float(c) for c in np.ravel(model.coef_)],
+        'intercept': float(model.intercept_),
+        'metrics': {name: float(value) for name, value in (metrics or {}).items()},
+    }
+    path = Path(path)
+    path.parent.mkdir(exist_ok=True, parents=True)
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    return path
+
+
+class CompactLinearModel:
+    """Modello lineare letto dal formato compatto, con la stessa interfaccia di predict di sklearn"""
+
+    def __init__(self, features, coef, intercept, metrics=None):
+        self.feature_names_in_ = np.asarray(features, dtype=object)
+        self.coef_ = np.asarray(coef, dtype=np.float64)
+        self.intercept_ = float(intercept)
+        self.metrics = metrics or {}
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            payload = json.load(f)
+        if payload.get('format') != FORMAT_NAME:
+            raise ValueError(f"{path} non è un modello in formato {FORMAT_NAME}")
+        if payload.get('format_version', 0) > FORMAT_VERSION:
+            raise ValueError(f"Versione del formato non supportata: {payload['format_version']}")
+        if len(payload['features']) != len(payload['coef']):
+            raise ValueError(f"{path}: numero di coefficienti diverso dal numero di feature")
+        return cls(payload['features'], payload['coef'], payload['intercept'], payload.get('metrics'))
+
+    def predict(self, X):
+        """Predizioni per X: DataFrame (colonne selezionate per nome) o array righe x feature"""
+        if hasattr(X, 'columns'):
+            X = X[list(self.feature_names_in_)].to_numpy(dtype=np.float64)
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != len(self.coef_):
+            raise ValueError(f"Attese {len(self.coef_)} feature, ricevuto array di forma {X.shape}")
+        return X @ self.coef_ + self.intercept_
+
+
+def load_compact(path=Path('model-linear-regression') / COMPACT_NAME):
+    """Carica il modello nel formato compatto"""
+    return CompactLinearModel.load(path)
+
+
+# Eseguito in un processo nuovo per ogni formato: carica il modello e fa la prima predizione
+_STARTUP_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+fmt, path = sys.argv[1], sys.argv[2]
+if fmt == 'compact':
+    from src.models.compact_model import load_compact
+    model = load_compact(path)
+    prediction = model.predict([[1.0, 3.0, 15.0]])[0]
+else:
+    import pandas as pd
+    from src.models.registry import load_artifact
+    model = load_artifact(path)
+    X = pd.DataFrame([[1.0, 3.0, 15.0]], columns=list(model.feature_names_in_))
+    prediction = model.predict(X)[0]
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'seconds': elapsed, 'max_rss_mb': rss_kb / 1024,
+                  'sklearn': 'sklearn' in sys.modules, 'pandas': 'pandas' in sys.modules,
+                  'prediction': float(prediction)}))
+"""
+
+
+def benchmark_startup(directory=Path('model-linear-regression'), repeats=5):
+    """Tempo fino alla prima predizione e memoria massima (RSS) per pickle, joblib e formato compatto.
+
+    Ogni misura avviene in un interprete nuovo, come all'avvio di un'istanza.
+    """
+    directory = Path(directory)
+    artifacts = {
+        'pickle': directory / 'linear_regression_model.pkl',
+        'joblib': directory / 'linear_regression_model.joblib',
+        'compact': directory / COMPACT_NAME,
+    }
+    # Il processo figlio deve poter importare il pacchetto src
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get('PYTHONPATH')])))
+    results = []
+    for fmt, path in artifacts.items():
+        if not path.exists():
+            print(f"{fmt}: {path} non trovato, salto")
+            continue
+        runs = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            out = subprocess.run([sys.executable, '-c', _STARTUP_SCRIPT, fmt, str(path)],
+                                 capture_output=True, text=True, check=True, env=env)
+            run = json.loads(out.stdout.strip().splitlines()[-1])
+            run['process_seconds'] = time.perf_counter() - start
+            runs.append(run)
+        results.append({
+            'format': fmt,
+            'size_bytes': path.stat().st_size,
+            'first_prediction_s': float(np.median([r['seconds'] for r in runs])),
+            'process_s': float(np.median([r['process_seconds'] for r in runs])),
+            'max_rss_mb': float(np.median([r['max_rss_mb'] for r in runs])),
+            'imports_sklearn': runs[0]['sklearn'],
+            'imports_pandas': runs[0]['pandas'],
+            'prediction': runs[0]['prediction'],
+        })
+
+    print(f"{'formato':<8} {'byte':>8} {'prima pred. (s)':>16} {'processo (s)':>13} {'RSS (MB)':>9}  sklearn pandas")
+    for r in results:
+        print(f"{r['format']:<8} {r['size_bytes']:>8} {r['first_prediction_s']:>16.3f} {r['process_s']:>13.3f} "
+              f"{r['max_rss_mb']:>9.1f}  {str(r['imports_sklearn']):<7} {r['imports_pandas']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Formato compatto del modello lineare")
+    parser.add_argument('--export', action='store_true',
+                        help="Converte il modello joblib esistente nel formato compatto")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="Confronta avvio e memoria di pickle, joblib e formato compatto")
+    parser.add_argument('--model-dir', default='model-linear-regression', help="Directory del modello")
+    parser.add_argument('--repeats', type=int, default=5, help="Ripetizioni per formato nel benchmark")
+    args = parser.parse_args()
+
+    model_dir = Path(args.model_dir)
+    if args.export:
+        from src.models.registry import load_artifact
+        model = load_artifact(model_dir / 'linear_regression_model.joblib')
+        metrics_path = Path('reports') / 'training_metrics.csv'
+        metrics = None
+        if metrics_path.exists():
+            import pandas as pd
+            metrics = pd.read_csv(metrics_path).iloc[0].to_dict()
+        path = export_compact(model, model_dir / COMPACT_NAME, metrics)
+        print(f"Modello compatto salvato in: {path}")
+    if args.benchmark:
+        benchmark_startup(model_dir, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
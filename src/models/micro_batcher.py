@@ -0,0 +1,74 @@
+import asyncio
+import numpy as np
+
+
+class MicroBatcher:
+    """Raccoglie le predizioni singole concorrenti e le calcola con una sola chiamata vettoriale.
+
+    Ogni submit(row) mette in coda una riga di feature e attende il proprio risultato. La coda
+    viene svuotata quando raggiunge max_batch_size righe oppure max_wait_us microsecondi dopo
+    l'arrivo della prima riga: l'attesa aggiunta a ogni richiesta è al più max_wait_us.
+    predict_batch(X) riceve la matrice righe x feature e ritorna un valore per riga; gira
+    nell'executor di default, così l'event loop continua ad accettare richieste.
+    Da usare dentro un solo event loop asyncio.
+    """
+
+    def __init__(self, predict_batch, max_batch_size=256, max_wait_us=2000):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_us = max_wait_us
+        self._rows = []
+        self._futures = []
+        self._timer = None
+        self.batches = 0
+        self.rows = 0
+
+    async def submit(self, row):
+        future = asyncio.get_running_loop().create_future()
+        self._rows.append(row)
+        self._futures.append(future)
+        if len(self._rows) >= self.max_batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait_us / 1e6, self.flush)
+        return await future
+
+    def flush(self):
+        """Avvia il calcolo delle righe in coda; ritorna il future del calcolo (None se vuota)"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        rows, futures = self._rows, self._futures
+        self._rows, self._futures = [], []
+        if not rows:
+            return None
+        self.batches += 1
+        self.rows += len(rows)
+        computation = asyncio.get_running_loop().run_in_executor(None, self._predict, rows)
+        computation.add_done_callback(lambda done: self._resolve(done, futures))
+        return computation
+
+    def _predict(self, rows):
+        return self.predict_batch(np.array(rows, dtype=np.float64)).tolist()
+
+    @staticmethod
+    def _resolve(computation, futures):
+        error = asyncio.CancelledError() if computation.cancelled() else computation.exception()
+        if error is not None:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for future, prediction in zip(futures, computation.result()):
+            # Il client potrebbe essersi disconnesso nel frattempo
+            if not future.done():
+                future.set_result(prediction)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_us": self.max_wait_us,
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+        }
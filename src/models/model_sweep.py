@@ -0,0 +1,458 @@
+"""
+Selezione del modello: una griglia di candidati valutata con k-fold in più processi.
+
+    python -m src.models.model_sweep --folds 5 --workers 4
+    python -m src.models.model_sweep --alphas 0.1 1 10 --latency-budget-us 0.5 --save-best
+    python -m src.models.model_sweep --grid grid.json --offline
+
+Candidati di default: LinearRegression, Ridge e Lasso per ogni alpha, SGDRegressor (con
+StandardScaler) e le varianti con le interazioni tra feature (PolynomialFeatures di grado
+2, solo prodotti). Una griglia diversa si passa con --grid: lista JSON di
+{"estimator": "ridge", "params": {"alpha": 1.0}, "interactions": true}.
+
+Il dataset viene letto a blocchi e scritto una sola volta in file .npy nella directory di
+lavoro, con le righe ordinate per fold: ogni processo li apre con mmap (le pagine sono
+condivise tramite la page cache) e il fold di test è una vista contigua, senza copie. Il
+fold di una riga dipende dall'hash di (user_id, event_id), come la divisione train/test
+dell'addestramento a blocchi (src/models/streaming_train.py).
+
+Memoria per processo:
+- LinearRegression e Ridge (con o senza interazioni) si addestrano dalle statistiche
+  sufficienti, accumulate a blocchi di chunk_size righe sulle viste del file mappato:
+  nessuna copia del training set;
+- Lasso, SGDRegressor e gli stimatori con altri parametri ricevono una copia in memoria
+  del training set ((k-1)/k delle righe, più le copie interne di scikit-learn, circa il
+  doppio con le interazioni). Se la griglia ne contiene, i processi sono limitati alla
+  memoria disponibile (MEMORY_FRACTION di MemAvailable).
+
+Per ogni candidato si misurano, in media sui fold: MSE, R2, tempo di addestramento,
+latenza di predizione per riga (su blocchi di LATENCY_BATCH_ROWS righe, come una richiesta
+/recommend) e dimensione dell'artefatto serializzato. Il migliore è il candidato con MSE
+minore tra quelli entro il budget di latenza. Le run sono registrate con
+src/models/tracking.py (file store locale se DagsHub non è disponibile).
+"""
+import argparse
+import itertools
+import json
+import os
+import pickle
+import shutil
+import statistics
+import tempfile
+import time
+import warnings
+from multiprocessing import Pool
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.linear_model import Lasso, LinearRegression, Ridge, SGDRegressor
+from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import PolynomialFeatures, StandardScaler
+from src.data.storage import find_table, iter_table
+from src.models.registry import MODEL_DIR, save_version
+from src.models.streaming_train import DEFAULT_CHUNK_SIZE, FEATURES, SPLIT_KEYS, TARGET, NormalEquations, row_hashes
+from src.models.tracking import open_tracker
+
+DATASET_BASE_PATH = 'data/processed/user_event_similarity'
+REPORT_PATH = Path('reports') / 'model_sweep.json'
+EXPERIMENT_NAME = 'model-sweep'
+
+ESTIMATORS = {
+    'linear': LinearRegression,
+    'ridge': Ridge,
+    'lasso': Lasso,
+    'sgd': SGDRegressor,
+}
+DEFAULT_ALPHAS = [0.001, 0.01, 0.1, 1.0]
+DEFAULT_FOLDS = 5
+
+# Righe per chiamata a predict nella misura della latenza, e ripetizioni (si usa la mediana)
+LATENCY_BATCH_ROWS = 1000
+LATENCY_REPEATS = 20
+DEFAULT_LATENCY_BUDGET_US = 1.0
+
+# Quota della memoria disponibile usabile dalle copie dei training set
+MEMORY_FRACTION = 0.7
+
+
+def default_grid(alphas=DEFAULT_ALPHAS, seed=42):
+    """Candidati di default: modelli lineari regolarizzati e non, con e senza interazioni"""
+    grid = []
+    for interactions in (False, True):
+        grid.append({'estimator': 'linear', 'params': {}, 'interactions': interactions})
+        grid.extend({'estimator': 'ridge', 'params': {'alpha': alpha}, 'interactions': interactions}
+                    for alpha in alphas)
+        grid.extend({'estimator': 'lasso', 'params': {'alpha': alpha}, 'interactions': interactions}
+                    for alpha in alphas)
+        grid.append({'estimator': 'sgd', 'params': {'random_state': seed}, 'interactions': interactions})
+    return grid
+
+
+def candidate_name(spec):
+    params = ','.join(f'{key}={value}' for key, value in sorted(spec.get('params', {}).items())
+                      if key != 'random_state')
+    name = spec['estimator'] + (f'({params})' if params else '')
+    return name + ('+interazioni' if spec.get('interactions') else '')
+
+
+def build_estimator(spec):
+    """Stimatore scikit-learn (eventualmente una pipeline) descritto da spec"""
+    if spec['estimator'] not in ESTIMATORS:
+        raise ValueError(f"Stimatore sconosciuto: {spec['estimator']} (disponibili: {sorted(ESTIMATORS)})")
+    steps = []
+    if spec.get('interactions'):
+        steps.append(PolynomialFeatures(degree=2, interaction_only=True, include_bias=False))
+    # La discesa del gradiente converge solo con feature sulla stessa scala
+    if spec['estimator'] == 'sgd':
+        steps.append(StandardScaler())
+    model = ESTIMATORS[spec['estimator']](**spec.get('params', {}))
+    return make_pipeline(*steps, model) if steps else model
+
+
+def statistics_alpha(spec):
+    """Alpha con cui il candidato si addestra dalle statistiche sufficienti, None se serve scikit-learn"""
+    params = spec.get('params', {})
+    if spec['estimator'] == 'linear' and not params:
+        return 0.0
+    if spec['estimator'] == 'ridge' and set(params) <= {'alpha'}:
+        return float(params.get('alpha', 1.0))
+    return None
+
+
+def _interactions(X):
+    # Trasformazione delle interazioni di build_estimator, adattata sulle colonne di X
+    return PolynomialFeatures(degree=2, interaction_only=True, include_bias=False).fit(X[:1])
+
+
+def model_from_coefficients(spec, coef, intercept, expand=None):
+    """Stimatore di spec con coefficienti già calcolati, come se fosse stato addestrato con fit"""
+    model = ESTIMATORS[spec['estimator']](**spec.get('params', {}))
+    model.coef_ = np.asarray(coef, dtype=np.float64)
+    model.intercept_ = np.float64(intercept)
+    model.n_features_in_ = len(model.coef_)
+    return make_pipeline(expand, model) if expand is not None else model
+
+
+def fit_from_statistics(spec, blocks, alpha, expand=None):
+    """Addestra linear/ridge accumulando le statistiche sufficienti su blocchi (X, y), senza copiarli"""
+    stats = None
+    for X, y in blocks:
+        if expand is not None:
+            X = expand.transform(X)
+        if stats is None:
+            stats = NormalEquations(X.shape[1])
+        stats.update(X, y)
+    if stats is None:
+        raise ValueError("Nessuna riga di training")
+    coef, intercept = stats.solve(alpha)
+    return model_from_coefficients(spec, coef, intercept, expand)
+
+
+def _row_blocks(X, y, ranges, block_rows):
+    for low, high in ranges:
+        for start in range(low, high, block_rows):
+            stop = min(start + block_rows, high)
+            yield X[start:stop], y[start:stop]
+
+
+def write_shared_arrays(input_path, directory, n_folds, seed=42, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Scrive X.npy e y.npy con le righe ordinate per fold; ritorna i confini dei fold (n_folds + 1 valori).
+
+    Prima lettura: solo le chiavi, per assegnare i fold e calcolare la posizione di ogni riga.
+    Seconda lettura: feature e target, scritti direttamente nella posizione finale.
+    """
+    folds = np.concatenate([(row_hashes(chunk, seed) % n_folds).astype(np.int32)
+                            for chunk in iter_table(input_path, chunk_size, columns=SPLIT_KEYS)])
+    if len(folds) == 0:
+        raise ValueError(f"Nessuna riga in {input_path}")
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(folds, minlength=n_folds))])
+    # Posizione di ogni riga: le righe di uno stesso fold mantengono l'ordine del file
+    order = np.argsort(folds, kind='stable')
+    destination = np.empty(len(folds), dtype=np.int64)
+    destination[order] = np.arange(len(folds))
+    del folds, order
+
+    directory = Path(directory)
+    X = np.lib.format.open_memmap(directory / 'X.npy', mode='w+', dtype=np.float64, shape=(len(destination), len(FEATURES)))
+    y = np.lib.format.open_memmap(directory / 'y.npy', mode='w+', dtype=np.float64, shape=(len(destination),))
+    offset = 0
+    for chunk in iter_table(input_path, chunk_size, columns=FEATURES + [TARGET]):
+        rows = destination[offset:offset + len(chunk)]
+        X[rows] = chunk[FEATURES].to_numpy(dtype=np.float64)
+        y[rows] = chunk[TARGET].to_numpy(dtype=np.float64)
+        offset += len(chunk)
+    X.flush()
+    y.flush()
+    del X, y
+    return bounds
+
+
+def open_shared_arrays(directory):
+    directory = Path(directory)
+    return np.load(directory / 'X.npy', mmap_mode='r'), np.load(directory / 'y.npy', mmap_mode='r')
+
+
+def predict_latency_us(model, X):
+    """Latenza mediana di predict per riga, in microsecondi, su un blocco di LATENCY_BATCH_ROWS righe"""
+    batch = np.ascontiguousarray(X[:LATENCY_BATCH_ROWS])
+    timings = []
+    for _ in range(LATENCY_REPEATS):
+        start = time.perf_counter()
+        model.predict(batch)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) / len(batch) * 1e6
+
+
+# Dati visti da ogni processo worker
+_worker = None
+
+
+def _init_worker(directory, bounds, block_rows):
+    global _worker
+    X, y = open_shared_arrays(directory)
+    _worker = (X, y, bounds, block_rows)
+
+
+def _evaluate(task):
+    """Addestra il candidato su tutti i fold tranne uno e lo valuta su quello escluso"""
+    candidate, spec, fold = task
+    X, y, bounds, block_rows = _worker
+    low, high = bounds[fold], bounds[fold + 1]
+    # Il fold di test è una vista sul file mappato
+    X_test, y_test = X[low:high], y[low:high]
+
+    start = time.perf_counter()
+    alpha = statistics_alpha(spec)
+    if alpha is not None:
+        # Training set letto a blocchi dalle viste prima e dopo il fold di test
+        expand = _interactions(X) if spec.get('interactions') else None
+        model = fit_from_statistics(spec, _row_blocks(X, y, [(0, low), (high, len(y))], block_rows), alpha, expand)
+    else:
+        # Copia privata del training set: è il costo che training_copy_bytes stima
+        X_train = np.concatenate([X[:low], X[high:]])
+        y_train = np.concatenate([y[:low], y[high:]])
+        model = build_estimator(spec)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', ConvergenceWarning)
+            model.fit(X_train, y_train)
+        del X_train, y_train
+    fit_seconds = time.perf_counter() - start
+    y_pred = model.predict(X_test)
+    return {
+        'candidate': candidate,
+        'fold': fold,
+        'mse': float(mean_squared_error(y_test, y_pred)),
+        'r2': float(r2_score(y_test, y_pred)),
+        'fit_seconds': fit_seconds,
+        'predict_us_per_row': predict_latency_us(model, X_test),
+        'artifact_bytes': len(pickle.dumps(model)),
+    }
+
+
+def summarize(spec, fold_results):
+    """Medie sui fold delle metriche di un candidato"""
+    summary = {'name': candidate_name(spec), 'spec': spec}
+    for metric in ('mse', 'r2', 'fit_seconds', 'predict_us_per_row', 'artifact_bytes'):
+        values = [r[metric] for r in fold_results]
+        summary[metric] = float(np.mean(values))
+    summary['mse_std'] = float(np.std([r['mse'] for r in fold_results]))
+    return summary
+
+
+def select_best(candidates, latency_budget_us):
+    """Candidato con MSE minore tra quelli entro il budget di latenza (None se nessuno lo rispetta)"""
+    eligible = [c for c in candidates if c['predict_us_per_row'] <= latency_budget_us]
+    return min(eligible, key=lambda c: (c['mse'], c['predict_us_per_row'])) if eligible else None
+
+
+def available_memory():
+    """Byte di memoria disponibili (MemAvailable su Linux), None se non si possono leggere"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def training_copy_bytes(grid, n_rows, n_folds):
+    """Stima della memoria di un task con copia del training set (0 se tutti usano le statistiche)"""
+    copies = [spec for spec in grid if statistics_alpha(spec) is None]
+    if not copies:
+        return 0
+    n_train = n_rows - n_rows // n_folds
+    n_columns = len(FEATURES) + 1
+    # Copia di X e y, più una copia interna di scikit-learn (centratura, scaler) o le colonne delle interazioni
+    expanded = _interactions(np.zeros((1, len(FEATURES)))).n_output_features_
+    widest = max(expanded if spec.get('interactions') else len(FEATURES) for spec in copies)
+    return n_train * 8 * (n_columns + 2 * widest)
+
+
+def run_sweep(input_path, grid, n_folds=DEFAULT_FOLDS, workers=None, seed=42,
+              chunk_size=DEFAULT_CHUNK_SIZE, work_dir=None):
+    """Valuta tutti i candidati di grid con k-fold; ritorna (riepilogo per candidato, righe del dataset)"""
+    if n_folds < 2:
+        raise ValueError("Servono almeno 2 fold")
+    directory = tempfile.mkdtemp(prefix='model-sweep-', dir=work_dir)
+    try:
+        start = time.perf_counter()
+        bounds = write_shared_arrays(input_path, directory, n_folds, seed, chunk_size)
+        print(f"Dataset di {bounds[-1]} righe in {directory} ({time.perf_counter() - start:.1f}s), "
+              f"fold da {np.diff(bounds).min()}-{np.diff(bounds).max()} righe")
+
+        tasks = [(i, spec, fold) for i, spec in enumerate(grid) for fold in range(n_folds)]
+        workers = min(workers or os.cpu_count() or 1, len(tasks))
+        task_bytes = training_copy_bytes(grid, int(bounds[-1]), n_folds)
+        memory = available_memory()
+        if task_bytes and memory is not None:
+            fitting = max(int(memory * MEMORY_FRACTION // task_bytes), 1)
+            if fitting < workers:
+                print(f"Processi ridotti da {workers} a {fitting}: ogni copia del training set occupa "
+                      f"circa {task_bytes / 1e6:.0f} MB su {memory / 1e6:.0f} MB disponibili")
+                workers = fitting
+        results = {i: [] for i in range(len(grid))}
+        initargs = (directory, bounds, chunk_size)
+        if workers == 1:
+            global _worker
+            _init_worker(*initargs)
+            for task in tasks:
+                result = _evaluate(task)
+                results[result['candidate']].append(result)
+            _worker = None
+        else:
+            with Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+                for result in pool.imap_unordered(_evaluate, tasks):
+                    results[result['candidate']].append(result)
+        return [summarize(grid[i], results[i]) for i in range(len(grid))], int(bounds[-1])
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def refit(input_path, spec, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Addestra il candidato scelto su tutto il dataset, con i nomi delle feature come train_model.
+
+    LinearRegression e Ridge leggono il dataset a blocchi (come src/models/streaming_train.py);
+    gli altri stimatori lo caricano in memoria.
+    """
+    alpha = statistics_alpha(spec)
+    if alpha is not None:
+        chunks = iter_table(input_path, chunk_size, columns=FEATURES + [TARGET])
+        first = next(chunks, None)
+        if first is None:
+            raise ValueError(f"Nessuna riga in {input_path}")
+        # Adattata su un DataFrame: la pipeline conserva i nomi delle feature
+        expand = _interactions(first[FEATURES]) if spec.get('interactions') else None
+        blocks = ((chunk[FEATURES], chunk[TARGET]) for chunk in itertools.chain([first], chunks))
+        model = fit_from_statistics(spec, blocks, alpha, expand)
+        if expand is None:
+            model.feature_names_in_ = np.array(FEATURES, dtype=object)
+        return model
+
+    df = pd.concat(list(iter_table(input_path, chunk_size, columns=FEATURES + [TARGET])), ignore_index=True)
+    model = build_estimator(spec)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', ConvergenceWarning)
+        model.fit(df[FEATURES], df[TARGET])
+    return model
+
+
+def save_best(model, best, model_dir=MODEL_DIR):
+    """Salva il modello come nuova versione in model-linear-regression/versions/ (caricata dall'API)"""
+    return save_version(model, {'mse': best['mse'], 'r2': best['r2']},
+                        {'candidate': best['name'], 'spec': best['spec']}, model_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confronta più modelli con k-fold e sceglie il migliore entro un budget di latenza")
+    parser.add_argument('--input', default=None,
+                        help="Dataset di training (default: data/processed/user_event_similarity.*)")
+    parser.add_argument('--grid', default=None, help="File JSON con la lista dei candidati (default: griglia predefinita)")
+    parser.add_argument('--alphas', type=float, nargs='+', default=DEFAULT_ALPHAS, help="Alpha di Ridge e Lasso")
+    parser.add_argument('--folds', type=int, default=DEFAULT_FOLDS, help="Numero di fold")
+    parser.add_argument('--workers', type=int, default=None, help="Processi (default: numero di CPU)")
+    parser.add_argument('--seed', type=int, default=42, help="Seed dell'assegnazione dei fold e di SGD")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Righe lette per blocco")
+    parser.add_argument('--latency-budget-us', type=float, default=DEFAULT_LATENCY_BUDGET_US,
+                        help="Latenza massima di predizione per riga, in microsecondi")
+    parser.add_argument('--work-dir', default=None, help="Directory dei file condivisi (default: directory temporanea)")
+    parser.add_argument('--save-best', action='store_true',
+                        help=f"Riaddestra il migliore su tutti i dati e lo salva come nuova versione in {MODEL_DIR}")
+    parser.add_argument('--tracking-uri', default=None, help="URI di tracking MLflow (default: DagsHub o file store locale)")
+    parser.add_argument('--offline', action='store_true', help="Usa solo il tracking locale")
+    parser.add_argument('--report', default=str(REPORT_PATH), help="File JSON con i risultati")
+    args = parser.parse_args()
+    input_path = args.input or find_table(DATASET_BASE_PATH)
+
+    if args.grid:
+        with open(args.grid) as f:
+            grid = json.load(f)
+    else:
+        grid = default_grid(args.alphas, args.seed)
+    for spec in grid:
+        build_estimator(spec)
+
+    start = time.perf_counter()
+    candidates, n_rows = run_sweep(input_path, grid, args.folds, args.workers, args.seed, args.chunk_size, args.work_dir)
+    seconds = time.perf_counter() - start
+    best = select_best(candidates, args.latency_budget_us)
+
+    print(f"\n{'candidato':<36} {'MSE':>12} {'R2':>8} {'fit s':>8} {'µs/riga':>8} {'byte':>8}")
+    for c in sorted(candidates, key=lambda c: c['mse']):
+        marker = ' *' if c is best else ('' if c['predict_us_per_row'] <= args.latency_budget_us else ' (lento)')
+        print(f"{c['name']:<36} {c['mse']:>12.6g} {c['r2']:>8.4f} {c['fit_seconds']:>8.2f} "
+              f"{c['predict_us_per_row']:>8.3f} {c['artifact_bytes']:>8.0f}{marker}")
+    print(f"\n{len(candidates)} candidati x {args.folds} fold su {n_rows} righe in {seconds:.1f}s")
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'input': str(input_path),
+        'rows': n_rows,
+        'folds': args.folds,
+        'seed': args.seed,
+        'latency_budget_us': args.latency_budget_us,
+        'seconds': seconds,
+        'best': best['name'] if best else None,
+        'candidates': candidates,
+    }
+    if best is None:
+        print(f"Nessun candidato entro il budget di {args.latency_budget_us} µs per riga")
+    else:
+        print(f"Migliore entro {args.latency_budget_us} µs per riga: {best['name']} (MSE {best['mse']:.6g}, R2 {best['r2']:.4f})")
+        if args.save_best:
+            version_dir = save_best(refit(input_path, best['spec'], args.chunk_size), best)
+            report['saved_version'] = str(version_dir)
+            print(f"Modello salvato in: {version_dir}")
+
+    report_path = Path(args.report)
+    report_path.parent.mkdir(exist_ok=True, parents=True)
+    report_path.write_text(json.dumps(report, indent=2))
+    print(f"Report salvato in: {report_path}")
+
+    tracker = open_tracker(args.tracking_uri, EXPERIMENT_NAME, args.offline)
+    parent_id = tracker.log_run(
+        'Model-Sweep',
+        {'input': input_path, 'folds': args.folds, 'seed': args.seed, 'candidates': len(candidates),
+         'latency_budget_us': args.latency_budget_us, 'best': report['best']},
+        {'seconds': seconds, **({'best_mse': best['mse'], 'best_r2': best['r2']} if best else {})},
+        artifacts=[report_path],
+    )
+    for c in candidates:
+        params = {'model_type': c['spec']['estimator'], 'interactions': bool(c['spec'].get('interactions')),
+                  **c['spec'].get('params', {})}
+        metrics = {key: c[key] for key in ('mse', 'mse_std', 'r2', 'fit_seconds', 'predict_us_per_row', 'artifact_bytes')}
+        tracker.log_run(c['name'], params, metrics, parent_id=parent_id)
+    print(f"Run registrate in: {tracker.uri}")
+
+    if best is None:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
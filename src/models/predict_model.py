@@ -1,13 +1,18 @@
+import argparse
 import pandas as pd
 import numpy as np
-import pickle
-import joblib
 from pathlib import Path
-from sklearn.metrics import mean_squared_error, r2_score
+from src.data.storage import TableWriter, find_table, iter_table, read_table, write_table
+
+FEATURES = ['region_match', 'user_likes_for_category', 'event_popularity']
+
+# Righe lette, predette e scritte per blocco nello scoring in streaming
+DEFAULT_CHUNK_SIZE = 100_000
 
 
 def load_model_pickle():
     """Carica il modello salvato con pickle"""
+    import pickle
     model_path = Path('model-linear-regression') / 'linear_regression_model.pkl'
     with open(model_path, 'rb') as f:
         model = pickle.load(f)
@@ -16,6 +21,7 @@ def load_model_pickle():
 
 def load_model_joblib():
     """Carica il modello salvato con joblib"""
+    import joblib
     model_path = Path('model-linear-regression') / 'linear_regression_model.joblib'
     model = joblib.load(model_path)
     return model
@@ -23,6 +29,8 @@ def load_model_joblib():
 
 def evaluate_predictions(y_true, y_pred):
     """Valuta le predizioni utilizzando MSE e R2"""
+    # sklearn.metrics importa scipy: lo carica solo chi valuta in memoria
+    from sklearn.metrics import mean_squared_error, r2_score
     mse = mean_squared_error(y_true, y_pred)
     r2 = r2_score(y_true, y_pred)
     
@@ -35,20 +43,90 @@ def evaluate_predictions(y_true, y_pred):
     }
 
 
+class RunningStats:
+    """Media, varianza, minimo e massimo di una variabile aggiornati a blocchi"""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        mean_block = values.mean()
+        m2_block = float(np.sum((values - mean_block) ** 2))
+        self._combine(len(values), mean_block, m2_block, values.min(), values.max())
+
+    def merge(self, other):
+        """Aggiunge le statistiche calcolate su un altro insieme di valori"""
+        if other.n:
+            self._combine(other.n, other.mean, other.m2, other.min, other.max)
+
+    def _combine(self, n_other, mean_other, m2_other, min_other, max_other):
+        # Unione delle statistiche di due insiemi (Chan et al.)
+        n = self.n + n_other
+        delta = mean_other - self.mean
+        self.mean += delta * n_other / n
+        self.m2 += m2_other + delta ** 2 * self.n * n_other / n
+        self.n = n
+        self.min = min(self.min, min_other)
+        self.max = max(self.max, max_other)
+
+    def std(self):
+        """Deviazione standard campionaria (ddof=1, come pandas)"""
+        return np.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else np.nan
+
+
+class StreamingMetrics:
+    """Accumula MSE e R2 a blocchi tramite statistiche sufficienti, senza tenere y_true e y_pred"""
+
+    def __init__(self):
+        self.sse = 0.0
+        self.target = RunningStats()
+
+    def update(self, y_true, y_pred):
+        y_true = np.asarray(y_true, dtype=np.float64)
+        y_pred = np.asarray(y_pred, dtype=np.float64)
+        self.sse += float(np.sum((y_true - y_pred) ** 2))
+        self.target.update(y_true)
+
+    def merge(self, other):
+        self.sse += other.sse
+        self.target.merge(other.target)
+
+    def result(self):
+        n = self.target.n
+        mse = self.sse / n
+        # Stessa convenzione di sklearn quando il target è costante
+        if self.target.m2 == 0:
+            r2 = 1.0 if self.sse == 0 else 0.0
+        else:
+            r2 = 1 - self.sse / self.target.m2
+
+        return {
+            'mse': float(mse),
+            'r2': float(r2)
+        }
+
+
 def predict_and_save(input_data_path=None, output_path=None, evaluate=False):
     """Carica il modello, fa predizioni sui dati di input e salva i risultati"""
     # Carica il modello (puoi scegliere tra pickle o joblib)
     model = load_model_pickle()  # oppure load_model_joblib()
     
-    # Se non è specificato un percorso di input, usa il percorso predefinito
+    # Se non è specificato un percorso di input, usa il percorso predefinito (parquet, feather o csv)
     if input_data_path is None:
-        input_data_path = Path('data/processed/user_event_similarity.csv')
+        input_data_path = find_table('data/processed/user_event_similarity')
     
     # Carica i dati di input
-    df = pd.read_csv(input_data_path)
+    df = read_table(input_data_path)
     
     # Seleziona le feature (le stesse usate durante l'addestramento)
-    X = df[['region_match', 'user_likes_for_category', 'event_popularity']]
+    X = df[FEATURES]
     
     # Effettua la predizione
     predictions = model.predict(X)
@@ -63,37 +141,104 @@ def predict_and_save(input_data_path=None, output_path=None, evaluate=False):
     
     # Se non è specificato un percorso di output, usa il percorso predefinito
     if output_path is None:
-        output_path = Path('data/processed/predictions.csv')
+        output_path = Path('data/processed/predictions.parquet')
+    output_path = Path(output_path)
     
     # Crea la directory di output se non esiste
     output_path.parent.mkdir(exist_ok=True, parents=True)
     
-    # Salva i risultati
-    df.to_csv(output_path, index=False)
+    # Salva i risultati (il formato dipende dall'estensione: .parquet, .feather o .csv)
+    write_table(df, output_path)
     print(f"Predizioni salvate in: {output_path}")
     
     # Salva anche le metriche se disponibili
     if metrics is not None:
-        metrics_path = Path('reports') / 'metrics.csv'
-        metrics_path.parent.mkdir(exist_ok=True, parents=True)
-        pd.DataFrame([metrics]).to_csv(metrics_path, index=False)
-        print(f"Metriche salvate in: {metrics_path}")
+        save_metrics(metrics)
     
     return df, metrics
 
 
+def save_metrics(metrics):
+    """Salva le metriche di valutazione in reports/metrics.csv"""
+    metrics_path = Path('reports') / 'metrics.csv'
+    metrics_path.parent.mkdir(exist_ok=True, parents=True)
+    pd.DataFrame([metrics]).to_csv(metrics_path, index=False)
+    print(f"Metriche salvate in: {metrics_path}")
+
+
+def predict_and_save_streaming(input_data_path=None, output_path=None, evaluate=False,
+                               chunk_size=DEFAULT_CHUNK_SIZE, model=None):
+    """Come predict_and_save, ma legge, predice e scrive un blocco alla volta.
+
+    La memoria dipende da chunk_size e non dalla dimensione del file; ritorna le
+    statistiche delle predizioni al posto del DataFrame completo.
+    """
+    if model is None:
+        model = load_model_pickle()  # oppure load_model_joblib()
+
+    if input_data_path is None:
+        input_data_path = find_table('data/processed/user_event_similarity')
+    if output_path is None:
+        output_path = Path('data/processed/predictions.parquet')
+
+    predicted, streaming_metrics = score_file(model, input_data_path, output_path, chunk_size)
+    print(f"Predizioni salvate in: {output_path}")
+
+    metrics = None
+    if evaluate and streaming_metrics.target.n:
+        metrics = streaming_metrics.result()
+        print(f"Mean Squared Error: {metrics['mse']}")
+        print(f"R2 Score: {metrics['r2']}")
+        save_metrics(metrics)
+
+    return predicted, metrics
+
+
+def score_file(model, input_data_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Predice un file a blocchi e ritorna le statistiche delle predizioni e le metriche accumulate"""
+    output_path = Path(output_path)
+    output_path.parent.mkdir(exist_ok=True, parents=True)
+
+    predicted = RunningStats()
+    streaming_metrics = StreamingMetrics()
+    with TableWriter(output_path) as writer:
+        for chunk in iter_table(input_data_path, chunk_size):
+            predictions = model.predict(chunk[FEATURES])
+            chunk['predicted_score'] = predictions
+            predicted.update(predictions)
+            if 'score' in chunk.columns:
+                streaming_metrics.update(chunk['score'], predictions)
+            writer.write(chunk)
+    return predicted, streaming_metrics
+
+
 def main():
     """Funzione principale"""
+    parser = argparse.ArgumentParser(description="Predizioni sul dataset utente-evento")
+    parser.add_argument('--input', default=None, help="Dataset di input (default: data/processed)")
+    parser.add_argument('--output', default=None, help="File di output (.parquet, .feather o .csv)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Righe per blocco nello scoring in streaming")
+    parser.add_argument('--in-memory', action='store_true',
+                        help="Carica tutto il dataset in memoria invece di procedere a blocchi")
+    args = parser.parse_args()
+
     # Carica i dati, fa predizioni e salva i risultati
-    df, metrics = predict_and_save(evaluate=True)
+    if args.in_memory:
+        df, metrics = predict_and_save(args.input, args.output, evaluate=True)
+        predicted = RunningStats()
+        predicted.update(df['predicted_score'])
+    else:
+        predicted, metrics = predict_and_save_streaming(args.input, args.output, evaluate=True,
+                                                        chunk_size=args.chunk_size)
     
     # Mostra alcune statistiche sulle predizioni
     print("\nStatistiche sulle predizioni:")
-    print(f"Numero di predizioni: {len(df)}")
-    print(f"Media delle predizioni: {df['predicted_score'].mean():.4f}")
-    print(f"Deviazione standard: {df['predicted_score'].std():.4f}")
-    print(f"Min: {df['predicted_score'].min():.4f}")
-    print(f"Max: {df['predicted_score'].max():.4f}")
+    print(f"Numero di predizioni: {predicted.n}")
+    print(f"Media delle predizioni: {predicted.mean:.4f}")
+    print(f"Deviazione standard: {predicted.std():.4f}")
+    print(f"Min: {predicted.min:.4f}")
+    print(f"Max: {predicted.max:.4f}")
     
     # Se sono disponibili le metriche, mostra un riepilogo
     if metrics is not None:
@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """Cache LRU delle predizioni con scadenza (TTL) opzionale, sicura tra thread.
+
+    Le chiavi sono le tuple normalizzate delle feature. clear() invalida tutto,
+    comprese le predizioni ancora in calcolo con il modello precedente.
+    """
+
+    def __init__(self, max_entries=10000, ttl=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get_or_compute(self, key, compute):
+        """Valore in cache per key, altrimenti lo calcola con compute() e lo memorizza"""
+        if not self.enabled:
+            return compute()
+        found, value, generation = self.lookup(key)
+        if found:
+            return value
+        value = compute()
+        self.store(key, value, generation)
+        return value
+
+    def lookup(self, key):
+        """Ritorna (trovato, valore, generazione); la generazione va passata a store().
+
+        Lookup e store separati servono a chi calcola il valore in modo asincrono.
+        """
+        if not self.enabled:
+            return False, None, None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value, self._generation
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return False, None, self._generation
+
+    def store(self, key, value, generation):
+        """Memorizza value calcolato dopo lookup(), se nel frattempo la cache non è stata svuotata"""
+        if not self.enabled:
+            return
+        with self._lock:
+            # Se nel frattempo il modello è stato ricaricato il valore è già vecchio
+            if generation == self._generation:
+                expires_at = self._clock() + self.ttl if self.ttl else None
+                self._entries[key] = (value, expires_at)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+
+    def clear(self):
+        """Svuota la cache (da chiamare quando cambia il modello)"""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+from src.data.features import EVENTS_PATH, USERS_PATH, build_feature_arrays, load_raw_data
+
+FEATURES = ['region_match', 'user_likes_for_category', 'event_popularity']
+
+
+def build_index(users_path=USERS_PATH, events_path=EVENTS_PATH):
+    """Carica i dati grezzi e prepara gli array per le raccomandazioni.
+
+    Per ogni utente la regione e il vettore di like per categoria, per ogni evento
+    regione, categoria e popolarità: le feature utente-evento si ottengono al volo.
+    """
+    users_df, events_df, favorites = load_raw_data(users_path, events_path)
+    arrays = build_feature_arrays(users_df, events_df, favorites)
+    return {
+        # Gli id arrivano come stringhe dall'URL
+        'user_positions': {str(user_id): i for i, user_id in enumerate(arrays['user_ids'].tolist())},
+        'user_region': arrays['user_region'],
+        'user_category_likes': arrays['user_category_likes'].astype(np.int32),
+        'event_ids': arrays['event_ids'],
+        'event_region': arrays['event_region'],
+        'event_category': arrays['event_category'],
+        'event_popularity': arrays['event_popularity'].astype(np.float64),
+    }
+
+
+def event_base_scores(index, linear_params):
+    """Parte del punteggio che dipende solo dall'evento: popolarità pesata più intercetta"""
+    coef, intercept = linear_params
+    return coef[2] * index['event_popularity'] + intercept
+
+
+def score_events(index, user_position, model=None, linear_params=None, base_scores=None):
+    """Punteggio del modello per tutti gli eventi, per un utente, in un solo passaggio vettoriale"""
+    region_match = index['event_region'] == index['user_region'][user_position]
+    likes = index['user_category_likes'][user_position][index['event_category']]
+    if linear_params is not None:
+        coef, _ = linear_params
+        if base_scores is None:
+            base_scores = event_base_scores(index, linear_params)
+        return base_scores + coef[0] * region_match + coef[1] * likes
+    X = pd.DataFrame({
+        'region_match': region_match.astype(np.int64),
+        'user_likes_for_category': likes.astype(np.int64),
+        'event_popularity': index['event_popularity'],
+    }, columns=FEATURES)
+    return model.predict(X)
+
+
+def top_k(scores, k):
+    """Posizioni dei k punteggi più alti, in ordine decrescente"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
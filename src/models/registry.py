@@ -0,0 +1,369 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+from src.models.compact_model import COMPACT_NAME, CompactLinearModel, export_compact
+
+MODEL_DIR = Path('model-linear-regression')
+VERSIONS_DIR = 'versions'
+# Versione fissata da un rollback o da un reload esplicito: vale per tutti i processi
+PIN_NAME = 'pinned_version.json'
+# In ordine di preferenza: il formato compatto si carica senza importare scikit-learn
+ARTIFACT_NAMES = (COMPACT_NAME, 'linear_regression_model.joblib', 'linear_regression_model.pkl')
+FEATURES = ['region_match', 'user_likes_for_category', 'event_popularity']
+
+
+def load_artifact(path):
+    """Carica un modello in formato compatto (.json), joblib o pickle"""
+    path = Path(path)
+    if path.suffix == '.json':
+        return CompactLinearModel.load(path)
+    # pickle e joblib importano scikit-learn durante la lettura: solo se servono
+    if path.suffix == '.pkl':
+        import pickle
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    import joblib
+    return joblib.load(path)
+
+
+def extract_linear_params(model, features=FEATURES):
+    """Coefficienti (nell'ordine di features) e intercetta di un modello lineare, None per gli altri modelli"""
+    coef = getattr(model, 'coef_', None)
+    intercept = getattr(model, 'intercept_', None)
+    if coef is None or intercept is None or np.ndim(coef) != 1 or np.ndim(intercept) != 0:
+        return None
+    names = list(getattr(model, 'feature_names_in_', features))
+    if sorted(names) != sorted(features):
+        return None
+    coef = np.asarray(coef, dtype=np.float64)[[names.index(f) for f in features]]
+    return coef, float(intercept)
+
+
+def save_version(model, metrics, metadata=None, directory=MODEL_DIR):
+    """Salva il modello come nuova versione in versions/<timestamp>/ e ritorna la directory.
+
+    I file sono scritti in una directory temporanea (nascosta, ignorata da available_versions)
+    rinominata alla fine: chi legge versions/ non vede mai una versione scritta a metà.
+    """
+    import joblib
+    # Microsecondi: due salvataggi nello stesso secondo (es. sweep e train_model) non collidono
+    version = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+    versions_dir = Path(directory) / VERSIONS_DIR
+    versions_dir.mkdir(parents=True, exist_ok=True)
+    version_dir = versions_dir / version
+    tmp = Path(tempfile.mkdtemp(dir=versions_dir, prefix=f'.{version}-'))
+    try:
+        joblib.dump(model, tmp / 'linear_regression_model.joblib')
+        # Il formato compatto esiste solo per i modelli lineari sulle feature originali
+        if extract_linear_params(model) is not None:
+            export_compact(model, tmp / COMPACT_NAME, metrics)
+        with open(tmp / 'metadata.json', 'w') as f:
+            json.dump({'version': version, 'features': FEATURES,
+                       **{name: float(value) for name, value in metrics.items()}, **(metadata or {})}, f, indent=2)
+        os.chmod(tmp, 0o755)
+        os.replace(tmp, version_dir)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return version_dir
+
+
+class LoadedModel:
+    """Versione del modello pronta all'uso: non viene mai modificata dopo la creazione"""
+
+    def __init__(self, version, path, model, state, load_seconds):
+        self.version = version
+        self.path = str(path)
+        self.model = model
+        # Dati derivati dal modello calcolati durante il caricamento (es. coefficienti)
+        self.state = state
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+
+    def info(self):
+        return {
+            "version": self.version,
+            "path": self.path,
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+        }
+
+
+class ModelRegistry:
+    """Gestisce le versioni del modello in model-linear-regression/ e la versione attiva.
+
+    Il caricamento avviene in un thread in background: il modello viene letto da disco,
+    preparato e provato con prepare(model), e solo allora sostituisce quello attivo con
+    un'unica assegnazione. Le richieste leggono `active` una volta e usano sempre un
+    modello completo; nessuna richiesta attende l'I/O su disco.
+
+    Rollback e caricamenti espliciti di una versione la fissano in PIN_NAME: load() senza
+    versione e il watcher usano la versione fissata invece della più recente, anche nei
+    processi avviati dopo (es. worker Gunicorn riciclati).
+    """
+
+    def __init__(self, directory=MODEL_DIR, prepare=None, on_swap=None, history_size=5, retry_seconds=30):
+        self.directory = Path(directory)
+        self.prepare = prepare
+        self.on_swap = on_swap
+        self.history_size = history_size
+        self.retry_seconds = retry_seconds
+        self.active = None
+        self._history = []
+        # Versioni abbandonate con un rollback: il watcher non le ricarica da solo
+        self._rolled_back = set()
+        self._lock = threading.Lock()
+        self._loading = None
+        self.last_error = None
+        self._last_failure = 0.0
+        self._watcher = None
+        # Ultimo stato del pin visto da check_pin (mtime, None se assente) e ora del controllo
+        self._pin_mtime = None
+        self._pin_checked = 0.0
+
+    def available_versions(self):
+        """Versioni su disco, dalla più vecchia alla più recente.
+
+        Le versioni salvate da train_model.py stanno in versions/<timestamp>/; il file
+        nella radice della directory (formato precedente) è la versione 'legacy-<mtime>'.
+        """
+        versions = []
+        for artifact in ARTIFACT_NAMES:
+            path = self.directory / artifact
+            if path.exists():
+                versions.append({"version": f"legacy-{int(path.stat().st_mtime)}", "path": str(path)})
+                break
+        versions_dir = self.directory / VERSIONS_DIR
+        if versions_dir.is_dir():
+            for name in sorted(os.listdir(versions_dir)):
+                # Directory temporanee di save_version non ancora completate
+                if name.startswith('.'):
+                    continue
+                for artifact in ARTIFACT_NAMES:
+                    path = versions_dir / name / artifact
+                    if path.exists():
+                        versions.append({"version": name, "path": str(path)})
+                        break
+        return versions
+
+    def _find(self, version):
+        versions = self.available_versions()
+        if not versions:
+            raise FileNotFoundError(f"Nessun modello trovato in {self.directory}")
+        if version is None:
+            return versions[-1]
+        for entry in versions:
+            if entry["version"] == version:
+                return entry
+        raise ValueError(f"Versione del modello non trovata: {version}")
+
+    @property
+    def pin_path(self):
+        return self.directory / PIN_NAME
+
+    def pinned_version(self):
+        """Versione fissata, None se non ce n'è una"""
+        try:
+            with open(self.pin_path) as f:
+                return json.load(f).get('version')
+        except (OSError, ValueError):
+            return None
+
+    def _pin_stat(self):
+        try:
+            return self.pin_path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def _write_pin(self, version):
+        # Senza versione il pin viene rimosso: si torna a seguire la più recente
+        try:
+            if version is None:
+                self.pin_path.unlink(missing_ok=True)
+            else:
+                tmp = self.pin_path.with_name(f'.{PIN_NAME}.tmp')
+                with open(tmp, 'w') as f:
+                    json.dump({'version': version, 'pinned_at': time.time()}, f)
+                os.replace(tmp, self.pin_path)
+        except OSError as e:
+            print(f"Versione fissata non salvata in {self.pin_path} ({e}): vale solo per questo processo")
+        # Questo processo ha già la versione giusta: check_pin non deve ricaricarla
+        self._pin_mtime = self._pin_stat()
+
+    def _target(self):
+        # Versione da attivare: quella fissata se ancora su disco, altrimenti la più recente
+        pinned = self.pinned_version()
+        if pinned is not None:
+            try:
+                return self._find(pinned)
+            except (FileNotFoundError, ValueError):
+                print(f"Versione fissata {pinned} non trovata: uso la più recente")
+        return self._find(None)
+
+    def load(self, version=None, pin=False):
+        """Carica, prepara e attiva una versione (la fissata o la più recente se non specificata).
+
+        Con pin=True la scelta vale anche per gli altri processi: una versione indicata viene
+        fissata, senza versione il pin viene rimosso e si attiva la più recente.
+        """
+        if pin:
+            entry = self._find(version)
+        else:
+            entry = self._find(version) if version is not None else self._target()
+        self._rolled_back.discard(entry["version"])
+        start = time.perf_counter()
+        model = load_artifact(entry["path"])
+        state = self.prepare(model) if self.prepare is not None else None
+        loaded = LoadedModel(entry["version"], entry["path"], model, state, time.perf_counter() - start)
+        if pin:
+            self._write_pin(version)
+        self._swap(loaded)
+        return loaded
+
+    def _swap(self, loaded):
+        with self._lock:
+            if self.active is not None:
+                self._history.append(self.active)
+                del self._history[:-self.history_size]
+            self.active = loaded
+        if self.on_swap is not None:
+            self.on_swap(loaded)
+        print(f"Modello attivo: versione {loaded.version}")
+
+    def load_async(self, version=None, pin=False):
+        """Avvia il caricamento in background; ritorna False se ce n'è già uno in corso"""
+        with self._lock:
+            if self._loading is not None and self._loading.is_alive():
+                return False
+            self._loading = threading.Thread(target=self._load_background, args=(version, pin), daemon=True)
+            self._loading.start()
+        return True
+
+    def _load_background(self, version, pin=False):
+        try:
+            self.load(version, pin)
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            self._last_failure = time.monotonic()
+            print(f"Errore durante il caricamento del modello: {e}")
+
+    def ensure_loading(self):
+        """Se non c'è un modello attivo avvia il caricamento, al più ogni retry_seconds dopo un errore"""
+        if self.active is not None:
+            return
+        if self.last_error is not None and time.monotonic() - self._last_failure < self.retry_seconds:
+            return
+        self.load_async()
+
+    @property
+    def loading(self):
+        return self._loading is not None and self._loading.is_alive()
+
+    def rollback(self):
+        """Riattiva la versione precedente (già in memoria, senza leggere da disco) e la fissa"""
+        with self._lock:
+            if not self._history:
+                raise ValueError("Nessuna versione precedente a cui tornare")
+            previous = self._history.pop()
+            self._rolled_back.add(self.active.version)
+            self.active = previous
+        self._write_pin(previous.version)
+        if self.on_swap is not None:
+            self.on_swap(previous)
+        print(f"Rollback alla versione {previous.version}")
+        return previous
+
+    def follow_pin(self):
+        """Attiva la versione fissata se diversa da quella attiva (es. in un worker appena creato)"""
+        pinned = self.pinned_version()
+        active = self.active
+        if pinned is None or (active is not None and active.version == pinned):
+            return None
+        try:
+            return self.load(pinned)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"Versione fissata non caricata: {e}")
+            return None
+
+    def check_pin(self, min_interval=1.0):
+        """Segue i pin scritti da altri processi (rollback o reload in un altro worker).
+
+        Costa un controllo dell'mtime del file, al più ogni min_interval secondi: si può
+        chiamare a ogni richiesta. Il caricamento, se serve, avviene in background.
+        """
+        now = time.monotonic()
+        if now - self._pin_checked < min_interval:
+            return
+        self._pin_checked = now
+        mtime = self._pin_stat()
+        if mtime == self._pin_mtime:
+            return
+        previous, self._pin_mtime = self._pin_mtime, mtime
+        active = self.active
+        pinned = self.pinned_version()
+        if pinned is not None:
+            target = pinned
+        else:
+            # Pin rimosso: si torna alla più recente, anche se abbandonata con un rollback
+            self._rolled_back.clear()
+            try:
+                target = self._find(None)["version"]
+            except (FileNotFoundError, ValueError):
+                return
+        if active is not None and active.version == target:
+            return
+        if not self.load_async(target):
+            # Caricamento già in corso: si riprova al prossimo controllo
+            self._pin_mtime = previous
+
+    def start_watcher(self, interval):
+        """Controlla periodicamente la directory e carica le nuove versioni in background.
+
+        Se c'è una versione fissata il watcher segue quella (anche un rollback fatto in un
+        altro processo) invece della più recente.
+        """
+        def watch():
+            was_pinned = self.pinned_version() is not None
+            while True:
+                time.sleep(interval)
+                try:
+                    pinned = self.pinned_version()
+                    target = self._target()["version"]
+                except Exception:
+                    continue
+                active = self.active
+                if pinned is not None and target == pinned:
+                    was_pinned = True
+                    if active is None or active.version != pinned:
+                        self.load_async(pinned)
+                    continue
+                # Pin rimosso (reload senza versione): si torna alla più recente, anche se abbandonata
+                if was_pinned and pinned is None:
+                    was_pinned = False
+                    self._rolled_back.clear()
+                    if active is None or target != active.version:
+                        self.load_async(target)
+                    continue
+                skip = self._rolled_back | {loaded.version for loaded in self._history}
+                if active is None or (target != active.version and target not in skip):
+                    self.load_async(target)
+
+        self._watcher = threading.Thread(target=watch, daemon=True)
+        self._watcher.start()
+
+    def status(self):
+        active = self.active
+        return {
+            "active": active.info() if active is not None else None,
+            "previous": [loaded.version for loaded in reversed(self._history)],
+            "pinned": self.pinned_version(),
+            "loading": self.loading,
+            "last_error": self.last_error,
+        }
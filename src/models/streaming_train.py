@@ -0,0 +1,206 @@
+"""
+Addestramento della regressione lineare a blocchi, senza caricare il dataset in memoria.
+
+Per ogni blocco si aggiornano numero di righe, medie e co-momenti centrati di feature e
+target (X^T X, X^T y e y^T y sui dati centrati): i minimi quadrati dipendono solo da
+queste statistiche, quindi coefficienti e metriche sul test set si ottengono senza
+rileggere i dati. La memoria dipende solo da chunk_size.
+
+La divisione train/test è deterministica: ogni riga va nel test set in base all'hash di
+(user_id, event_id), indipendentemente dall'ordine delle righe e dalla dimensione dei blocchi.
+
+Le statistiche si salvano in TRAINING_STATE_NAME: con warm start vengono ricaricate e
+i nuovi dati si aggiungono a quelli già visti senza rileggerli.
+"""
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from src.data.storage import iter_table
+
+FEATURES = ['region_match', 'user_likes_for_category', 'event_popularity']
+TARGET = 'score'
+
+# Righe lette per blocco
+DEFAULT_CHUNK_SIZE = 500_000
+
+# Colonne il cui hash decide se una riga va nel test set
+SPLIT_KEYS = ['user_id', 'event_id']
+SPLIT_BUCKETS = 10_000
+
+TRAINING_STATE_NAME = 'training_state.npz'
+
+
+class NormalEquations:
+    """Statistiche sufficienti dei minimi quadrati, aggiornate a blocchi (Chan et al.)"""
+
+    def __init__(self, n_features):
+        self.n = 0
+        self.mean_x = np.zeros(n_features)
+        self.mean_y = 0.0
+        self.sxx = np.zeros((n_features, n_features))
+        self.sxy = np.zeros(n_features)
+        self.syy = 0.0
+
+    def update(self, X, y):
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if len(y) == 0:
+            return
+        mean_x = X.mean(axis=0)
+        mean_y = y.mean()
+        Xc = X - mean_x
+        yc = y - mean_y
+        self._combine(len(y), mean_x, mean_y, Xc.T @ Xc, Xc.T @ yc, float(yc @ yc))
+
+    def merge(self, other):
+        """Aggiunge le statistiche calcolate su un altro insieme di righe"""
+        if other.n:
+            self._combine(other.n, other.mean_x, other.mean_y, other.sxx, other.sxy, other.syy)
+
+    def _combine(self, n_other, mean_x, mean_y, sxx, sxy, syy):
+        n = self.n + n_other
+        dx = mean_x - self.mean_x
+        dy = mean_y - self.mean_y
+        weight = self.n * n_other / n
+        self.sxx = self.sxx + sxx + weight * np.outer(dx, dx)
+        self.sxy = self.sxy + sxy + weight * dx * dy
+        self.syy += syy + weight * dy * dy
+        self.mean_x = self.mean_x + dx * n_other / n
+        self.mean_y += dy * n_other / n
+        self.n = n
+
+    def solve(self, alpha=0.0):
+        """Coefficienti e intercetta dei minimi quadrati (come LinearRegression con fit_intercept).
+
+        Con alpha > 0 la soluzione è quella di Ridge(alpha): l'intercetta non è penalizzata.
+        """
+        if self.n == 0:
+            raise ValueError("Nessuna riga di training")
+        # lstsq gestisce anche feature costanti o collineari (soluzione a norma minima)
+        coef = np.linalg.lstsq(self.sxx + alpha * np.eye(len(self.sxx)), self.sxy, rcond=None)[0]
+        intercept = self.mean_y - self.mean_x @ coef
+        return coef, float(intercept)
+
+    def evaluate(self, coef, intercept):
+        """MSE e R2 di un modello lineare su queste righe, calcolati dalle sole statistiche"""
+        offset = self.mean_y - self.mean_x @ coef - intercept
+        sse = self.syy - 2 * coef @ self.sxy + coef @ self.sxx @ coef + self.n * offset ** 2
+        sse = max(float(sse), 0.0)
+        # Stessa convenzione di sklearn quando il target è costante
+        if self.syy == 0:
+            r2 = 1.0 if sse == 0 else 0.0
+        else:
+            r2 = 1 - sse / self.syy
+        return {
+            'mse': sse / self.n,
+            'r2': float(r2)
+        }
+
+    def to_arrays(self, prefix):
+        return {
+            f'{prefix}_n': np.array(self.n),
+            f'{prefix}_mean_x': self.mean_x,
+            f'{prefix}_mean_y': np.array(self.mean_y),
+            f'{prefix}_sxx': self.sxx,
+            f'{prefix}_sxy': self.sxy,
+            f'{prefix}_syy': np.array(self.syy),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        stats = cls(len(arrays[f'{prefix}_mean_x']))
+        stats.n = int(arrays[f'{prefix}_n'])
+        stats.mean_x = np.array(arrays[f'{prefix}_mean_x'], dtype=np.float64)
+        stats.mean_y = float(arrays[f'{prefix}_mean_y'])
+        stats.sxx = np.array(arrays[f'{prefix}_sxx'], dtype=np.float64)
+        stats.sxy = np.array(arrays[f'{prefix}_sxy'], dtype=np.float64)
+        stats.syy = float(arrays[f'{prefix}_syy'])
+        return stats
+
+
+def row_hashes(chunk, seed=42):
+    """Hash (uint64) dei valori di SPLIT_KEYS di ogni riga, indipendente da ordine e blocchi"""
+    hashes = pd.util.hash_pandas_object(chunk[SPLIT_KEYS], index=False, hash_key=f'{seed:016d}'[-16:])
+    return hashes.to_numpy()
+
+
+def split_mask(chunk, test_fraction, seed=42):
+    """True per le righe del test set: dipende solo dai valori di SPLIT_KEYS della riga"""
+    if test_fraction <= 0:
+        return np.zeros(len(chunk), dtype=bool)
+    return row_hashes(chunk, seed) % SPLIT_BUCKETS < round(test_fraction * SPLIT_BUCKETS)
+
+
+class TrainingState:
+    """Statistiche di train e test accumulate finora, con i parametri della divisione"""
+
+    def __init__(self, test_fraction=0.2, seed=42, features=FEATURES):
+        self.features = list(features)
+        self.test_fraction = test_fraction
+        self.seed = seed
+        self.train = NormalEquations(len(self.features))
+        self.test = NormalEquations(len(self.features))
+
+    def update(self, chunk):
+        mask = split_mask(chunk, self.test_fraction, self.seed)
+        X = chunk[self.features].to_numpy(dtype=np.float64)
+        y = chunk[TARGET].to_numpy(dtype=np.float64)
+        self.train.update(X[~mask], y[~mask])
+        self.test.update(X[mask], y[mask])
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # np.savez aggiunge .npz se manca: si scrive su un file aperto per mantenere il nome
+        with open(path, 'wb') as f:
+            np.savez(f, features=np.array(self.features), test_fraction=np.array(self.test_fraction),
+                     seed=np.array(self.seed), **self.train.to_arrays('train'), **self.test.to_arrays('test'))
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            state = cls(float(arrays['test_fraction']), int(arrays['seed']), arrays['features'].tolist())
+            state.train = NormalEquations.from_arrays(arrays, 'train')
+            state.test = NormalEquations.from_arrays(arrays, 'test')
+        return state
+
+
+def make_linear_model(coef, intercept, features=FEATURES):
+    """LinearRegression di scikit-learn con i parametri dati, come se fosse stata addestrata con fit"""
+    from sklearn.linear_model import LinearRegression
+    model = LinearRegression()
+    model.coef_ = np.asarray(coef, dtype=np.float64)
+    model.intercept_ = np.float64(intercept)
+    model.feature_names_in_ = np.array(features, dtype=object)
+    model.n_features_in_ = len(features)
+    return model
+
+
+def fit_streaming(input_path, chunk_size=DEFAULT_CHUNK_SIZE, test_fraction=0.2, seed=42, state=None):
+    """Legge input_path a blocchi e ritorna (modello, metriche sul test set, stato, esempio di input).
+
+    Con state (warm start) le nuove righe si aggiungono alle statistiche già accumulate;
+    divisione e feature devono essere le stesse dello stato.
+    """
+    if state is None:
+        state = TrainingState(test_fraction, seed)
+    elif (state.test_fraction, state.seed, state.features) != (test_fraction, seed, FEATURES):
+        raise ValueError(
+            f"Stato di training incompatibile: test_fraction={state.test_fraction}, seed={state.seed}, "
+            f"feature={state.features}"
+        )
+
+    example = None
+    for chunk in iter_table(input_path, chunk_size, columns=SPLIT_KEYS + FEATURES + [TARGET]):
+        state.update(chunk)
+        if example is None and len(chunk):
+            example = chunk[FEATURES].iloc[:2].reset_index(drop=True)
+    if example is None:
+        raise ValueError(f"Nessuna riga nel dataset {input_path}")
+
+    coef, intercept = state.train.solve()
+    model = make_linear_model(coef, intercept)
+    # Senza test set le metriche sono calcolate sulle righe di training
+    metrics = (state.test if state.test.n else state.train).evaluate(coef, intercept)
+    return model, metrics, state, example
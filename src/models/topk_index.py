@@ -0,0 +1,274 @@
+"""
+Raccomandazioni top-K precalcolate per tutti gli utenti, in un file letto con mmap dall'API.
+
+    python -m src.models.topk_index --k 50 --workers 4
+    python -m src.models.topk_index --benchmark
+
+Il job usa le stesse feature di make_dataset (src/data/features.py) e il modello più
+recente in model-linear-regression/: per ogni blocco di utenti calcola i punteggi di tutti
+gli eventi e ne tiene i migliori K. I blocchi sono divisi tra più processi, che scrivono
+ognuno la propria parte del file.
+
+Formato del file (little endian, tutte le sezioni allineate a 8 byte):
+- intestazione di HEADER_SIZE byte (HEADER_DTYPE): formato, K, numero di utenti,
+  versione del modello, data e durata della costruzione;
+- id degli utenti (int64) in ordine crescente: la posizione di un utente si trova con
+  una ricerca binaria;
+- un record a larghezza fissa per utente, nello stesso ordine: numero di eventi validi,
+  K id evento (int64, -1 se mancanti) e K punteggi (float64) in ordine decrescente.
+
+L'API apre il file con mmap e legge i record direttamente dalle pagine mappate, senza
+parsing: i worker Gunicorn condividono la page cache del sistema operativo. Aprire
+l'indice non importa pandas: le feature (src/data/features.py) servono solo alla costruzione.
+"""
+import argparse
+import json
+import mmap
+import os
+import time
+from multiprocessing import Pool
+from pathlib import Path
+import numpy as np
+from src.models.registry import MODEL_DIR, ModelRegistry, extract_linear_params
+
+INDEX_PATH = Path('data') / 'recommendations' / 'top_k.bin'
+REPORT_PATH = Path('reports') / 'topk_index.json'
+
+MAGIC = b'EVTOPK\x00\x01'
+FORMAT_VERSION = 1
+HEADER_SIZE = 128
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('format_version', '<u4'),
+    ('k', '<u4'),
+    ('n_users', '<u8'),
+    ('created_at', '<f8'),
+    ('build_seconds', '<f8'),
+    ('model_version', 'S64'),
+])
+
+DEFAULT_K = 50
+# Utenti per blocco: la matrice dei punteggi di un blocco ha USER_BLOCK x eventi elementi
+USER_BLOCK = 256
+
+
+def record_dtype(k):
+    return np.dtype([('count', '<u8'), ('event_ids', '<i8', (k,)), ('scores', '<f8', (k,))])
+
+
+def _layout(k, n_users):
+    """Offset degli id utente e dei record nel file, e dimensione totale"""
+    ids_offset = HEADER_SIZE
+    records_offset = ids_offset + 8 * n_users
+    return ids_offset, records_offset, records_offset + record_dtype(k).itemsize * n_users
+
+
+class TopKIndex:
+    """Indice aperto in sola lettura: gli array sono viste sulle pagine mappate del file"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = np.frombuffer(self._mmap, dtype=HEADER_DTYPE, count=1)[0]
+        if header['magic'] != MAGIC or header['format_version'] != FORMAT_VERSION:
+            raise ValueError(f"{path} non è un indice top-K (formato {FORMAT_VERSION})")
+        self.k = int(header['k'])
+        self.n_users = int(header['n_users'])
+        self.model_version = header['model_version'].decode()
+        self.created_at = float(header['created_at'])
+        ids_offset, records_offset, size = _layout(self.k, self.n_users)
+        if len(self._mmap) != size:
+            raise ValueError(f"{path}: dimensione {len(self._mmap)} diversa da quella attesa {size}")
+        self.user_ids = np.frombuffer(self._mmap, dtype='<i8', count=self.n_users, offset=ids_offset)
+        self.records = np.frombuffer(self._mmap, dtype=record_dtype(self.k), count=self.n_users,
+                                     offset=records_offset)
+        self.mtime_ns = os.stat(path).st_mtime_ns
+
+    def lookup(self, user_id, k=None):
+        """(id evento, punteggi) dei primi k eventi dell'utente, None se l'utente non è nell'indice"""
+        position = int(np.searchsorted(self.user_ids, user_id))
+        if position == self.n_users or self.user_ids[position] != user_id:
+            return None
+        record = self.records[position]
+        count = int(record['count']) if k is None else min(int(record['count']), k)
+        return record['event_ids'][:count], record['scores'][:count]
+
+    def info(self):
+        return {
+            'path': self.path,
+            'k': self.k,
+            'users': self.n_users,
+            'model_version': self.model_version,
+            'created_at': self.created_at,
+            'size_bytes': len(self._mmap),
+        }
+
+
+def block_scores(arrays, users, model=None, linear_params=None):
+    """Punteggi (utenti del blocco x eventi) con le feature di make_dataset"""
+    if linear_params is not None:
+        # Stesse operazioni, nello stesso ordine, di recommend.score_events: punteggi identici a /recommend
+        coef, intercept = linear_params
+        base = coef[2] * arrays['event_popularity'].astype(np.float64) + intercept
+        region_match = arrays['user_region'][users][:, None] == arrays['event_region'][None, :]
+        likes = arrays['user_category_likes'][users][:, arrays['event_category']]
+        return base[None, :] + coef[0] * region_match + coef[1] * likes
+    from src.data.features import compute_tile
+    tile = compute_tile(arrays, users)
+    scores = model.predict(tile[['region_match', 'user_likes_for_category', 'event_popularity']])
+    return np.asarray(scores, dtype=np.float64).reshape(len(users), len(arrays['event_ids']))
+
+
+def block_top_k(scores, k):
+    """Posizioni dei k punteggi più alti di ogni riga, in ordine decrescente (come recommend.top_k)"""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((len(scores), 0), dtype=np.intp)
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+# Dati visti da ogni processo worker della costruzione
+_worker = None
+
+
+def _init_worker(arrays, model, linear_params, path, k, n_users):
+    global _worker
+    _, records_offset, _ = _layout(k, n_users)
+    records = np.memmap(path, dtype=record_dtype(k), mode='r+', offset=records_offset, shape=(n_users,))
+    _worker = (arrays, model, linear_params, records, k)
+
+
+def _build_block(task):
+    start, positions = task
+    arrays, model, linear_params, records, k = _worker
+    scores = block_scores(arrays, positions, model, linear_params)
+    best = block_top_k(scores, k)
+    count = best.shape[1]
+    block = np.zeros(len(positions), dtype=records.dtype)
+    block['count'] = count
+    block['event_ids'][:] = -1
+    block['event_ids'][:, :count] = arrays['event_ids'][best]
+    block['scores'][:, :count] = np.take_along_axis(scores, best, axis=1)
+    records[start:start + len(positions)] = block
+    return len(positions)
+
+
+def build_index(output_path=INDEX_PATH, k=DEFAULT_K, users_path=None, events_path=None,
+                model_dir=MODEL_DIR, model_version=None, workers=None, block_size=USER_BLOCK):
+    """Calcola i top-K di tutti gli utenti e scrive l'indice; ritorna un riepilogo della costruzione"""
+    from src.data.features import EVENTS_PATH, USERS_PATH, build_feature_arrays, load_raw_data
+    start = time.perf_counter()
+    loaded = ModelRegistry(model_dir).load(model_version)
+    linear_params = extract_linear_params(loaded.model)
+    users_df, events_df, favorites = load_raw_data(users_path or USERS_PATH, events_path or EVENTS_PATH)
+    arrays = build_feature_arrays(users_df, events_df, favorites)
+    if not all(np.issubdtype(arrays[name].dtype, np.integer) for name in ('user_ids', 'event_ids')):
+        raise ValueError("L'indice top-K richiede id numerici interi per utenti ed eventi")
+    load_seconds = time.perf_counter() - start
+
+    # Id ordinati per la ricerca binaria; a parità di id vale l'ultima occorrenza (come in /recommend)
+    user_ids = arrays['user_ids'].astype(np.int64)
+    unique_ids, last = np.unique(user_ids[::-1], return_index=True)
+    positions = len(user_ids) - 1 - last
+    n_users = len(unique_ids)
+    k = max(int(k), 1)
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    # Il file nuovo sostituisce il vecchio solo quando è completo: chi lo ha già mappato continua a leggere il vecchio
+    tmp_path = output_path.with_name(output_path.name + '.tmp')
+    ids_offset, _, size = _layout(k, n_users)
+    with open(tmp_path, 'wb') as f:
+        f.truncate(size)
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header[0] = (MAGIC, FORMAT_VERSION, k, n_users, time.time(), 0.0, loaded.version.encode())
+    with open(tmp_path, 'r+b') as f:
+        f.write(header.tobytes().ljust(HEADER_SIZE, b'\0'))
+        f.seek(ids_offset)
+        f.write(unique_ids.astype('<i8').tobytes())
+
+    tasks = [(i, positions[i:i + block_size]) for i in range(0, n_users, block_size)]
+    workers = workers or os.cpu_count() or 1
+    compute_start = time.perf_counter()
+    initargs = (arrays, None if linear_params else loaded.model, linear_params, tmp_path, k, n_users)
+    if workers == 1:
+        global _worker
+        _init_worker(*initargs)
+        for task in tasks:
+            _build_block(task)
+        _worker = None
+    else:
+        with Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+            for _ in pool.imap_unordered(_build_block, tasks):
+                pass
+    compute_seconds = time.perf_counter() - compute_start
+
+    build_seconds = time.perf_counter() - start
+    header['build_seconds'] = build_seconds
+    with open(tmp_path, 'r+b') as f:
+        f.write(header.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, output_path)
+
+    return {
+        'path': str(output_path),
+        'model_version': loaded.version,
+        'users': n_users,
+        'events': len(arrays['event_ids']),
+        'k': k,
+        'workers': workers,
+        'load_seconds': load_seconds,
+        'compute_seconds': compute_seconds,
+        'build_seconds': build_seconds,
+        'users_per_s': n_users / compute_seconds if compute_seconds else None,
+        'size_bytes': size,
+    }
+
+
+def benchmark_lookup(path=INDEX_PATH, lookups=100_000, seed=42):
+    """Latenza media di una ricerca nell'indice (utenti estratti a caso tra quelli presenti)"""
+    index = TopKIndex(path)
+    user_ids = np.random.default_rng(seed).choice(index.user_ids, lookups).tolist()
+    start = time.perf_counter()
+    for user_id in user_ids:
+        index.lookup(user_id)
+    return (time.perf_counter() - start) / lookups
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precalcola i top-K eventi di ogni utente in un indice per l'API")
+    parser.add_argument('--k', type=int, default=DEFAULT_K, help="Eventi salvati per utente")
+    parser.add_argument('--output', default=str(INDEX_PATH), help="File dell'indice")
+    parser.add_argument('--users', default=None, help="CSV degli utenti (default: data/raw)")
+    parser.add_argument('--events', default=None, help="CSV degli eventi (default: data/raw)")
+    parser.add_argument('--model-dir', default=str(MODEL_DIR), help="Directory dei modelli")
+    parser.add_argument('--model-version', default=None, help="Versione del modello (default: la più recente)")
+    parser.add_argument('--workers', type=int, default=None, help="Processi (default: numero di CPU)")
+    parser.add_argument('--block-size', type=int, default=USER_BLOCK, help="Utenti per blocco")
+    parser.add_argument('--report', default=str(REPORT_PATH), help="File JSON con il riepilogo della costruzione")
+    parser.add_argument('--benchmark', action='store_true', help="Misura la latenza delle ricerche dopo la costruzione")
+    args = parser.parse_args()
+
+    summary = build_index(args.output, args.k, args.users, args.events, args.model_dir, args.model_version,
+                          args.workers, args.block_size)
+    if args.benchmark:
+        summary['lookup_us'] = benchmark_lookup(args.output) * 1e6
+    print(f"Indice top-{summary['k']} di {summary['users']} utenti x {summary['events']} eventi "
+          f"(modello {summary['model_version']}) in {summary['build_seconds']:.1f}s "
+          f"({summary['compute_seconds']:.1f}s di calcolo con {summary['workers']} processi, "
+          f"{summary['users_per_s']:,.0f} utenti/s)")
+    print(f"Dimensione: {summary['size_bytes'] / 1e6:.1f} MB in {summary['path']}")
+    if 'lookup_us' in summary:
+        print(f"Ricerca: {summary['lookup_us']:.1f} µs per utente")
+
+    report_path = Path(args.report)
+    report_path.parent.mkdir(exist_ok=True, parents=True)
+    report_path.write_text(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
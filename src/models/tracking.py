@@ -0,0 +1,100 @@
+"""
+Tracciamento degli esperimenti con fallback locale.
+
+- MLflow su DagsHub se mlflow è installato e USERNAME/PASSWORD sono impostate;
+- altrimenti MLflow su un file store locale (LOCAL_TRACKING_DIR, consultabile con `mlflow ui`);
+- senza mlflow, un file JSON per run in LOCAL_RUNS_DIR.
+
+Se il server remoto non risponde si passa al file store locale, così gli esperimenti
+girano anche offline.
+"""
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+
+REMOTE_TRACKING_URI = "https://dagshub.com/giuliodepascale/eventlyML.mlflow"
+LOCAL_TRACKING_DIR = Path('mlruns')
+LOCAL_RUNS_DIR = Path('reports') / 'tracking'
+
+
+class MlflowTracker:
+    def __init__(self, uri, experiment=None):
+        import mlflow
+        self.mlflow = mlflow
+        self.uri = uri
+        mlflow.set_tracking_uri(uri)
+        if experiment:
+            mlflow.set_experiment(experiment)
+
+    def log_run(self, name, params, metrics, artifacts=(), parent_id=None):
+        """Registra una run completa e ne ritorna l'id"""
+        tags = {'mlflow.parentRunId': parent_id} if parent_id else None
+        with self.mlflow.start_run(run_name=name, nested=parent_id is not None, tags=tags) as run:
+            self.mlflow.log_params(params)
+            self.mlflow.log_metrics(metrics)
+            for path in artifacts:
+                self.mlflow.log_artifact(str(path))
+        return run.info.run_id
+
+
+class FileTracker:
+    """Run salvate come file JSON: stesso contenuto di MLflow (parametri, metriche, artefatti)"""
+
+    def __init__(self, directory=LOCAL_RUNS_DIR, experiment=None):
+        self.directory = Path(directory) / (experiment or 'default')
+        self.uri = self.directory.resolve().as_uri()
+
+    def log_run(self, name, params, metrics, artifacts=(), parent_id=None):
+        run_id = uuid.uuid4().hex
+        self.directory.mkdir(parents=True, exist_ok=True)
+        run = {
+            'run_id': run_id,
+            'run_name': name,
+            'parent_run_id': parent_id,
+            'start_time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'params': {key: str(value) for key, value in params.items()},
+            'metrics': {key: float(value) for key, value in metrics.items()},
+            'artifacts': [str(path) for path in artifacts],
+        }
+        (self.directory / f"{run['start_time'].replace(':', '')}-{run_id[:8]}.json").write_text(json.dumps(run, indent=2))
+        return run_id
+
+
+def _credentials():
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    return os.getenv('USERNAME'), os.getenv('PASSWORD')
+
+
+def open_tracker(uri=None, experiment=None, offline=False):
+    """Tracker per uri (o quello di default), con fallback locale se il server non è raggiungibile"""
+    try:
+        import mlflow  # noqa: F401
+    except ImportError:
+        print(f"mlflow non installato: run salvate in {LOCAL_RUNS_DIR}")
+        return FileTracker(LOCAL_RUNS_DIR, experiment)
+
+    local_uri = LOCAL_TRACKING_DIR.resolve().as_uri()
+    # MLflow 3 accetta il file store solo su richiesta esplicita
+    os.environ.setdefault('MLFLOW_ALLOW_FILE_STORE', 'true')
+    username, password = _credentials()
+    if uri is None:
+        uri = REMOTE_TRACKING_URI if username and password and not offline else local_uri
+    if uri == REMOTE_TRACKING_URI:
+        os.environ["MLFLOW_TRACKING_USERNAME"] = username or ''
+        os.environ["MLFLOW_TRACKING_PASSWORD"] = password or ''
+        # Pochi tentativi: offline si passa subito al file store locale
+        os.environ.setdefault('MLFLOW_HTTP_REQUEST_MAX_RETRIES', '1')
+        os.environ.setdefault('MLFLOW_HTTP_REQUEST_TIMEOUT', '20')
+    try:
+        return MlflowTracker(uri, experiment)
+    except Exception as e:
+        if uri == local_uri:
+            raise
+        print(f"Tracking su {uri} non disponibile ({type(e).__name__}: {e}): uso {local_uri}")
+        return MlflowTracker(local_uri, experiment)
@@ -1,3 +1,4 @@
+import argparse
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.linear_model import LinearRegression
@@ -10,75 +11,156 @@ import pickle
 import joblib
 from pathlib import Path
 from dotenv import load_dotenv
+from src.data.storage import find_table, read_table
+from src.models.compact_model import COMPACT_NAME, export_compact
+from src.models.registry import save_version
+from src.models.streaming_train import DEFAULT_CHUNK_SIZE, TRAINING_STATE_NAME, TrainingState, fit_streaming
 
 load_dotenv()
 mlflow.set_tracking_uri("https://dagshub.com/giuliodepascale/eventlyML.mlflow")
 os.environ["MLFLOW_TRACKING_USERNAME"] = os.getenv('USERNAME')
 os.environ["MLFLOW_TRACKING_PASSWORD"] = os.getenv('PASSWORD')
 
-# Carica il dataset
-df = pd.read_csv('data/processed/user_event_similarity.csv')
+FEATURES = ['region_match', 'user_likes_for_category', 'event_popularity']
+TARGET = 'score'
 
-# Seleziona le feature e il target
-X = df[['region_match', 'user_likes_for_category', 'event_popularity']]
-y = df['score']
+MODELS_DIR = Path('model-linear-regression')
+DATASET_BASE_PATH = 'data/processed/user_event_similarity'
 
-# Suddividi in train e test
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
-with mlflow.start_run(run_name="Train-Model"):
+def train_in_memory(input_path):
+    """Addestra LinearRegression sul dataset caricato in memoria (train_test_split casuale)"""
+    # Carica il dataset (parquet, feather o csv), leggendo solo le colonne necessarie
+    df = read_table(input_path, columns=FEATURES + [TARGET])
+
+    # Seleziona le feature e il target
+    X = df[FEATURES]
+    y = df[TARGET]
+
+    # Suddividi in train e test
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
     # Inizializza e addestra il modello
     model = LinearRegression()
     model.fit(X_train, y_train)
 
-    # Predici sul test set
+    # Predici sul test set e valuta il modello
     y_pred = model.predict(X_test)
+    metrics = {
+        'mse': mean_squared_error(y_test, y_pred),
+        'r2': r2_score(y_test, y_pred)
+    }
+    return model, metrics, X_test
+
+
+def train_streaming(input_path, chunk_size, test_fraction, seed, warm_start):
+    """Addestra leggendo il dataset a blocchi; con warm_start aggiunge i dati allo stato salvato"""
+    state_path = MODELS_DIR / TRAINING_STATE_NAME
+    state = None
+    if warm_start:
+        if not state_path.exists():
+            raise FileNotFoundError(f"Nessuno stato di training da aggiornare in {state_path}")
+        state = TrainingState.load(state_path)
+        print(f"Warm start da {state_path}: {state.train.n} righe di training e {state.test.n} di test già viste")
+
+    model, metrics, state, example = fit_streaming(input_path, chunk_size, test_fraction, seed, state)
+    state.save(state_path)
+    print(f"Righe di training: {state.train.n}, righe di test: {state.test.n}")
+    print(f"Stato di training salvato in: {state_path}")
+    return model, metrics, example
+
+
+def write_atomic(path, write):
+    """Scrive path con write(percorso temporaneo) e lo rinomina: chi lo legge non lo vede mai a metà"""
+    tmp = path.with_name(f'.{path.name}.tmp')
+    write(tmp)
+    os.replace(tmp, path)
+    return path
+
+
+def save_model(model, mse, r2):
+    """Salva il modello in locale (pickle, joblib, formato compatto e copia versionata) e le metriche"""
+    # Crea la directory del modello se non esiste
+    MODELS_DIR.mkdir(exist_ok=True)
 
-    # Valuta il modello
-    mse = mean_squared_error(y_test, y_pred)
-    r2 = r2_score(y_test, y_pred)
-
-    print(f"Mean Squared Error: {mse}")
-    print(f"R2 Score: {r2}")
-
-    # Log parametri, metriche e modello su MLflow
-    mlflow.log_param("model_type", "LinearRegression")
-    mlflow.log_metric("mse", mse)
-    mlflow.log_metric("r2", r2)
-
-    # Prepara input_example e signature per MLflow
-    input_example = X_test.iloc[:2]
-    signature = infer_signature(X_test, y_pred)
-
-    # Log del modello su MLflow
-    mlflow.sklearn.log_model(model, "model", input_example=input_example, signature=signature)
-    
-    # Salva il modello localmente
-    # Crea la directory 'models' se non esiste
-    models_dir = Path('model-linear-regression')
-    models_dir.mkdir(exist_ok=True)
-    
     # Salva il modello usando pickle
-    pickle_path = models_dir / 'linear_regression_model.pkl'
-    with open(pickle_path, 'wb') as f:
-        pickle.dump(model, f)
-    
+    pickle_path = write_atomic(MODELS_DIR / 'linear_regression_model.pkl', lambda path: path.write_bytes(pickle.dumps(model)))
+
     # Salva il modello anche usando joblib (più efficiente per oggetti grandi)
-    joblib_path = models_dir / 'linear_regression_model.joblib'
-    joblib.dump(model, joblib_path)
-    
-    print(f"\nModello salvato localmente in:\n- {pickle_path}\n- {joblib_path}")
-    
+    joblib_path = write_atomic(MODELS_DIR / 'linear_regression_model.joblib', lambda path: joblib.dump(model, path))
+
+    # Salva il formato compatto (JSON con coefficienti e metriche), caricabile senza scikit-learn
+    compact_path = write_atomic(MODELS_DIR / COMPACT_NAME,
+                                lambda path: export_compact(model, path, {'mse': mse, 'r2': r2}))
+
+    # Salva una copia versionata: l'API la carica in background e permette il rollback
+    version_dir = save_version(model, {'mse': mse, 'r2': r2}, directory=MODELS_DIR)
+
+    print(f"\nModello salvato localmente in:\n- {pickle_path}\n- {joblib_path}\n- {compact_path}\n- {version_dir}")
+
     # Salva anche i metadati del modello
     metadata = {
-        'features': list(X.columns),
+        'features': FEATURES,
         'metrics': {
             'mse': mse,
             'r2': r2
         }
     }
-    
+
     # Salva i metadati come CSV
     metrics_path = Path('reports') / 'training_metrics.csv'
     pd.DataFrame([metadata['metrics']]).to_csv(metrics_path, index=False)
 
+
+def main():
+    parser = argparse.ArgumentParser(description="Addestra il modello di regressione lineare")
+    parser.add_argument('--input', default=None,
+                        help="Dataset di training (default: data/processed/user_event_similarity.*)")
+    parser.add_argument('--streaming', action='store_true',
+                        help="Legge il dataset a blocchi invece di caricarlo in memoria")
+    parser.add_argument('--warm-start', action='store_true',
+                        help=f"Aggiunge --input (obbligatorio, solo i dati nuovi) allo stato salvato in "
+                             f"{MODELS_DIR / TRAINING_STATE_NAME} senza rileggere i dati già visti "
+                             "(implica --streaming)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Righe per blocco")
+    parser.add_argument('--test-fraction', type=float, default=0.2,
+                        help="Quota di righe nel test set (divisione per hash di user_id ed event_id)")
+    parser.add_argument('--seed', type=int, default=42, help="Seed dell'hash della divisione train/test")
+    args = parser.parse_args()
+    # Il dataset completo è già nello stato salvato: rileggerlo conterebbe due volte ogni riga
+    if args.warm_start and args.input is None:
+        parser.error("--warm-start richiede --input con i soli dati non ancora visti")
+    input_path = args.input or find_table(DATASET_BASE_PATH)
+
+    with mlflow.start_run(run_name="Train-Model"):
+        if args.streaming or args.warm_start:
+            model, metrics, sample = train_streaming(input_path, args.chunk_size, args.test_fraction,
+                                                     args.seed, args.warm_start)
+        else:
+            model, metrics, sample = train_in_memory(input_path)
+        mse, r2 = metrics['mse'], metrics['r2']
+
+        print(f"Mean Squared Error: {mse}")
+        print(f"R2 Score: {r2}")
+
+        # Log parametri, metriche e modello su MLflow
+        mlflow.log_param("model_type", "LinearRegression")
+        if args.streaming or args.warm_start:
+            mlflow.log_param("training", "streaming")
+            mlflow.log_param("test_fraction", args.test_fraction)
+            mlflow.log_param("warm_start", args.warm_start)
+        mlflow.log_metric("mse", mse)
+        mlflow.log_metric("r2", r2)
+
+        # Prepara input_example e signature per MLflow
+        input_example = sample.iloc[:2]
+        signature = infer_signature(sample, model.predict(sample))
+
+        # Log del modello su MLflow
+        mlflow.sklearn.log_model(model, "model", input_example=input_example, signature=signature)
+
+        save_model(model, mse, r2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+# Budget di avvio dell'API: oltre questi valori il controllo termina con errore
+MAX_SECONDS_TO_HEALTHY = 2.0
+MAX_IMPORT_RSS_MB = 100.0
+
+# Moduli pesanti che non devono essere importati all'avvio dell'API
+HEAVY_MODULES = ['pandas', 'sklearn', 'scipy', 'pyarrow', 'joblib']
+
+REPORT_PATH = Path('reports') / 'startup_profile.txt'
+
+# Importa l'API in un interprete nuovo e riporta memoria e moduli pesanti caricati
+_IMPORT_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+import src.api
+print(json.dumps({'seconds': time.perf_counter() - start,
+                  'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  'heavy': [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def _env():
+    # Il processo figlio deve poter importare il pacchetto src
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get('PYTHONPATH')])))
+
+
+def parse_importtime(stderr):
+    """Righe di `python -X importtime` come (modulo, tempo proprio, tempo cumulativo) in secondi"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return rows
+
+
+def profile_imports():
+    """Importa src.api con -X importtime e ritorna tempi, memoria e profilo per modulo"""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', _IMPORT_SCRIPT],
+                         capture_output=True, text=True, check=True, env=_env())
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result['modules'] = parse_importtime(out.stderr)
+    return result
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _rss_mb(pid):
+    # Memoria residente da /proc (solo Linux)
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def time_to_healthy(timeout=30.0):
+    """Avvia il server come in produzione e misura il tempo fino alla prima risposta 200 di /health"""
+    port = _free_port()
+    url = f'http://127.0.0.1:{port}/health'
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-m', 'src.api'], env=dict(_env(), PORT=str(port)),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"Il server è terminato con codice {server.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start, _rss_mb(server.pid)
+            except (urllib.error.URLError, ConnectionError):
+                pass
+            time.sleep(0.02)
+        raise TimeoutError(f"/health non ha risposto 200 entro {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def write_report(imports, seconds, rss_mb, path=REPORT_PATH, top=25):
+    """Salva il profilo degli import (moduli più lenti per tempo cumulativo) e le misure di avvio"""
+    lines = [
+        f"Import di src.api: {imports['seconds']:.3f}s, RSS massimo {imports['max_rss_mb']:.1f} MB",
+        f"Moduli pesanti importati: {', '.join(imports['heavy']) or 'nessuno'}",
+        f"Tempo fino a /health 200: {seconds:.3f}s" + (f", RSS {rss_mb:.1f} MB" if rss_mb is not None else ""),
+        "",
+        f"{'cumulativo (s)':>14} {'proprio (s)':>11}  modulo",
+    ]
+    for name, self_s, cumulative_s in sorted(imports['modules'], key=lambda row: -row[2])[:top]:
+        lines.append(f"{cumulative_s:>14.4f} {self_s:>11.4f}  {name}")
+    path = Path(path)
+    path.parent.mkdir(exist_ok=True, parents=True)
+    path.write_text('\n'.join(lines) + '\n')
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profilo degli import e controllo dei tempi di avvio dell'API")
+    parser.add_argument('--max-seconds', type=float, default=MAX_SECONDS_TO_HEALTHY,
+                        help="Tempo massimo fino alla prima risposta 200 di /health")
+    parser.add_argument('--max-rss-mb', type=float, default=MAX_IMPORT_RSS_MB,
+                        help="Memoria massima (MB) dopo l'import di src.api")
+    parser.add_argument('--report', default=str(REPORT_PATH), help="File del profilo degli import")
+    args = parser.parse_args()
+
+    imports = profile_imports()
+    seconds, rss_mb = time_to_healthy()
+    for line in write_report(imports, seconds, rss_mb, args.report):
+        print(line)
+    print(f"\nProfilo salvato in: {args.report}")
+
+    failures = []
+    if seconds > args.max_seconds:
+        failures.append(f"tempo fino a /health {seconds:.3f}s oltre il budget di {args.max_seconds}s")
+    if imports['max_rss_mb'] > args.max_rss_mb:
+        failures.append(f"RSS dopo l'import {imports['max_rss_mb']:.1f} MB oltre il budget di {args.max_rss_mb} MB")
+    if failures:
+        print("\nBudget di avvio superato: " + "; ".join(failures))
+        sys.exit(1)
+    print("\nBudget di avvio rispettato")
+
+
+if __name__ == "__main__":
+    main()